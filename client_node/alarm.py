@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import shutil
+import threading
+import subprocess
+import collections
+from threat_rules import RULES
+from metrics import REGISTRY
+
+TIME_TO_ALARM = REGISTRY.histogram("client_time_to_alarm_seconds",
+                                   "Frame capture to alarm sound, by what raised it.", ("source",))
+ALARMS = REGISTRY.counter("client_alarms_total", "Alarms raised, by what raised them.", ("source",))
+
+# players that can loop a file by themselves come first; afplay is restarted when it ends
+PLAYERS = [
+    ("ffplay", ["-nodisp", "-loglevel", "quiet", "-loop", "0"]),
+    ("mpg123", ["-q", "--loop", "-1"]),
+    ("afplay", []),
+    ("paplay", []),
+]
+
+
+def local_threat(dets):
+    """The server's threat rule (a weapon held while a person is in view), on this frame's detections."""
+    return RULES.threat(dets)
+
+
+class Player:
+    """One player process at a time, started when the alarm goes on and killed when it goes off."""
+    def __init__(self, sound, mute=False):
+        self.mute = mute
+        self.cmd = None
+        if sound and os.path.exists(sound):
+            for name, args in PLAYERS:
+                exe = shutil.which(name)
+                if exe:
+                    self.cmd = [exe] + args + [sound]
+                    break
+        self.proc = None
+        self.on = False
+        self.starts = 0
+
+    def play(self):
+        # called over and over while the alarm is on: only (re)starts a player that isn't running
+        if self.mute or (self.on and (self.cmd is None or self.proc.poll() is None)):
+            return
+        self.on = True
+        self.starts += 1
+        if self.cmd is None: # no player (or no sound file): one terminal bell per alarm
+            sys.stdout.write("\a")
+            sys.stdout.flush()
+            return
+        try:
+            self.proc = subprocess.Popen(self.cmd, stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Alarm player failed: {e}")
+            self.cmd = None
+
+    def stop(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+        self.on = False
+
+
+class AlarmManager(threading.Thread):
+    """
+    Owns the alarm sound. The capture side only calls observe() / server_verdict(),
+    which update state under a lock and return; the sound is started and stopped on
+    this thread.
+      local   a weapon and a person in min_frames detected frames in a row raise the alarm
+              right away, it stays on local_hold_sec after the last such frame
+      server  a threat_flag in a server reply confirms the alarm (or raises it if the
+              local rule missed it) for server_hold_sec; danger escalates it
+    Time to alarm is measured from the capture of the frame that raised it.
+    """
+    def __init__(self, sound="alarm.mp3", min_frames=2, local_hold_sec=5.0, server_hold_sec=30.0, mute=False):
+        super().__init__(name="alarm", daemon=True)
+        self.player = Player(sound, mute)
+        self.min_frames = min_frames
+        self.local_hold_sec = local_hold_sec
+        self.server_hold_sec = server_hold_sec
+        self.cond = threading.Condition()
+        self.stop_event = threading.Event()
+        self.cameras = {} # camera_id -> {"streak", "until", "level", "confirmed", "raised_by", "t_frame"}
+        self.sounding = False
+        self.time_to_alarm = collections.deque(maxlen=50)
+        self.counters = {"local": 0, "server": 0, "confirmed": 0, "escalated": 0}
+
+    def _cam(self, camera_id):
+        return self.cameras.setdefault(camera_id, {"streak": 0, "until": 0.0, "level": None, "confirmed": False,
+                                                   "raised_by": None, "t_frame": None})
+
+    def observe(self, camera_id, dets, t_frame, gated=False):
+        """Local rule on one frame; t_frame is the frame's time.perf_counter() at capture."""
+        threat = local_threat(dets)
+        with self.cond:
+            cam = self._cam(camera_id)
+            if not threat:
+                if not gated:
+                    cam["streak"] = 0
+                return False
+            if not gated: # a static frame re-uses old detections, it is no new evidence
+                cam["streak"] += 1
+            if cam["streak"] < self.min_frames:
+                return False
+            now = time.perf_counter()
+            if now >= cam["until"]:
+                self._raise(cam, "local", "threat", t_frame)
+            cam["until"] = max(cam["until"], now + self.local_hold_sec)
+            return True
+
+    def server_verdict(self, camera_id, data, t_frame=None):
+        """Called with every server reply; only turns the alarm on or up, never off."""
+        if not data.get("threat_flag"):
+            return
+        level = "danger" if data.get("danger") else "threat"
+        with self.cond:
+            cam = self._cam(camera_id)
+            now = time.perf_counter()
+            if now >= cam["until"]:
+                self._raise(cam, "server", level, t_frame)
+            else:
+                if not cam["confirmed"]:
+                    self.counters["confirmed"] += 1
+                if level == "danger" and cam["level"] != "danger":
+                    self.counters["escalated"] += 1
+            cam["confirmed"] = True
+            cam["level"] = "danger" if level == "danger" or cam["level"] == "danger" else level
+            cam["until"] = max(cam["until"], now + self.server_hold_sec)
+
+    def _raise(self, cam, source, level, t_frame):
+        # with cond held: a new alarm for this camera, the thread starts the sound
+        cam.update(level=level, confirmed=source == "server", raised_by=source, t_frame=t_frame)
+        self.counters[source] += 1
+        ALARMS.labels(source).inc()
+        print(f"ALARM!!! ({source})")
+        self.cond.notify()
+
+    def active(self, camera_id):
+        """None, or the alarm level ("threat" / "danger") for drawing."""
+        with self.cond:
+            cam = self.cameras.get(camera_id)
+            if cam is None or time.perf_counter() >= cam["until"]:
+                return None
+            return cam["level"]
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.cond:
+                now = time.perf_counter()
+                live = [cam for cam in self.cameras.values() if now < cam["until"]]
+                raised = []
+                for cam in live:
+                    if cam["t_frame"] is not None:
+                        raised.append((cam["raised_by"], cam["t_frame"]))
+                        cam["t_frame"] = None
+                wait = min((cam["until"] - now for cam in live), default=1.0)
+            if live:
+                self.player.play() # no-op while it is still playing, restarts players that don't loop
+                self.sounding = True
+            elif self.sounding:
+                self.player.stop()
+                self.sounding = False
+                print("Threat mode expired.")
+            for source, t_frame in raised:
+                latency = time.perf_counter() - t_frame
+                self.time_to_alarm.append(latency)
+                TIME_TO_ALARM.labels(source).observe(latency)
+            with self.cond:
+                if not self.stop_event.is_set() and not any(cam["t_frame"] is not None
+                                                            for cam in self.cameras.values()):
+                    self.cond.wait(min(max(wait, 0.01), 0.25))
+        self.player.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify()
+        self.join(timeout=2.0)
+
+    def stats(self):
+        with self.cond:
+            out = dict(self.counters)
+            samples = sorted(self.time_to_alarm)
+        out["player_starts"] = self.player.starts
+        out["player"] = "muted" if self.player.mute else os.path.basename(self.player.cmd[0]) if self.player.cmd else "bell"
+        if samples:
+            out["time_to_alarm_ms_p50"] = round(1000 * samples[len(samples) // 2], 1)
+            out["time_to_alarm_ms_max"] = round(1000 * samples[-1], 1)
+        return out
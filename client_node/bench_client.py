@@ -0,0 +1,161 @@
+# Offline end-to-end benchmark: every frame of a recording or an image folder, as fast as possible,
+# through the same YOLO and face recognition code the live client runs.
+# python3 bench_client.py recordings/clip_20250101_120000.mp4     (sidecar names are the reference)
+# python3 bench_client.py test_faces/                              (sub folder = person, "unknown" = stranger)
+# python3 bench_client.py test_faces/ --tracker                   (with the track identity cache, like main.py)
+# Results are saved to bench_results/ as JSON with the git commit, so runs can be compared.
+import os
+import json
+import time
+import argparse
+import datetime
+import subprocess
+
+import main
+from main import run_yolo
+from detector import make_detector, BACKENDS
+from recognition import classify_persons, bbox_to_xyxy
+from recorder import open_source, read_sidecar, ImageDirSource
+from tracker import IoUTracker
+
+
+def percentile(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * q))]
+
+
+def summarize(vals):
+    if not vals:
+        return {"calls": 0}
+    vals = sorted(vals)
+    return {"calls": len(vals), "mean_ms": round(1000 * sum(vals) / len(vals), 3),
+            "p50_ms": round(1000 * percentile(vals, 0.5), 3), "p99_ms": round(1000 * percentile(vals, 0.99), 3)}
+
+
+def names_of(person_info):
+    # who is in the frame: friend names, plus "unknown" if any stranger is there
+    names = {p["name"].lower() for p in person_info if p.get("name")}
+    if any(not p.get("name") for p in person_info):
+        names.add("unknown")
+    return names
+
+
+def expected_names(cap, root, sidecar, index):
+    if isinstance(cap, ImageDirSource):
+        rel = os.path.relpath(cap.current, root)
+        folder = rel.split(os.sep)[0] if os.sep in rel else None
+        return {folder.lower()} if folder else None
+    if sidecar is not None and index < len(sidecar):
+        return names_of(sidecar[index]["person_info"])
+    return None
+
+
+class Accuracy:
+    def __init__(self):
+        self.frames = 0
+        self.exact = 0
+        self.tp = self.fp = self.fn = 0
+
+    def add(self, expected, got):
+        self.frames += 1
+        self.exact += expected == got
+        self.tp += len(expected & got)
+        self.fp += len(got - expected)
+        self.fn += len(expected - got)
+
+    def report(self):
+        if not self.frames:
+            return None
+        p = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        r = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return {"labelled_frames": self.frames, "frame_accuracy": round(self.exact / self.frames, 4),
+                "precision": round(p, 4), "recall": round(r, 4)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("source", help="video file (with optional .jsonl sidecar) or image directory")
+    ap.add_argument("--tracker", action="store_true", help="only re-check faces when a track is due, like main.py")
+    ap.add_argument("--max-frames", type=int, default=0)
+    ap.add_argument("--backend", choices=sorted(BACKENDS), default="ultralytics")
+    ap.add_argument("--model")
+    ap.add_argument("--imgsz", type=int)
+    ap.add_argument("--out", default="bench_results")
+    args = ap.parse_args()
+
+    main.detector = make_detector(args.backend, args.model, args.imgsz)
+    cap = open_source(args.source)
+    if not cap.isOpened():
+        raise SystemExit(f"cannot open {args.source}")
+    sidecar = None if isinstance(cap, ImageDirSource) else read_sidecar(args.source)
+    tracker = IoUTracker() if args.tracker else None
+    times = {"read": [], "yolo": [], "recognize": [], "total": []}
+    acc = Accuracy()
+    index = 0
+    start = time.perf_counter()
+    while not args.max_frames or index < args.max_frames:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t1 = time.perf_counter()
+        dets = run_yolo(frame)
+        t2 = time.perf_counter()
+        person_dets = [d for d in dets if d["class_name"] == "person"]
+        if tracker is not None:
+            tracks = tracker.update([bbox_to_xyxy(d["bbox"]) for d in person_dets])
+            stale = [i for i, t in enumerate(tracks) if tracker.needs_verify(t)]
+            if stale:
+                infos, embeddings = classify_persons(frame, [person_dets[i]["bbox"] for i in stale],
+                                                     with_embeddings=True)
+                for i, info, emb in zip(stale, infos, embeddings):
+                    tracker.set_identity(tracks[i], info, emb)
+            person_info = [t.info() for t in tracks]
+        else:
+            person_info = classify_persons(frame, [d["bbox"] for d in person_dets]) if person_dets else []
+        t3 = time.perf_counter()
+        times["read"].append(t1 - t0)
+        times["yolo"].append(t2 - t1)
+        if person_dets:
+            times["recognize"].append(t3 - t2)
+        times["total"].append(t3 - t0)
+        expected = expected_names(cap, args.source, sidecar, index)
+        if expected is not None:
+            acc.add(expected, names_of(person_info))
+        index += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+
+    result = {
+        "commit": git_commit(),
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "source": args.source,
+        "tracker": args.tracker,
+        "detector": {"backend": args.backend, "model": args.model, "imgsz": args.imgsz},
+        "frames": index,
+        "fps": round(index / elapsed, 2) if elapsed else 0.0,
+        "stages": {name: summarize(v) for name, v in times.items()},
+        "accuracy": acc.report(),
+    }
+    if tracker is not None:
+        result["face_checks"] = tracker.stats["verified"]
+        result["person_frames"] = tracker.stats["person_frames"]
+
+    print(f"{index} frames in {elapsed:.1f}s ({result['fps']} fps)")
+    for name, s in result["stages"].items():
+        if s["calls"]:
+            print(f"  {name:<10} calls={s['calls']:>6} mean={s['mean_ms']:>8.2f} ms  p99={s['p99_ms']:>8.2f} ms")
+    if result["accuracy"]:
+        print(f"accuracy: {result['accuracy']}")
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"client_{result['commit'] or 'nogit'}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {path}")
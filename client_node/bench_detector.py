@@ -0,0 +1,154 @@
+# Latency and accuracy drift of the detector backends on recorded frames.
+# The first backend is the reference: the others are scored (mAP@0.5) against its detections.
+# python3 bench_detector.py recordings/clip.mp4 \
+#     ultralytics:yolov8n.pt ultralytics:yolov8n.pt@416 onnx:yolov8n.onnx onnx:yolov8n_int8.onnx \
+#     openvino:yolov8n_openvino_model
+import os
+import json
+import time
+import argparse
+import datetime
+import subprocess
+import numpy as np
+
+from detector import make_detector, DETECT_CLASSES
+from recorder import open_source
+
+
+def parse_spec(spec):
+    """backend:model[@imgsz]"""
+    backend, _, rest = spec.partition(":")
+    model, _, size = rest.partition("@")
+    return backend, model or None, int(size) if size else None
+
+
+def xyxy(d):
+    b = d["bbox"]
+    return (b["x_center"] - b["width"] / 2, b["y_center"] - b["height"] / 2,
+            b["x_center"] + b["width"] / 2, b["y_center"] + b["height"] / 2)
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def average_precision(ref, pred, cls, thresh=0.5):
+    # greedy matching by confidence, then the area under the interpolated precision/recall curve
+    gts = {i: [xyxy(d) for d in frame if d["class_name"] == cls] for i, frame in enumerate(ref)}
+    n_gt = sum(len(v) for v in gts.values())
+    if n_gt == 0:
+        return None
+    used = {i: [False] * len(v) for i, v in gts.items()}
+    cands = sorted(((d["confidence"], i, xyxy(d)) for i, frame in enumerate(pred)
+                    for d in frame if d["class_name"] == cls), key=lambda c: -c[0])
+    tp = np.zeros(len(cands))
+    for k, (_, i, box) in enumerate(cands):
+        best, best_j = thresh, -1
+        for j, gt in enumerate(gts[i]):
+            overlap = iou(box, gt)
+            if not used[i][j] and overlap >= best:
+                best, best_j = overlap, j
+        if best_j >= 0:
+            used[i][best_j] = True
+            tp[k] = 1
+    if not len(cands):
+        return 0.0
+    cum_tp = np.cumsum(tp)
+    recall = cum_tp / n_gt
+    precision = cum_tp / np.arange(1, len(cands) + 1)
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall, points, side="left")
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+
+
+def mean_ap(ref, pred):
+    classes = sorted({d["class_name"] for frame in ref for d in frame})
+    per_class = {c: average_precision(ref, pred, c) for c in classes}
+    per_class = {c: round(v, 4) for c, v in per_class.items() if v is not None}
+    return (round(sum(per_class.values()) / len(per_class), 4) if per_class else None), per_class
+
+
+def percentile(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * q))]
+
+
+def load_frames(src, limit, step):
+    cap = open_source(src)
+    frames, i = [], 0
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if i % step == 0:
+            frames.append(frame)
+        i += 1
+    cap.release()
+    return frames
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("source", help="video file or image directory")
+    ap.add_argument("backends", nargs="+", help="backend:model[@imgsz], the first one is the reference")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--step", type=int, default=1, help="use every n-th frame")
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--batch", type=int, default=1, help="frames per detect call, like N cameras in one client")
+    ap.add_argument("--all-classes", action="store_true")
+    ap.add_argument("--out", default="bench_results")
+    args = ap.parse_args()
+
+    frames = load_frames(args.source, args.frames, args.step) # in memory, decoding is not timed
+    if not frames:
+        raise SystemExit(f"no frames in {args.source}")
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    classes = None if args.all_classes else DETECT_CLASSES
+
+    runs, ref = [], None
+    print(f"{'backend':<44} {'load s':>7} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'fps':>7} {'mAP50':>7}")
+    for spec in args.backends:
+        backend, model, imgsz = parse_spec(spec)
+        t0 = time.perf_counter()
+        det = make_detector(backend, model, imgsz, classes)
+        load_sec = time.perf_counter() - t0
+        for frame in frames[:args.warmup]:
+            det.detect(frame)
+        out, lat = [], []
+        for i in range(0, len(frames), args.batch):
+            chunk = frames[i:i + args.batch]
+            t0 = time.perf_counter()
+            out.extend(det.detect_batch(chunk))
+            lat.extend([(time.perf_counter() - t0) / len(chunk)] * len(chunk)) # per frame
+        if ref is None:
+            ref = out
+        m, per_class = mean_ap(ref, out)
+        lat.sort()
+        r = {"spec": spec, "backend": backend, "model": model, "imgsz": imgsz, "load_sec": round(load_sec, 2),
+             "mean_ms": round(1000 * sum(lat) / len(lat), 2), "p50_ms": round(1000 * percentile(lat, 0.5), 2),
+             "p99_ms": round(1000 * percentile(lat, 0.99), 2), "fps": round(len(lat) / sum(lat), 1),
+             "map50_vs_reference": m, "ap50_per_class": per_class,
+             "detections": sum(len(f) for f in out)}
+        runs.append(r)
+        print(f"{spec:<44} {r['load_sec']:>7.2f} {r['mean_ms']:>8.2f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['fps']:>7.1f} {m if m is not None else '-':>7}")
+
+    result = {"commit": git_commit(), "time": datetime.datetime.now().isoformat(timespec="seconds"),
+              "source": args.source, "frames": len(frames), "batch": args.batch, "reference": args.backends[0], "runs": runs}
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"detector_{result['commit'] or 'nogit'}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {path}")
@@ -0,0 +1,57 @@
+# Recall / latency benchmark of the approximate (IVF) gallery search against brute force
+# python3 bench_gallery.py --identities 5000 --per-identity 3
+import argparse
+import time
+import numpy as np
+from gallery import GalleryIndex
+
+
+def synthetic_gallery(n_ids, per_id, dim, rng):
+    # identities are random directions, their photos are small perturbations of it
+    centers = rng.normal(size=(n_ids, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    index = GalleryIndex(dim=dim)
+    for i, c in enumerate(centers):
+        index.add(f"person_{i}", c + 0.05 * rng.normal(size=(per_id, dim)))
+    return index.build(), centers
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--identities", type=int, default=5000)
+    ap.add_argument("--per-identity", type=int, default=3)
+    ap.add_argument("--queries", type=int, default=256)
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    index, centers = synthetic_gallery(args.identities, args.per_identity, args.dim, rng)
+    truth = rng.integers(0, args.identities, size=args.queries)
+    queries = centers[truth] + 0.05 * rng.normal(size=(args.queries, args.dim))
+
+    (exact_d, exact_i), exact_t = timed(lambda: index.search(queries, k=args.k, exact=True), args.repeat)
+    print(f"gallery: {args.identities} identities x {args.per_identity} photos, {args.queries} queries")
+    print(f"brute force     : {1000 * exact_t:8.2f} ms/batch {1e6 * exact_t / args.queries:8.1f} us/query "
+          f"top1 acc={np.mean(exact_i[:, 0] == truth):.3f}")
+
+    index.build_ivf()
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        if nprobe > index.ivf["n_lists"]:
+            break
+        index.ivf["nprobe"] = nprobe
+        (d, i), t = timed(lambda: index.search(queries, k=args.k), args.repeat)
+        recall1 = np.mean(i[:, 0] == exact_i[:, 0])
+        recallk = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(i, exact_i)])
+        print(f"ivf nprobe={nprobe:<3d}: {1000 * t:8.2f} ms/batch {1e6 * t / args.queries:8.1f} us/query "
+              f"recall@1={recall1:.3f} recall@{args.k}={recallk:.3f}")
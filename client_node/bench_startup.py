@@ -0,0 +1,133 @@
+# Startup benchmark: how long until the client can handle its first person, and how slow that first frame is.
+# python3 bench_startup.py                              (ultralytics yolov8n, 3 fresh processes per mode)
+# python3 bench_startup.py --backend onnx --model yolov8n_int8.onnx --runs 5
+# Every run is a fresh Python process (cold: imports, model files, first calls). Inside it the same
+# startup is done a second time (warm: modules imported, weights in the OS file cache) to show what
+# is left once the process is up. The OS file cache itself is not dropped, so the first run of
+# each mode after a reboot is slower than the rest.
+# Results are saved to bench_results/ as JSON with the git commit, like the other benchmarks.
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import subprocess
+
+MODES = {
+    "parallel": {"parallel": True, "warm_up": True},
+    "serial": {"parallel": False, "warm_up": True},
+    "parallel_no_warmup": {"parallel": True, "warm_up": False},
+}
+
+
+def frame_work(detector, frame, scale=0.20):
+    # what one frame with one face costs: YOLO, face detection, one encoding, the gallery match
+    import recognition
+    fr = recognition.load_face_models()
+    detector.detect_batch([frame])
+    small = frame[::int(1 / scale), ::int(1 / scale)].copy()
+    fr.face_locations(small)
+    side = small.shape[0] // 2
+    enc = fr.face_encodings(small, [(side // 2, side + side // 2, side + side // 2, side // 2)], model="small")
+    recognition.gallery.match(enc, recognition.list_thresh)
+
+
+def child(args, mode):
+    t_start = time.perf_counter()
+    import numpy as np
+    from detector import make_detector
+    from startup import Startup
+    imports = time.perf_counter() - t_start
+    out = {"imports_s": round(imports, 4)}
+    load = lambda: make_detector(args.backend, args.model, args.imgsz)
+    for phase in ("cold", "warm"):
+        s = Startup(load, **MODES[mode]).start()
+        if not s.wait():
+            return {"error": s.errors}
+        out[phase] = dict(s.timings)
+    # the first real frame after startup, then the steady state
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(6)]
+    t = time.perf_counter()
+    frame_work(s.detector, frames[0])
+    out["first_frame_s"] = round(time.perf_counter() - t, 4)
+    steady = []
+    for frame in frames[1:]:
+        t = time.perf_counter()
+        frame_work(s.detector, frame)
+        steady.append(time.perf_counter() - t)
+    out["steady_frame_s"] = round(sorted(steady)[len(steady) // 2], 4)
+    # to the first handled frame from process start: imports + startup + that frame
+    out["time_to_first_frame_s"] = round(imports + out["cold"]["total"] + out["first_frame_s"], 4)
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def median(vals):
+    vals = sorted(vals)
+    return vals[len(vals) // 2] if vals else None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", default="ultralytics")
+    ap.add_argument("--model")
+    ap.add_argument("--imgsz", type=int)
+    ap.add_argument("--modes", nargs="+", choices=sorted(MODES), default=list(MODES))
+    ap.add_argument("--runs", type=int, default=3, help="fresh processes per mode")
+    ap.add_argument("--out", default="bench_results")
+    ap.add_argument("--child", choices=sorted(MODES), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args, args.child)))
+        raise SystemExit(0)
+
+    result = {"commit": git_commit(), "time": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "args": vars(args), "modes": {}}
+    passthrough = ["--backend", args.backend] + (["--model", args.model] if args.model else []) + \
+                  (["--imgsz", str(args.imgsz)] if args.imgsz else [])
+    print(f"{'mode':<20} {'imports':>8} {'cold':>8} {'warm':>8} {'1st frame':>10} {'steady':>8} {'to 1st':>8}  (s, median)")
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.runs):
+            proc = subprocess.run([sys.executable, __file__, "--child", mode] + passthrough,
+                                  capture_output=True, text=True)
+            try:
+                runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            except (ValueError, IndexError):
+                raise SystemExit(f"{mode} run failed:\n{proc.stderr[-2000:]}")
+            if "error" in runs[-1]:
+                raise SystemExit(f"{mode} run failed: {runs[-1]['error']}")
+        steps = sorted({k for r in runs for k in r["cold"]})
+        summary = {
+            "imports_s": median([r["imports_s"] for r in runs]),
+            "cold": {k: median([r["cold"].get(k, 0.0) for r in runs]) for k in steps},
+            "warm": {k: median([r["warm"].get(k, 0.0) for r in runs]) for k in steps},
+            "first_frame_s": median([r["first_frame_s"] for r in runs]),
+            "steady_frame_s": median([r["steady_frame_s"] for r in runs]),
+            "time_to_first_frame_s": median([r["time_to_first_frame_s"] for r in runs]),
+        }
+        result["modes"][mode] = {"summary": summary, "runs": runs}
+        print(f"{mode:<20} {summary['imports_s']:>8.2f} {summary['cold']['total']:>8.2f} "
+              f"{summary['warm']['total']:>8.2f} {summary['first_frame_s']:>10.3f} "
+              f"{summary['steady_frame_s']:>8.3f} {summary['time_to_first_frame_s']:>8.2f}")
+
+    for mode, r in result["modes"].items():
+        print(f"\n{mode} per step (cold / warm, s):")
+        for step, v in r["summary"]["cold"].items():
+            print(f"  {step:<18} {v:>8.3f} / {r['summary']['warm'][step]:.3f}")
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"startup_{result['commit'] or 'nogit'}_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nsaved {path}")
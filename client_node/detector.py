@@ -0,0 +1,222 @@
+# Object detector backends. All of them return the same detection dicts the server expects.
+#   ultralytics  yolov8n.pt through PyTorch (the original path)
+#   onnx         an exported .onnx model on ONNX Runtime, no PyTorch needed at run time
+#   openvino     an exported *_openvino_model/ directory on the OpenVINO CPU runtime
+# Export once (needs ultralytics), e.g. for a smaller input and 8-bit weights:
+#   python3 detector.py --export onnx --imgsz 416 --int8
+import os
+import ast
+import argparse
+import numpy as np
+import cv2
+from vocab import canonical_class
+
+# what the server looks at: people, weapons and things a delivery leaves behind.
+# Names the model does not know are ignored. These are the model's names; a detection
+# carries the rules' name (vocab.CLASS_ALIASES, "baseball bat" -> "bat").
+DETECT_CLASSES = [
+    "person",
+    "backpack", "handbag", "suitcase", "box", "package",
+    "knife", "scissors", "baseball bat", "axe", "gun", "pistol", "rifle",
+    "bat", "hammer", "crowbar", "wrench", "screwdriver",
+]
+
+
+def to_detection(name, cls_id, conf, x_c, y_c, w, h):
+    return {
+        "class_name": canonical_class(name),
+        "class_id": cls_id,
+        "confidence": conf,
+        "bbox": {
+            "x_center": x_c,
+            "y_center": y_c,
+            "width": w,
+            "height": h
+        }
+    }
+
+
+def class_ids_for(names, wanted):
+    """names: {id: name} of the model. None keeps every class."""
+    if wanted is None:
+        return None
+    wanted = {w.lower() for w in wanted}
+    return sorted(i for i, n in names.items() if n.lower() in wanted)
+
+
+class UltralyticsDetector:
+    def __init__(self, model="yolov8n.pt", imgsz=640, classes=DETECT_CLASSES, conf=0.25):
+        from ultralytics import YOLO # imports PyTorch, only when this backend is used
+        self.model = YOLO(model)
+        self.names = self.model.names
+        self.imgsz = imgsz
+        self.conf = conf
+        self.class_ids = class_ids_for(self.names, classes)
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        results = self.model(frames, imgsz=self.imgsz, conf=self.conf, classes=self.class_ids, verbose=False)
+        out = []
+        for result in results:
+            detections = []
+            for box in result.boxes:
+                x_c, y_c, w, h = box.xywh[0].tolist()
+                cls_id = int(box.cls[0])
+                detections.append(to_detection(result.names[cls_id], cls_id, float(box.conf[0]), x_c, y_c, w, h))
+            out.append(detections)
+        return out
+
+
+class RawYoloDetector:
+    """
+    Pre/post-processing for an exported YOLOv8 graph (input 1x3xSxS RGB 0..1,
+    output 1x(4+classes)xN with boxes as centre/size in input pixels).
+    Subclasses only provide _infer(blob); batch_ok says whether it takes more than one image.
+    """
+    batch_ok = False
+
+    def __init__(self, names, imgsz, classes, conf, iou):
+        self.names = names
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        ids = class_ids_for(names, classes)
+        self.class_ids = None if ids is None else np.array(ids, dtype=np.int64)
+
+    def letterbox(self, frame):
+        h, w = frame.shape[:2]
+        r = min(self.imgsz / h, self.imgsz / w)
+        nh, nw = round(h * r), round(w * r)
+        top, left = (self.imgsz - nh) // 2, (self.imgsz - nw) // 2
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        blob = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return np.ascontiguousarray(blob), r, left, top
+
+    def detect(self, frame):
+        blob, r, left, top = self.letterbox(frame)
+        return self._decode(self._infer(blob)[0], r, left, top)
+
+    def detect_batch(self, frames):
+        boxes = [self.letterbox(f) for f in frames]
+        if self.batch_ok and len(frames) > 1:
+            preds = self._infer(np.concatenate([b[0] for b in boxes]))
+        else:
+            preds = [self._infer(b[0])[0] for b in boxes]
+        return [self._decode(pred, r, left, top) for pred, (_, r, left, top) in zip(preds, boxes)]
+
+    def _decode(self, pred, r, left, top):
+        pred = pred.T # N x (4 + classes)
+        scores = pred[:, 4:]
+        if self.class_ids is not None:
+            scores = scores[:, self.class_ids]
+        best = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), best]
+        keep = conf >= self.conf
+        if not keep.any():
+            return []
+        boxes, conf, best = pred[keep, :4], conf[keep], best[keep]
+        cls = self.class_ids[best] if self.class_ids is not None else best
+        # back to frame pixels
+        xc = (boxes[:, 0] - left) / r
+        yc = (boxes[:, 1] - top) / r
+        w = boxes[:, 2] / r
+        h = boxes[:, 3] / r
+        # class-aware NMS: shift every class far apart so boxes of different classes never overlap
+        offset = cls.astype(np.float32) * 8192.0
+        rects = np.stack([xc - w / 2 + offset, yc - h / 2, w, h], axis=1)
+        kept = cv2.dnn.NMSBoxes(rects.tolist(), conf.tolist(), self.conf, self.iou)
+        return [to_detection(self.names[int(cls[i])], int(cls[i]), float(conf[i]),
+                             float(xc[i]), float(yc[i]), float(w[i]), float(h[i]))
+                for i in np.array(kept).reshape(-1)]
+
+
+class OnnxDetector(RawYoloDetector):
+    def __init__(self, model="yolov8n.onnx", imgsz=None, classes=DETECT_CLASSES, conf=0.25, iou=0.45, threads=None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model, opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        meta = self.session.get_modelmeta().custom_metadata_map
+        names = ast.literal_eval(meta["names"]) # written by the ultralytics exporter
+        # exported with --dynamic: any batch size, the input size comes from the metadata
+        self.batch_ok = not isinstance(inp.shape[0], int)
+        fixed = inp.shape[2] if isinstance(inp.shape[2], int) else None
+        if fixed is None and "imgsz" in meta:
+            fixed = ast.literal_eval(meta["imgsz"])[0]
+        super().__init__(names, fixed or imgsz or 640, classes, conf, iou)
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoDetector(RawYoloDetector):
+    def __init__(self, model="yolov8n_openvino_model", imgsz=None, classes=DETECT_CLASSES, conf=0.25, iou=0.45):
+        import yaml
+        import openvino as ov
+        xml = model if model.endswith(".xml") else next(
+            os.path.join(model, f) for f in os.listdir(model) if f.endswith(".xml"))
+        with open(os.path.join(os.path.dirname(xml), "metadata.yaml")) as f:
+            meta = yaml.safe_load(f)
+        self.compiled = ov.Core().compile_model(xml, "CPU", {"PERFORMANCE_HINT": "LATENCY"})
+        self.output = self.compiled.output(0)
+        size = meta.get("imgsz")
+        super().__init__(meta["names"], size[0] if size else imgsz or 640, classes, conf, iou)
+
+    def _infer(self, blob):
+        return self.compiled(blob)[self.output]
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsDetector,
+    "onnx": OnnxDetector,
+    "openvino": OpenVinoDetector,
+}
+
+
+def make_detector(backend="ultralytics", model=None, imgsz=None, classes=DETECT_CLASSES, conf=0.25):
+    """classes=None keeps all of the model's classes."""
+    kwargs = {"classes": classes, "conf": conf}
+    if model:
+        kwargs["model"] = model
+    if imgsz:
+        kwargs["imgsz"] = imgsz
+    return BACKENDS[backend](**kwargs)
+
+
+def export_model(weights, fmt, imgsz, int8=False, dynamic=False):
+    """Returns the path of the exported model. dynamic=True lets the ONNX model take batches."""
+    from ultralytics import YOLO
+    if fmt == "openvino":
+        # INT8 for OpenVINO is post-training quantization with calibration images (needs nncf)
+        return YOLO(weights).export(format="openvino", imgsz=imgsz, int8=int8)
+    path = YOLO(weights).export(format="onnx", imgsz=imgsz, simplify=True, dynamic=dynamic)
+    if int8:
+        # weights only, activations stay float: no calibration data needed and accuracy barely moves
+        import onnx
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        q_path = path.replace(".onnx", "_int8.onnx")
+        quantize_dynamic(path, q_path, weight_type=QuantType.QUInt8)
+        # keep the class names / image size the exporter stored on the float model
+        src, dst = onnx.load(path), onnx.load(q_path)
+        del dst.metadata_props[:]
+        dst.metadata_props.extend(src.metadata_props)
+        onnx.save(dst, q_path)
+        path = q_path
+    return path
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--export", choices=["onnx", "openvino"], required=True)
+    ap.add_argument("--weights", default="yolov8n.pt")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--int8", action="store_true")
+    ap.add_argument("--dynamic", action="store_true", help="batch input (several cameras per call), ONNX only")
+    args = ap.parse_args()
+    print(f"Exported {export_model(args.weights, args.export, args.imgsz, args.int8, args.dynamic)}")
@@ -1,44 +1,124 @@
+# Incremental enrollment: python3 encode_faces.py [--workers N] [--rebuild]
+# Images/<Name>.jpg          -> one photo for <Name>
+# Images/<Name>/<any>.jpg    -> several photos for <Name>
+# Only new or changed images are encoded, everything goes into Data/gallery.npz
 import os
 import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import cv2
-import face_recognition
+from gallery import GalleryIndex
 
 img_path = "Images"
-data_path = "data"
-
-import_images = []
-names = []
-
-my_list = os.listdir(img_path)
-for name in my_list:
-    if os.path.splitext(name)[1] != ".jpg":
-        continue
-    curr = cv2.imread(f'{img_path}/{name}')
-    import_images.append(curr)
-    names.append(name[:name.rfind('.')])
-
-def compute_enconding(images):
-    encode_list = []
-    for im in images:
-        im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
-        detection = face_recognition.face_locations(im)
-        if detection:
-            encode_img = face_recognition.face_encodings(im)[0]
-            if len(encode_img)>0:
-                encode_list.append(encode_img)
-            else:
-                print ("Encoding failed.")
+data_path = "Data"
+gallery_path = os.path.join(data_path, "gallery.npz")
+manifest_path = os.path.join(data_path, "manifest.json")
+image_exts = (".jpg", ".jpeg", ".png")
+
+
+def list_images():
+    found = [] # (relative path, identity name)
+    for entry in sorted(os.listdir(img_path)):
+        full = os.path.join(img_path, entry)
+        if os.path.isdir(full):
+            for fn in sorted(os.listdir(full)):
+                if os.path.splitext(fn)[1].lower() in image_exts:
+                    found.append((f"{entry}/{fn}", entry))
+        elif os.path.splitext(entry)[1].lower() in image_exts:
+            found.append((entry, os.path.splitext(entry)[0]))
+    return found
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def compute_encoding(rel):
+    # runs in a worker process, so the heavy imports stay out of the parent
+    import cv2
+    import face_recognition
+    im = cv2.imread(os.path.join(img_path, rel))
+    if im is None:
+        return rel, None, "unreadable"
+    im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+    detection = face_recognition.face_locations(im)
+    if not detection:
+        return rel, None, "no face"
+    # enrollment photos should show one person, take the biggest face
+    largest = max(detection, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+    encs = face_recognition.face_encodings(im, [largest])
+    if not encs:
+        return rel, None, "encoding failed"
+    return rel, np.asarray(encs[0], dtype=np.float32), "ok"
+
+
+def load_previous(rebuild):
+    manifest, cached = {}, {}
+    if rebuild or not os.path.exists(manifest_path) or not os.path.exists(gallery_path):
+        return manifest, cached, 0
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    old = GalleryIndex.load(gallery_path)
+    for row, rel in enumerate(old.sources):
+        cached[rel] = old.vectors[row]
+    return manifest, cached, old.version
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--rebuild", action="store_true", help="ignore the manifest and encode everything")
+    args = ap.parse_args()
+
+    os.makedirs(data_path, exist_ok=True)
+    manifest, cached, version = load_previous(args.rebuild)
+    images = list_images()
+    new_manifest, todo = {}, []
+    for rel, name in images:
+        digest = file_hash(os.path.join(img_path, rel))
+        prev = manifest.get(rel)
+        if prev and prev["sha1"] == digest and (prev["status"] != "ok" or rel in cached):
+            new_manifest[rel] = dict(prev, name=name)
         else:
-            print("No face detected.")
-    
-    return encode_list
-
-my_encode_list = compute_enconding(import_images)
-print ("Encoding complete")
-
-#save as .npy and json
-encode_array = np.vstack(my_encode_list)
-np.save(os.path.join(data_path, "encodings.npy"), encode_array)
-with open(os.path.join(data_path, "names.json"), "w") as file:
-    json.dump(names, file)
+            new_manifest[rel] = {"sha1": digest, "name": name, "status": "pending"}
+            todo.append(rel)
+
+    removed = sorted(set(manifest) - set(new_manifest))
+    print(f"{len(images)} images: {len(images) - len(todo)} unchanged, {len(todo)} to encode, {len(removed)} removed")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for rel, enc, status in pool.map(compute_encoding, todo):
+                new_manifest[rel]["status"] = status
+                if enc is not None:
+                    cached[rel] = enc
+                else:
+                    print(f"{rel}: {status}, skipped")
+
+    if not todo and not removed and os.path.exists(gallery_path):
+        print("Gallery is up to date")
+        return
+
+    # rows grouped by identity (GalleryIndex order), raw vectors to match face_distance
+    index = GalleryIndex(normalize=False)
+    sources = []
+    ok = sorted((info["name"], rel) for rel, info in new_manifest.items() if info["status"] == "ok")
+    for name, rel in ok:
+        index.add(name, cached[rel])
+        sources.append(rel)
+    index.build()
+    index.save(gallery_path, version=version + 1, sources=sources)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(new_manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    print(f"Encoding complete: gallery v{version + 1}, {len(index)} identities, {len(sources)} photos")
+
+
+if __name__ == "__main__":
+    main()
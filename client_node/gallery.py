@@ -0,0 +1,186 @@
+import os
+import numpy as np
+
+
+class GalleryIndex:
+    """
+    Face gallery stored as one contiguous float32 matrix, grouped by identity.
+    search() matches a batch of query embeddings with a single matrix product and
+    returns the k best identities per query (an identity with several photos
+    scores with its closest photo).
+
+    normalize=True stores unit vectors (distance = chord distance on the sphere).
+    normalize=False keeps raw vectors so distances equal face_recognition.face_distance.
+    """
+    def __init__(self, dim=128, normalize=True):
+        self.dim = dim
+        self.normalize = normalize
+        self.names = []            # identity index -> name
+        self._pending = {}         # name -> list of vectors, until build()
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.sq_norms = np.zeros(0, dtype=np.float32)
+        self.labels = np.zeros(0, dtype=np.int32)   # row -> identity index
+        self.offsets = np.zeros(0, dtype=np.int64)  # first row of each identity
+        self.ivf = None
+        self.version = 0
+        self.sources = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, embeddings):
+        emb = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        self._pending.setdefault(name, []).extend(emb)
+
+    def build(self):
+        # merge what is already indexed with what was added since the last build
+        for i, name in enumerate(self.names):
+            start = self.offsets[i]
+            end = self.offsets[i + 1] if i + 1 < len(self.names) else len(self.vectors)
+            self._pending.setdefault(name, [])[:0] = list(self.vectors[start:end])
+        names = list(self._pending)
+        rows, labels, offsets = [], [], []
+        for i, name in enumerate(names):
+            vecs = self._pending[name]
+            offsets.append(len(rows))
+            rows.extend(vecs)
+            labels.extend([i] * len(vecs))
+        self._pending = {}
+        self.names = names
+        vectors = np.ascontiguousarray(np.array(rows, dtype=np.float32).reshape(-1, self.dim))
+        if self.normalize and len(vectors):
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.vectors = vectors
+        self.sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        self.labels = np.array(labels, dtype=np.int32)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        if self.ivf is not None:
+            self.build_ivf(self.ivf["n_lists"])
+        return self
+
+    def _prep(self, queries):
+        q = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        if self.normalize:
+            q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        return q
+
+    def _dist(self, q, rows=None):
+        vecs = self.vectors if rows is None else self.vectors[rows]
+        sq = self.sq_norms if rows is None else self.sq_norms[rows]
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, one matmul for the whole batch
+        d2 = np.einsum("ij,ij->i", q, q)[:, None] + sq[None, :] - 2.0 * (q @ vecs.T)
+        return np.sqrt(np.maximum(d2, 0.0))
+
+    def _topk(self, per_id, k):
+        k = min(k, per_id.shape[1])
+        if k < per_id.shape[1]:
+            idx = np.argpartition(per_id, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.tile(np.arange(per_id.shape[1]), (per_id.shape[0], 1))
+        d = np.take_along_axis(per_id, idx, axis=1)
+        order = np.argsort(d, axis=1)
+        return np.take_along_axis(d, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+    def search(self, queries, k=1, exact=None):
+        """
+        Returns (distances, identity ids), both shaped (n_queries, k), best first.
+        Uses the IVF index when one was built, unless exact=True.
+        """
+        q = self._prep(queries)
+        if len(self.vectors) == 0 or len(q) == 0:
+            return np.zeros((len(q), 0), np.float32), np.zeros((len(q), 0), np.int64)
+        if self.ivf is not None and not exact:
+            return self._search_ivf(q, k)
+        d = self._dist(q)
+        per_id = np.minimum.reduceat(d, self.offsets, axis=1) # best photo per identity
+        return self._topk(per_id, k)
+
+    def match(self, queries, thresh):
+        """Best identity per query: list of (name or None, distance or None)."""
+        dists, ids = self.search(queries, k=1)
+        out = []
+        for row_d, row_i in zip(dists, ids):
+            if len(row_d) == 0:
+                out.append((None, None))
+            elif row_d[0] < thresh:
+                out.append((self.names[row_i[0]], float(row_d[0])))
+            else:
+                out.append((None, float(row_d[0])))
+        return out
+
+    # ---- approximate mode: inverted file over k-means clusters ----
+    def build_ivf(self, n_lists=None, iters=10, seed=0):
+        n = len(self.vectors)
+        if n == 0:
+            self.ivf = None
+            return self
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(n, n_lists, replace=False)].copy()
+        for _ in range(iters):
+            assign = self._nearest_centroid(self.vectors, centroids)
+            for c in range(n_lists):
+                members = self.vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        assign = self._nearest_centroid(self.vectors, centroids)
+        lists = [np.flatnonzero(assign == c) for c in range(n_lists)]
+        self.ivf = {"n_lists": n_lists, "centroids": centroids, "lists": lists, "nprobe": max(1, n_lists // 8)}
+        return self
+
+    @staticmethod
+    def _nearest_centroid(vecs, centroids):
+        d2 = (np.einsum("ij,ij->i", centroids, centroids)[None, :] - 2.0 * (vecs @ centroids.T))
+        return np.argmin(d2, axis=1)
+
+    def _search_ivf(self, q, k):
+        ivf = self.ivf
+        c = ivf["centroids"]
+        cd = np.einsum("ij,ij->i", c, c)[None, :] - 2.0 * (q @ c.T)
+        nprobe = min(ivf["nprobe"], len(c))
+        probes = np.argpartition(cd, nprobe - 1, axis=1)[:, :nprobe]
+        k = min(k, len(self.names))
+        out_d = np.full((len(q), k), np.inf, dtype=np.float32)
+        out_i = np.full((len(q), k), -1, dtype=np.int64)
+        for qi in range(len(q)):
+            rows = np.concatenate([ivf["lists"][p] for p in probes[qi]])
+            if len(rows) == 0:
+                continue
+            d = self._dist(q[qi:qi + 1], rows)[0]
+            per_id = np.full(len(self.names), np.inf, dtype=np.float32)
+            np.minimum.at(per_id, self.labels[rows], d)
+            found = np.flatnonzero(np.isfinite(per_id))
+            order = found[np.argsort(per_id[found])[:k]]
+            out_d[qi, :len(order)] = per_id[order]
+            out_i[qi, :len(order)] = order
+        return out_d, out_i
+
+    # ---- persistence ----
+    def save(self, path, version=0, sources=None):
+        """
+        Atomic write (temp file + rename) so a reader never sees half a gallery.
+        sources optionally names the image each row came from, in row order.
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, vectors=self.vectors, labels=self.labels,
+                     names=np.array(self.names, dtype=object), normalize=self.normalize,
+                     version=version, sources=np.array(sources or [], dtype=object))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=True)
+        vectors = data["vectors"]
+        index = cls(dim=vectors.shape[1], normalize=bool(data["normalize"]))
+        labels = data["labels"]
+        names = list(data["names"])
+        # rows are stored grouped by identity, so split at every label change
+        for group in np.split(np.arange(len(labels)), np.flatnonzero(np.diff(labels)) + 1):
+            if len(group):
+                index.add(names[labels[group[0]]], vectors[group])
+        index.build()
+        index.version = int(data["version"]) if "version" in data else 0
+        index.sources = list(data["sources"]) if "sources" in data else []
+        return index
@@ -1,115 +1,408 @@
-from ultralytics import YOLO
 import cv2
+import argparse
 import datetime
-import requests
+import threading
 import time
-import base64
-from recognition import classify_person
+import requests
+from recognition import classify_persons_batch, bbox_to_xyxy
+from pipeline import Pipeline
+from uploader import Uploader
+from tracker import IoUTracker
+from motion import MotionGate, AdaptiveRate
+from recorder import Recorder, open_source
+from detector import make_detector, DETECT_CLASSES, BACKENDS
+from upload_policy import UploadPolicy, roi_crop
+from metrics import REGISTRY, process_gauges, serve as serve_metrics
+from alarm import AlarmManager
+from threat_rules import RULES
+from startup import Startup
 import os
 
-DANGER_STATE = { #for a danger alarm system
-    "active": False,
-    "expiration_time": 0
-}
-
 ROBERT_SERVER = "http://172.20.10.2:5001"
 
-model = YOLO("yolov8n.pt")
+detector = None #chosen in __main__, the default one is loaded on first use
+alarm = None #AlarmManager, started in __main__
+
+# hot-path timers, exposed with the pipeline gauges on --metrics-port
+DETECT_SECONDS = REGISTRY.histogram("client_detect_seconds", "YOLO call for one batch of frames.")
+DETECT_FRAMES = REGISTRY.counter("client_detected_frames_total", "Frames that went through YOLO.")
+RECOGNIZE_SECONDS = REGISTRY.histogram("client_recognize_seconds",
+                                       "Face location, encoding and gallery match for one batch.")
+JPEG_SECONDS = REGISTRY.histogram("client_jpeg_encode_seconds", "ROI crop and JPEG encoding of one upload.")
+
+def run_yolo_batch(frames):
+    global detector
+    if detector is None:
+        detector = make_detector()
+    with DETECT_SECONDS.time():
+        dets = detector.detect_batch(frames)
+    DETECT_FRAMES.inc(len(frames))
+    return dets
 
 def run_yolo(frame):
-    results = model(frame, verbose=False)
-    result = results[0] #for just one frame
-    detections = []
-    boxes = result.boxes
-    for box in boxes:
-        x_c, y_c, w, h = box.xywh[0].tolist()      
-        conf = float(box.conf[0])      
-        cls_id = int(box.cls[0])
-        cls_name = result.names[cls_id] 
-        detection = {
-                "class_name": cls_name,
-                "class_id": cls_id,
-                "confidence": conf,
-                "bbox": {
-                    "x_center": x_c,
-                    "y_center": y_c,
-                    "width": w,
-                    "height": h
-                }
-            }
-        detections.append(detection)
-    return detections
+    return run_yolo_batch([frame])[0]
+
+REPORT_EVERY_SEC = 5.0
+
+
+class Camera:
+    """Everything kept per source: capture, motion gate, tracker, upload policy, uploader and recorder."""
+    def __init__(self, camera_id, cap, pace_fps=None, uploader=None, recorder=None, replay=False):
+        self.camera_id = camera_id #None: the server's default camera
+        self.cap = cap
+        self.pace_fps = pace_fps
+        self.replay = replay #a file or image folder rather than a live camera
+        self.uploader = uploader
+        self.recorder = recorder
+        self.tracker = IoUTracker()
+        self.gate, self.rate = MotionGate(), AdaptiveRate()
+        self.policy = UploadPolicy()
+        self.last_dets = []
+        self.frames = None #this camera's queue into the detect stage
+        self.ended = False
+
+
+def make_capture(cam, cameras, pipe):
+    state = {"frame_id": 0, "next_at": time.perf_counter()}
+    def capture():
+        if cam.ended:
+            time.sleep(0.1)
+            return None
+        if cam.pace_fps: #replaying a file at --fps
+            delay = state["next_at"] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            state["next_at"] = max(state["next_at"], time.perf_counter()) + 1.0 / cam.pace_fps
+        ret, frame = cam.cap.read()
+        if not ret:
+            cam.ended = True
+            if all(c.ended for c in cameras):
+                pipe.input_ended.set()
+            return None
+        state["frame_id"] += 1
+        return {
+            "cam": cam,
+            "frame": frame,
+            "frame_id": state["frame_id"],
+            "t_capture": time.perf_counter(), #time-to-alarm is measured from here
+            "timestamp": datetime.datetime.now().isoformat(),
+        }
+    return capture
+
+
+def make_detect(cameras, ready):
+    def detect():
+        # newest frame of every camera that has one; items travel as a batch from here on
+        ready.clear()
+        batch = [item for item in (cam.frames.get(timeout=0) for cam in cameras) if item is not None]
+        if not batch:
+            ready.wait(0.1)
+            return None
+        # static frames reuse their camera's last detections, the rest go through YOLO in one call
+        run = [item for item in batch if item["cam"].rate.should_run(item["cam"].gate.changed(item["frame"]))]
+        if run:
+            for item, dets in zip(run, run_yolo_batch([item["frame"] for item in run])):
+                item["cam"].last_dets = dets
+        ran = {id(item) for item in run}
+        for item in batch:
+            cam = item["cam"]
+            item["gated"] = id(item) not in ran
+            item["dets"] = cam.last_dets
+            item["person_dets"] = [d for d in item["dets"] if d["class_name"] == "person"]
+            if not item["gated"]:
+                cam.rate.on_result(bool(item["person_dets"]))
+            if alarm is not None: #local threat rule, the alarm doesn't wait for the server
+                alarm.observe(cam.camera_id, item["dets"], item["t_capture"], item["gated"])
+        return batch
+    return detect
+
+
+def recognize(batch):
+    # tracks carry a cached identity, only tracks due for a re-check get encoded,
+    # and the faces of all cameras are matched against the gallery together
+    all_tracks, jobs, pending = [], [], []
+    for item in batch:
+        tracker = item["cam"].tracker
+        tracks = tracker.update([bbox_to_xyxy(d["bbox"]) for d in item["person_dets"]])
+        stale = [i for i, t in enumerate(tracks) if tracker.needs_verify(t)]
+        if stale:
+            jobs.append((item["frame"], [item["person_dets"][i]["bbox"] for i in stale]))
+            pending.append((tracker, [tracks[i] for i in stale]))
+        all_tracks.append(tracks)
+    if jobs:
+        with RECOGNIZE_SECONDS.time():
+            results = classify_persons_batch(jobs, with_embeddings=True)
+        for (tracker, stale_tracks), (infos, embeddings) in zip(pending, results):
+            for track, info, emb in zip(stale_tracks, infos, embeddings):
+                tracker.set_identity(track, info, emb)
+    for item, tracks in zip(batch, all_tracks):
+        item["person_info"] = [t.info() for t in tracks]
+        item["embeddings"] = [t.embedding for t in tracks]
+    return batch
+
+
+def make_on_reply(camera_id):
+    def on_reply(data, meta):
+        # the server confirms or escalates the local alarm (or raises it if the local rule missed)
+        if alarm is None:
+            return
+        age = (datetime.datetime.now() - datetime.datetime.fromisoformat(meta["timestamp"])).total_seconds()
+        alarm.server_verdict(camera_id, data, time.perf_counter() - age)
+    return on_reply
+
+
+def attach_embeddings(person_info, embeddings):
+    # unknown faces go along so the server can recognize a returning intruder (danger gallery)
+    return [dict(p, embedding=[round(float(x), 5) for x in emb])
+            if emb is not None and p["type"] != "friend" else p
+            for p, emb in zip(person_info, embeddings)]
+
+
+def upload(batch):
+    for item in batch:
+        cam = item["cam"]
+        if cam.uploader is None:
+            continue
+        # send on changes right away, otherwise small detections-only heartbeats (see UploadPolicy)
+        reason, with_image = cam.policy.decide(item)
+        if reason is None:
+            continue
+        frame_data = {
+            "timestamp": item["timestamp"],
+            "frame_id": item["frame_id"],
+            "detections": item["dets"],
+            "person_info": item["person_info"],
+            "reason": reason,
+        }
+        if cam.camera_id is not None:
+            frame_data["camera_id"] = cam.camera_id
+        jpeg = None
+        if with_image: #only the region around the people / weapon, sized by how urgent it is
+            frame_data["person_info"] = attach_embeddings(item["person_info"], item["embeddings"])
+            max_side, quality = cam.policy.image_tier(reason)
+            with JPEG_SECONDS.time():
+                crop, frame_data["roi"] = roi_crop(item["frame"], item["dets"], max_side)
+                _, buffer = cv2.imencode('.jpg', crop, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            jpeg = buffer.tobytes()
+        cam.uploader.submit(frame_data, jpeg) #sending frame_data over to RPi
+    return None
+
+
+def record(batch):
+    for item in batch:
+        if item["cam"].recorder is not None:
+            item["cam"].recorder.write(item)
+    return None
+
+
+def draw(item):
+    frame = item["frame"].copy() #the same frame is still being encoded / recorded by other stages
+    for d in item["dets"]:
+        bbox = d["bbox"]
+        x_c, y_c, w, h = bbox["x_center"], bbox["y_center"], bbox["width"], bbox["height"]
+        x1 = int(x_c - w / 2)
+        y1 = int(y_c - h / 2)
+        x2 = int(x_c + w / 2)
+        y2 = int(y_c + h / 2)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{d['class_name']} {d['confidence']:.2f}"
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_PLAIN, 3, (0, 255, 0), 2)
+    level = alarm.active(item["cam"].camera_id) if alarm is not None else None
+    if level and item["person_dets"]: #the sound is the alarm thread's job
+        text = "DANGER!" if level == "danger" else "THREAT DETECTED!"
+        cv2.putText(frame, text, (50, 100), cv2.FONT_HERSHEY_PLAIN, 3, (0, 0, 255), 4)
+    return frame
+
+
+def announce(state, cameras, startup=None):
+    # tells the server (see its /cameras) whether this client is starting, ready or gone;
+    # sent from a side thread so a dead server never holds up startup
+    body = {"state": state, "camera_ids": [cam.camera_id for cam in cameras], "sent_at": time.time()}
+    if startup is not None:
+        body["startup"] = dict(startup.timings)
+    def send():
+        try:
+            requests.post(f"{ROBERT_SERVER}/client_status", json=body, timeout=(0.5, 1.0))
+        except requests.RequestException as e:
+            print(f"Could not tell the server we are {state}: {e}")
+    t = threading.Thread(target=send, name="announce", daemon=True)
+    t.start()
+    return t
+
+
+def register_gauges(pipe, cameras):
+    # read at scrape time from the stats the pipeline / cameras keep anyway
+    REGISTRY.gauge("client_queue_depth", "Items waiting per pipeline queue.",
+                   lambda: {name: q.depth() for name, q in pipe.queues.items()}, ("queue",))
+    REGISTRY.gauge("client_queue_dropped", "Items dropped by full queues.",
+                   lambda: {name: q.dropped for name, q in pipe.queues.items()}, ("queue",))
+    stages = lambda: [(s.name, s.stats) for s in pipe.stages] + list(pipe.external.items())
+    REGISTRY.gauge("client_stage_fps", "Items per second per stage (last 2 s).",
+                   lambda: {name: stats.fps() for name, stats in stages()}, ("stage",))
+    REGISTRY.gauge("client_stage_avg_seconds", "Average busy time per item per stage.",
+                   lambda: {name: stats.avg_ms() / 1000.0 for name, stats in stages()}, ("stage",))
+    REGISTRY.gauge("client_stage_errors", "Items whose stage function raised.",
+                   lambda: {name: stats.errors for name, stats in stages()}, ("stage",))
+    cam_id = lambda cam: cam.camera_id or "default"
+    REGISTRY.gauge("client_tracks", "Live person tracks per camera.",
+                   lambda: {cam_id(cam): len(cam.tracker.tracks) for cam in cameras}, ("camera",))
+    REGISTRY.gauge("client_upload_decisions", "Upload policy decisions per camera and reason.",
+                   lambda: {(cam_id(cam), reason): n for cam in cameras for reason, n in cam.policy.counters.items()},
+                   ("camera", "reason"))
+    REGISTRY.gauge("client_uploader", "Uploader counters per camera (sent, bytes, spooled, spool_depth, ...).",
+                   lambda: {(cam_id(cam), k): v for cam in cameras if cam.uploader is not None
+                            for k, v in cam.uploader.stats().items()}, ("camera", "kind"))
+    process_gauges(REGISTRY, "client_")
+
 
 if __name__ == "__main__":
-    cap = cv2.VideoCapture(1) #starting camera
-    json_data = []
-    if not cap.isOpened():
-        print("No camera found.")
-    else:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", nargs="+", default=["1"],
+                    help="camera indexes, video files / stream URLs or image directories, one per camera")
+    ap.add_argument("--camera-id", nargs="+", help="ids sent to the server, one per source (default cam0, cam1, ...)")
+    ap.add_argument("--fps", type=float, default=None,
+                    help="pace file / image replays at this many frames per second "
+                         "(default: as fast as the pipeline runs, without dropping frames)")
+    ap.add_argument("--record", metavar="DIR", help="save clips (video + .jsonl sidecar) while people are around")
+    ap.add_argument("--record-all", action="store_true", help="record every frame, not only around people")
+    ap.add_argument("--no-upload", action="store_true")
+    ap.add_argument("--backend", choices=sorted(BACKENDS), default="ultralytics")
+    ap.add_argument("--model", help="weights / exported model (default: the backend's yolov8n)")
+    ap.add_argument("--imgsz", type=int, help="detector input size, smaller is faster (e.g. 416 or 320)")
+    ap.add_argument("--all-classes", action="store_true", help="report every class, not just the ones the server uses")
+    ap.add_argument("--alarm-sound", default="alarm.mp3")
+    ap.add_argument("--mute", action="store_true", help="show threats without sounding the alarm")
+    ap.add_argument("--metrics-port", type=int, default=9101,
+                    help="local /metrics (Prometheus) and /profile endpoint, 0 to turn it off")
+    ap.add_argument("--no-warmup", action="store_true", help="skip the warm-up pass on blank frames")
+    args = ap.parse_args()
+
+    multi = len(args.source) > 1
+    ids = args.camera_id or ([f"cam{i}" for i in range(len(args.source))] if multi else [None])
+    if len(ids) != len(args.source):
+        ap.error("--camera-id needs one id per --source")
+
+    # models load in the background while the cameras open (see startup.py)
+    startup = Startup(lambda: make_detector(args.backend, args.model, args.imgsz,
+                                            None if args.all_classes else DETECT_CLASSES),
+                      warm_up=not args.no_warmup, batch=len(args.source)).start()
+    if args.metrics_port:
+        try:
+            serve_metrics(args.metrics_port, tag="client")
+            print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        except OSError as e: # port taken (a second client?): run without the endpoint
+            print(f"Metrics endpoint off, port {args.metrics_port}: {e}")
+
+    cameras = []
+    for src, camera_id in zip(args.source, ids):
+        cap = open_source(src) #starting camera
+        if not cap.isOpened():
+            print(f"No camera found at {src}.")
+            continue
+        replay = not src.isdigit() and "://" not in src
+        pace_fps = args.fps if replay else None
+        # one uploader per camera: coalescing keeps the newest frame of each camera, not of all of them
+        uploader = None if args.no_upload else Uploader(
+            ROBERT_SERVER, on_response=make_on_reply(camera_id),
+            spool_dir=os.path.join("spool", camera_id) if camera_id else "spool", camera_id=camera_id)
+        recorder = None
+        if args.record:
+            # an unpaced replay records every frame: its clips keep the file's own rate;
+            # anywhere else the recorder measures the rate frames reach it
+            source_fps = cap.get(cv2.CAP_PROP_FPS)
+            recorder = Recorder(os.path.join(args.record, camera_id) if camera_id else args.record,
+                                fps=source_fps if replay and not pace_fps else None,
+                                default_fps=source_fps or 10.0, record_all=args.record_all)
+        cameras.append(Camera(camera_id, cap, pace_fps, uploader, recorder, replay))
+
+    if cameras and not args.no_upload:
+        announce("starting", cameras)
+        RULES.follow(ROBERT_SERVER) # the server's person / weapon thresholds, checked every minute
+    if cameras:
+        print("Loading models...")
+        if not startup.wait():
+            for step, error in startup.errors.items():
+                print(f"Startup failed ({step}): {error}")
+            raise SystemExit(1)
+        detector = startup.detector
+        print(f"Ready in {startup.timings['total']:.2f} s: {startup.timings}")
+        if not args.no_upload:
+            announce("ready", cameras, startup)
         print("Press ENTER to quit.")
-        frame_id=0
-        last_sent_time = 0
-        start_log = False
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_id += 1
-            current_time = datetime.datetime.now().isoformat()
-            dets = run_yolo(frame)
-            person_dets = [d for d in dets if d["class_name"] == "person"] 
-            if person_dets:
-                if start_log==False:
-                    start_log = True
-                person_bbox = person_dets[0]["bbox"] #get just first person
-                person_info = classify_person(frame, person_bbox)
-            else:
-                person_info = {"type": "unknown", "name": None, "distance": None}
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-            _, buffer = cv2.imencode('.jpg', frame, encode_param)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8') #GitHub CoPilot (Gemini 3 Pro model) was used to generate this
-
-            frame_data = {
-                "timestamp": current_time,
-                "frame_id": frame_id,
-                "detections": dets,
-                "person_info": person_info,
-                "image": jpg_as_text
-            }
-
-            if time.time() - last_sent_time > 1.5:
-                try:
-                    response = requests.post(f"{ROBERT_SERVER}/frame_result", json=frame_data, timeout=(0.05, 0.2)) #sending frame_data over to RPi
-                    data = response.json()
-                    if data.get("threat_flag", False):#turning on alarm system
-                        DANGER_STATE["active"] = True
-                        DANGER_STATE["expiration_time"] = time.time() + 30
-                    last_sent_time = time.time()
-                except Exception as e:
-                    print(f"Error sending: {e}")
-            if start_log:
-                json_data.append(frame_data)
-            for d in dets:
-                bbox = d["bbox"]
-                x_c, y_c, w, h = bbox["x_center"], bbox["y_center"], bbox["width"], bbox["height"]
-                x1 = int(x_c - w / 2)
-                y1 = int(y_c - h / 2)
-                x2 = int(x_c + w / 2)
-                y2 = int(y_c + h / 2)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                label = f"{d['class_name']} {d['confidence']:.2f}"
-                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_PLAIN, 3, (0, 255, 0), 2)
-            if DANGER_STATE["active"]:
-                if time.time() > DANGER_STATE["expiration_time"]: #turn off after 30s
-                    DANGER_STATE["active"] = False
-                    print("Threat mode expired.")
-                elif person_dets:
-                    cv2.putText(frame, "THREAT DETECTED!", (50, 100), cv2.FONT_HERSHEY_PLAIN, 3, (0, 0, 255), 4)
-                    os.system("afplay alarm.mp3 &") 
-                    print("ALARM!!!")
-
-            cv2.imshow("YOLO Detector", frame)    
+        # capture (one per camera) -> detect -> recognize -> (upload, record, display)
+        # detect takes the newest frame of every camera as one batch, every queue drops the oldest entry;
+        # unpaced replays wait for room instead, so a benchmark run sees every frame of the file
+        pipe = Pipeline()
+        ready = threading.Event()
+        lossless = any(cam.replay and not cam.pace_fps for cam in cameras)
+        for cam in cameras:
+            name = f"capture_{cam.camera_id}" if multi else "capture"
+            cam.frames = pipe.queue(name.replace("capture", "frames"), maxsize=1, ready=ready,
+                                    block=cam.replay and not cam.pace_fps)
+            pipe.add_stage(name, make_capture(cam, cameras, pipe), out_qs=[cam.frames])
+        recog_q = pipe.queue("recognize", block=lossless)
+        display_q = pipe.queue("display")
+        recog_out = [display_q]
+        if not args.no_upload:
+            upload_q = pipe.queue("upload")
+            recog_out.append(upload_q)
+        if args.record:
+            record_q = pipe.queue("record", maxsize=8, block=lossless) #a little slack, dropped frames leave gaps in the clip
+            recog_out.append(record_q)
+        # stages upstream first, Pipeline.finish() drains them in this order
+        pipe.add_stage("detect", make_detect(cameras, ready), out_qs=[recog_q])
+        pipe.add_stage("recognize", recognize, recog_q, recog_out)
+        if not args.no_upload:
+            pipe.add_stage("upload", upload, upload_q)
+        if args.record:
+            pipe.add_stage("record", record, record_q)
+        display_stats = pipe.stats_for("display") #display runs on the main thread (cv2 windows need it)
+        if args.metrics_port:
+            register_gauges(pipe, cameras)
+        alarm = AlarmManager(args.alarm_sound, mute=args.mute)
+        alarm.start()
+        for cam in cameras:
+            if cam.uploader is not None:
+                cam.uploader.start()
+        pipe.start()
+        last_report = time.time()
+        while not pipe.stop_event.is_set() and not pipe.input_ended.is_set():
+            batch = display_q.get(timeout=0.1)
+            if batch is not None:
+                t0 = time.perf_counter()
+                for item in batch:
+                    title = f"YOLO Detector {item['cam'].camera_id}" if multi else "YOLO Detector"
+                    cv2.imshow(title, draw(item))
+                display_stats.record(time.perf_counter() - t0)
+            if time.time() - last_report > REPORT_EVERY_SEC:
+                print(pipe.report())
+                print(f"alarm: {alarm.stats()}")
+                for cam in cameras:
+                    prefix = f"[{cam.camera_id}] " if multi else ""
+                    if cam.uploader is not None:
+                        print(f"{prefix}uploader: {cam.uploader.stats()}")
+                        print(f"{prefix}upload policy: {cam.policy.counters}")
+                    if cam.recorder is not None:
+                        print(f"{prefix}recorder: {cam.recorder.stats}")
+                    print(f"{prefix}gate: {cam.rate.report()}")
+                    print(f"{prefix}tracker: {len(cam.tracker.tracks)} tracks, {cam.tracker.stats['verified']} "
+                          f"face checks for {cam.tracker.stats['person_frames']} person-frames")
+                last_report = time.time()
             if (cv2.waitKey(1) & 0xFF == 13):
                 break
-        cap.release()
+        if pipe.input_ended.is_set():
+            pipe.finish() #end of the replay: the frames still queued get detected, uploaded and recorded too
+        else:
+            pipe.stop()
+        alarm.stop()
+        if not args.no_upload:
+            announce("stopped", cameras).join(timeout=2.0)
+        for cam in cameras:
+            if cam.uploader is not None:
+                cam.uploader.stop()
+            if cam.recorder is not None:
+                cam.recorder.close()
+            cam.cap.release()
         cv2.destroyAllWindows()
+    else:
+        print("No camera found.")
@@ -0,0 +1,85 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap change detector: grayscale, downscaled, blurred frame compared against a
+    running-average background. changed() is True when enough pixels moved.
+    """
+    def __init__(self, width=160, diff_thresh=25, min_changed=0.01, bg_alpha=0.05):
+        self.width = width
+        self.diff_thresh = diff_thresh
+        self.min_changed = min_changed # fraction of pixels that must change
+        self.bg_alpha = bg_alpha
+        self.background = None
+        self.last_fraction = 0.0
+
+    def changed(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+        if self.background is None:
+            self.background = gray
+            return True
+        diff = cv2.absdiff(gray, self.background)
+        self.last_fraction = float(np.count_nonzero(diff > self.diff_thresh)) / diff.size
+        cv2.accumulateWeighted(gray, self.background, self.bg_alpha)
+        return self.last_fraction >= self.min_changed
+
+
+class AdaptiveRate:
+    """
+    Decides whether a frame goes to the detector.
+    idle: only frames with motion, plus one frame every 1/idle_fps seconds as a safety check
+    active (a person was seen less than hold_sec ago): every frame, up to active_fps
+    """
+    def __init__(self, idle_fps=1.0, active_fps=None, hold_sec=5.0):
+        self.idle_interval = 1.0 / idle_fps
+        self.active_interval = 1.0 / active_fps if active_fps else 0.0
+        self.hold_sec = hold_sec
+        self.last_run = float("-inf")
+        self.last_person = float("-inf")
+        self.motion_start = None # first motion frame while idle, for the entry latency
+        self.stats = {"frames": 0, "skipped": 0, "motion": 0, "entries": 0, "entry_latency_ms": []}
+
+    def active(self, now):
+        return now - self.last_person < self.hold_sec
+
+    def should_run(self, motion, now=None):
+        now = time.time() if now is None else now
+        self.stats["frames"] += 1
+        if motion:
+            self.stats["motion"] += 1
+        if self.active(now):
+            run = now - self.last_run >= self.active_interval
+        else:
+            if motion and self.motion_start is None:
+                self.motion_start = now
+            run = motion or now - self.last_run >= self.idle_interval
+        if run:
+            self.last_run = now
+        else:
+            self.stats["skipped"] += 1
+        return run
+
+    def on_result(self, has_person, now=None):
+        now = time.time() if now is None else now
+        if has_person:
+            if not self.active(now):
+                self.stats["entries"] += 1
+                if self.motion_start is not None:
+                    self.stats["entry_latency_ms"].append(1000.0 * (now - self.motion_start))
+                    del self.stats["entry_latency_ms"][:-100]
+            self.last_person = now
+            self.motion_start = None
+        elif not self.active(now) and self.motion_start is not None and now - self.motion_start > self.hold_sec:
+            self.motion_start = None # motion that never turned into a person
+
+    def report(self):
+        s = self.stats
+        skipped = s["skipped"] / s["frames"] if s["frames"] else 0.0
+        lat = s["entry_latency_ms"]
+        lat_txt = f"{np.mean(lat):.0f} ms avg / {max(lat):.0f} ms max" if lat else "n/a"
+        return f"skipped {100 * skipped:.0f}% of {s['frames']} frames, {s['entries']} entries, entry latency {lat_txt}"
@@ -0,0 +1,185 @@
+import threading
+import time
+import traceback
+import collections
+
+
+class DropQueue: #bounded queue, a full queue throws away the oldest frame
+    def __init__(self, maxsize=2, ready=None, block=False, stop_event=None):
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.ready = ready #optional Event set on every put, lets one consumer wait on several queues
+        self.block = block #put waits for room instead (replays: every frame counts), until stop_event is set
+        self.stop_event = stop_event or threading.Event()
+
+    def put(self, item):
+        with self.cond:
+            while self.block and len(self.items) >= self.maxsize and not self.stop_event.is_set():
+                self.cond.wait(0.1)
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify_all()
+        if self.ready is not None:
+            self.ready.set()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all() #a blocked put
+            return item
+
+    def depth(self):
+        with self.cond:
+            return len(self.items)
+
+
+class StageStats:
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self.busy_sec = 0.0
+        self.errors = 0 # items whose fn raised
+        self.stamps = collections.deque()
+        self.lock = threading.Lock()
+
+    def record(self, busy):
+        now = time.time()
+        with self.lock:
+            self.count += 1
+            self.busy_sec += busy
+            self.stamps.append(now)
+            while self.stamps and now - self.stamps[0] > self.window:
+                self.stamps.popleft()
+
+    def fps(self):
+        now = time.time()
+        with self.lock:
+            while self.stamps and now - self.stamps[0] > self.window:
+                self.stamps.popleft()
+            return len(self.stamps) / self.window
+
+    def avg_ms(self):
+        with self.lock:
+            if self.count == 0:
+                return 0.0
+            return 1000.0 * self.busy_sec / self.count
+
+
+class Stage(threading.Thread):
+    """
+    One worker of the pipeline. fn gets an item from in_q (or no argument for a
+    source stage) and returns the item to hand to every queue in out_qs, or None
+    to drop it. An exception in fn drops that item only: it is counted in
+    stats.errors and logged (the traceback at most every log_every_sec).
+    Once finishing is set the stage runs until it has nothing left (its in_q is
+    empty, or a source stage's fn returns None) and then exits.
+    """
+    def __init__(self, name, fn, in_q=None, out_qs=(), stop_event=None, log_every_sec=10.0):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_q = in_q
+        self.out_qs = list(out_qs)
+        self.stop_event = stop_event or threading.Event()
+        self.finishing = threading.Event()
+        self.stats = StageStats()
+        self.log_every_sec = log_every_sec
+        self.last_log = 0.0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            args = ()
+            if self.in_q is not None:
+                item = self.in_q.get(timeout=0.1)
+                if item is None:
+                    if self.finishing.is_set():
+                        return
+                    continue
+                args = (item,)
+            t0 = time.perf_counter()
+            try:
+                out = self.fn(*args)
+            except Exception as e:
+                # one bad item must not stop the stage while capture keeps feeding it
+                out = None
+                self._error(e)
+            self.stats.record(time.perf_counter() - t0)
+            if out is None:
+                if self.in_q is None and self.finishing.is_set():
+                    return
+                continue
+            for q in self.out_qs:
+                q.put(out)
+
+    def _error(self, e):
+        with self.stats.lock:
+            self.stats.errors += 1
+            n = self.stats.errors
+        now = time.time()
+        if now - self.last_log >= self.log_every_sec:
+            self.last_log = now
+            print(f"Stage {self.name} failed on an item ({n} so far), going on: {type(e).__name__}: {e}")
+            traceback.print_exc()
+
+
+class Pipeline:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.input_ended = threading.Event() # set by the source stages once there is nothing more to read
+        self.stages = []
+        self.queues = {}
+        self.external = {} # stats for stages that run outside the pipeline (e.g. display on the main thread)
+
+    def queue(self, name, maxsize=2, ready=None, block=False):
+        q = DropQueue(maxsize, ready, block, self.stop_event)
+        self.queues[name] = q
+        return q
+
+    def add_stage(self, name, fn, in_q=None, out_qs=()):
+        stage = Stage(name, fn, in_q, out_qs, self.stop_event)
+        self.stages.append(stage)
+        return stage
+
+    def stats_for(self, name):
+        stats = StageStats()
+        self.external[name] = stats
+        return stats
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join(timeout=1.0)
+
+    def finish(self, timeout=10.0):
+        """
+        Stops after every item in flight went through: the stages are finished one by one
+        in the order they were added (so add them upstream first), each once its input is
+        empty and the stages before it are gone.
+        """
+        for stage in self.stages:
+            stage.finishing.set()
+            stage.join(timeout)
+        self.stop()
+
+    def report(self):
+        # one line per stage and per queue so the bottleneck is easy to spot
+        parts = []
+        for stage in self.stages:
+            errors = f" errors={stage.stats.errors}" if stage.stats.errors else ""
+            parts.append(f"{stage.name}: {stage.stats.fps():.1f} fps {stage.stats.avg_ms():.0f} ms{errors}")
+        for name, stats in self.external.items():
+            parts.append(f"{name}: {stats.fps():.1f} fps {stats.avg_ms():.0f} ms")
+        for name, q in self.queues.items():
+            parts.append(f"{name}_q: {q.depth()}/{q.maxsize} dropped={q.dropped}")
+        return " | ".join(parts)
@@ -1,26 +1,100 @@
 import cv2
 import numpy as np
-import face_recognition
 import os
 import json
+import time
+import threading
+from gallery import GalleryIndex
 
-path = 'data'
+path = 'Data'
 img_path = 'Images'
-cache = {}
 thumbnail_width = 400
 
+gallery_path = os.path.join(path, "gallery.npz")
 encodings_path = os.path.join(path, "encodings.npy")
 names_path = os.path.join(path, "names.json")
+reload_check_sec = 2.0
 
-if not os.path.exists(encodings_path) or not os.path.exists(names_path):
-    print ("Run encode_faces.py first.")
-    exit()
+list_thresh = 0.5
 
-my_encode_list = np.load(encodings_path)
-with open (names_path, "r") as file:
-    names = json.load(file)
+# both loaded on first use (or up front, in parallel, by startup.py)
+face_recognition = None
+gallery = None
+gallery_state = {"mtime": None, "checked": 0.0}
+load_lock = threading.Lock()
 
-list_thresh = 0.5
+
+def load_face_models():
+    # importing face_recognition loads dlib's detector / landmark / encoder models (about a second)
+    global face_recognition
+    if face_recognition is None:
+        with load_lock:
+            if face_recognition is None:
+                import face_recognition as fr
+                face_recognition = fr
+    return face_recognition
+
+
+def load_gallery():
+    if os.path.exists(gallery_path):
+        return GalleryIndex.load(gallery_path)
+    # older encode_faces.py output: one encoding per name, same order
+    my_encode_list = np.load(encodings_path)
+    with open (names_path, "r") as file:
+        names = json.load(file)
+    # raw (not normalized) vectors so list_thresh keeps its face_distance meaning
+    index = GalleryIndex(dim=my_encode_list.shape[1], normalize=False)
+    for enc, name in zip(my_encode_list, names):
+        index.add(name, enc)
+    return index.build()
+
+
+def ensure_gallery():
+    global gallery
+    if gallery is None:
+        if not os.path.exists(gallery_path) and (not os.path.exists(encodings_path) or not os.path.exists(names_path)):
+            raise FileNotFoundError("Run encode_faces.py first.")
+        gallery_state["mtime"] = os.path.getmtime(gallery_path) if os.path.exists(gallery_path) else None
+        gallery_state["checked"] = time.time()
+        gallery = load_gallery()
+    return gallery
+
+
+def warm_up(frame_shape=(480, 640, 3), scale=0.20):
+    """
+    One face detection and one encoding on a blank frame: the first calls set up dlib's
+    buffers, better paid here than by the first visitor.
+    """
+    fr = load_face_models()
+    h, w = frame_shape[:2]
+    small = np.zeros((int(h * scale), int(w * scale), 3), np.uint8)
+    fr.face_locations(small)
+    # a made-up face box so the landmark and encoder networks run too
+    t, l = small.shape[0] // 4, small.shape[1] // 4
+    fr.face_encodings(small, [(t, l + small.shape[0] // 2, t + small.shape[0] // 2, l)], num_jitters=2, model="small")
+
+
+def maybe_reload_gallery():
+    # picks up a new encode_faces.py run without restarting main.py
+    global gallery
+    ensure_gallery()
+    now = time.time()
+    if now - gallery_state["checked"] < reload_check_sec:
+        return
+    gallery_state["checked"] = now
+    try:
+        mtime = os.path.getmtime(gallery_path)
+    except OSError:
+        return
+    if mtime == gallery_state["mtime"]:
+        return
+    try:
+        gallery = GalleryIndex.load(gallery_path)
+    except Exception as e:
+        print(f"Gallery reload failed: {e}")
+        return
+    gallery_state["mtime"] = mtime
+    print(f"Gallery reloaded: v{gallery.version}, {len(gallery)} identities")
 
 
 def crop_yolo_bbox(img, bbox): #converting yolo box to opencv box
@@ -47,29 +121,103 @@ def crop_yolo_bbox(img, bbox): #converting yolo box to opencv box
 
     return img[y1:y2, x1:x2]
 
-def classify_person(img, human_bbox): #determine if person is known or unknown
-    cropped = crop_yolo_bbox(img, human_bbox)
-    if cropped is None:
-        return {"type": "unknown", "name": None}
-    img_shrink = cv2.resize(cropped, (0, 0), None, 0.20, 0.20)
+def bbox_to_xyxy(bbox):
+    x_c, y_c = bbox["x_center"], bbox["y_center"]
+    bw, bh = bbox["width"], bbox["height"]
+    return (x_c - bw / 2, y_c - bh / 2, x_c + bw / 2, y_c + bh / 2)
+
+
+def assign_faces(face_boxes, person_boxes):
+    """
+    face_boxes: (top, right, bottom, left) in frame pixels, person_boxes: (x1, y1, x2, y2).
+    Each face goes to the smallest person box containing its center, each person keeps
+    its largest face. Returns {person index: face index}.
+    """
+    best = {}
+    for fi, (top, right, bottom, left) in enumerate(face_boxes):
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        owner = None
+        for pi, (x1, y1, x2, y2) in enumerate(person_boxes):
+            if x1 <= cx <= x2 and y1 <= cy <= y2:
+                area = (x2 - x1) * (y2 - y1)
+                if owner is None or area < owner[1]:
+                    owner = (pi, area)
+        if owner is None:
+            continue
+        face_area = (right - left) * (bottom - top)
+        pi = owner[0]
+        if pi not in best or face_area > best[pi][1]:
+            best[pi] = (fi, face_area)
+    return {pi: fi for pi, (fi, _) in best.items()}
+
+
+def locate_and_encode(img, human_bboxes, scale=0.20):
+    """
+    One face detection over the region covering all person boxes of a frame and one
+    face_encodings call for all faces. Returns (person indices, encodings), same order.
+    """
+    h, w, _ = img.shape
+    person_boxes = [bbox_to_xyxy(b) for b in human_bboxes]
+    # crop to the union of all person boxes, the face detector cost follows that area
+    x1 = max(0, int(min(b[0] for b in person_boxes)))
+    y1 = max(0, int(min(b[1] for b in person_boxes)))
+    x2 = min(w, int(max(b[2] for b in person_boxes)))
+    y2 = min(h, int(max(b[3] for b in person_boxes)))
+    if x2 <= x1 or y2 <= y1:
+        return [], []
+    img_shrink = cv2.resize(img[y1:y2, x1:x2], (0, 0), None, scale, scale)
     img_rgb = cv2.cvtColor(img_shrink, cv2.COLOR_BGR2RGB)
     faces_loc = face_recognition.face_locations(img_rgb)
     if not faces_loc:
-        return {"type": "unknown", "name": None}
-    encode_imgs = face_recognition.face_encodings(img_rgb, faces_loc, num_jitters=2, model="small")
-    if not encode_imgs:
-        return {"type": "unknown", "name": None}
-
-    encoded_face = encode_imgs[0]
-    list_dist = face_recognition.face_distance(my_encode_list, encoded_face)
-    if len(list_dist) == 0:
-        return {"type": "unknown", "name": None}
-    best_index = int(np.argmin(list_dist))
-    best_dist = float(list_dist[best_index])
-    if best_dist < list_thresh:
-        name = names[best_index]
-        return {
-            "type": "friend", "name": name}
-    else:
-        return {
-            "type": "unknown", "name": None}
\ No newline at end of file
+        return [], []
+
+    # back to frame pixels to match faces with person boxes
+    face_boxes = [(t / scale + y1, r / scale + x1, b / scale + y1, l / scale + x1) for t, r, b, l in faces_loc]
+    owners = assign_faces(face_boxes, person_boxes)
+    if not owners:
+        return [], []
+    person_order = sorted(owners)
+    locs = [faces_loc[owners[pi]] for pi in person_order]
+    encode_imgs = face_recognition.face_encodings(img_rgb, locs, num_jitters=2, model="small")
+    return person_order[:len(encode_imgs)], encode_imgs
+
+
+def classify_persons_batch(jobs, scale=0.20, with_embeddings=False):
+    """
+    jobs: [(img, human_bboxes)], e.g. one per camera. Faces are found and encoded per
+    image, then all of them are matched against the gallery in one call.
+    Returns one classify_persons result per job.
+    """
+    load_face_models()
+    maybe_reload_gallery()
+    results = [[{"type": "unknown", "name": None, "distance": None} for _ in bboxes] for _, bboxes in jobs]
+    embeddings = [[None] * len(bboxes) for _, bboxes in jobs]
+    found = [] # (job, person index, encoding)
+    for j, (img, bboxes) in enumerate(jobs):
+        if bboxes:
+            order, encs = locate_and_encode(img, bboxes, scale)
+            found.extend((j, pi, enc) for pi, enc in zip(order, encs))
+    if found:
+        matches = gallery.match(np.array([enc for _, _, enc in found]), list_thresh)
+        for (j, pi, enc), (name, dist) in zip(found, matches):
+            embeddings[j][pi] = enc
+            if name is not None:
+                results[j][pi] = {"type": "friend", "name": name, "distance": dist}
+            else:
+                results[j][pi] = {"type": "unknown", "name": None, "distance": dist}
+    if with_embeddings:
+        return list(zip(results, embeddings))
+    return results
+
+
+def classify_persons(img, human_bboxes, scale=0.20, with_embeddings=False):
+    """
+    Classifies every person box of a frame in one pass (see locate_and_encode) with a
+    batched gallery match. Returns one person_info dict per box, in the same order.
+    with_embeddings=True also returns the face embedding per box (None if no face).
+    """
+    return classify_persons_batch([(img, human_bboxes)], scale, with_embeddings)[0]
+
+
+def classify_person(img, human_bbox): #determine if person is known or unknown
+    return classify_persons(img, [human_bbox])[0]
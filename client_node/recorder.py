@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import datetime
+import collections
+import cv2
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class Recorder:
+    """
+    Keeps what the camera saw on disk as clips: an .mp4 of the raw frames plus a
+    .jsonl sidecar with one line per video frame (index, frame_id, timestamp,
+    detections, person_info, gated). A clip starts with the first person and ends
+    hold_sec after the last one (or after max_clip_sec), so idle hours cost nothing.
+    The clip's frame rate is fps if given (a replay that drops nothing), otherwise the
+    rate frames reached the recorder over the last rate_window_sec (capture minus the
+    pipeline's drops), or default_fps until there is enough to measure.
+    """
+    def __init__(self, out_dir="recordings", fps=None, hold_sec=5.0, max_clip_sec=300.0,
+                 record_all=False, fourcc="mp4v", default_fps=10.0, rate_window_sec=2.0):
+        self.out_dir = out_dir
+        self.fps = fps
+        self.default_fps = default_fps
+        self.rate_window_sec = rate_window_sec
+        self.arrivals = collections.deque() # t_capture of the frames seen lately, recorded or not
+        self.hold_sec = hold_sec
+        self.max_clip_sec = max_clip_sec
+        self.record_all = record_all
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        os.makedirs(out_dir, exist_ok=True)
+        self.writer = None
+        self.sidecar = None
+        self.clip_start = 0.0
+        self.index = 0
+        self.last_person = float("-inf")
+        self.stats = {"clips": 0, "frames": 0}
+
+    def write(self, item): # pipeline stage fn
+        now = time.time()
+        self.arrivals.append(item["t_capture"])
+        while item["t_capture"] - self.arrivals[0] > self.rate_window_sec:
+            self.arrivals.popleft()
+        if item["person_dets"]:
+            self.last_person = now
+        if not self.record_all and now - self.last_person > self.hold_sec:
+            self.close()
+            return None
+        if self.writer is None or now - self.clip_start > self.max_clip_sec:
+            self._open(item["frame"], now)
+        self.writer.write(item["frame"])
+        self.sidecar.write(json.dumps({
+            "index": self.index,
+            "frame_id": item["frame_id"],
+            "timestamp": item["timestamp"],
+            "detections": item["dets"],
+            "person_info": item["person_info"],
+            "gated": item.get("gated", False),
+        }) + "\n")
+        self.index += 1
+        self.stats["frames"] += 1
+        return None
+
+    def clip_fps(self):
+        if self.fps:
+            return self.fps
+        span = self.arrivals[-1] - self.arrivals[0] if self.arrivals else 0.0
+        if len(self.arrivals) < 5 or span < 0.5 * self.rate_window_sec:
+            return self.default_fps
+        return (len(self.arrivals) - 1) / span
+
+    def _open(self, frame, now):
+        self.close()
+        stem = base = os.path.join(self.out_dir, datetime.datetime.now().strftime("clip_%Y%m%d_%H%M%S"))
+        n = 1
+        while os.path.exists(stem + ".jsonl"): # two clips in the same second
+            stem = f"{base}_{n}"
+            n += 1
+        h, w = frame.shape[:2]
+        fps = self.clip_fps()
+        self.writer = cv2.VideoWriter(stem + ".mp4", self.fourcc, fps, (w, h))
+        self.sidecar = open(stem + ".jsonl", "w")
+        self.clip_start = now
+        self.index = 0
+        self.stats["clips"] += 1
+        print(f"Recording {stem}.mp4 at {fps:.1f} fps")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.sidecar.close()
+            self.writer = None
+            self.sidecar = None
+
+
+class ImageDirSource:
+    """cv2.VideoCapture look-alike over the images of a directory (sorted, sub folders included)."""
+    def __init__(self, path):
+        self.paths = sorted(os.path.join(root, fn) for root, _, names in os.walk(path)
+                            for fn in names if fn.lower().endswith(IMAGE_EXTS))
+        self.pos = 0
+        self.current = None # path of the image last returned by read()
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        while self.pos < len(self.paths):
+            self.current = self.paths[self.pos]
+            self.pos += 1
+            frame = cv2.imread(self.current)
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        return 0.0
+
+    def release(self):
+        pass
+
+
+def open_source(src):
+    """A camera index ("1"), a video file or a directory of images."""
+    if str(src).isdigit():
+        return cv2.VideoCapture(int(src))
+    if os.path.isdir(src):
+        return ImageDirSource(src)
+    return cv2.VideoCapture(src)
+
+
+def read_sidecar(video_path):
+    """The recorded per-frame metadata of a clip (by index), or None if there is no sidecar."""
+    path = os.path.splitext(video_path)[0] + ".jsonl"
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
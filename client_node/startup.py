@@ -0,0 +1,91 @@
+import time
+import threading
+import numpy as np
+import recognition
+from metrics import REGISTRY
+
+
+class Startup:
+    """
+    Brings the client up before the first frame: the detector, the face models and the
+    gallery load on their own threads (parallel=True), then the detector and the face
+    models get one pass over a blank frame so the first real person doesn't pay for
+    first-call setup. timings has the seconds every step took ("total" = until ready),
+    errors what failed; ready is set when everything is done either way.
+    """
+    def __init__(self, load_detector, warm_up=True, parallel=True, frame_shape=(480, 640, 3), batch=1):
+        self.load_detector = load_detector
+        self.warm_up = warm_up
+        self.parallel = parallel
+        self.frame_shape = frame_shape
+        self.batch = batch
+        self.detector = None
+        self.timings = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.t0 = None
+        REGISTRY.gauge("client_ready", "1 once models are loaded and warm.", lambda: self.ok())
+        REGISTRY.gauge("client_startup_seconds", "Time per startup step.", lambda: dict(self.timings), ("step",))
+
+    def _step(self, name, fn):
+        t = time.perf_counter()
+        out = fn()
+        with self.lock:
+            self.timings[name] = round(time.perf_counter() - t, 4)
+        return out
+
+    def _detector(self):
+        self.detector = self._step("detector_load", self.load_detector)
+        if self.warm_up:
+            frames = [np.zeros(self.frame_shape, np.uint8)] * self.batch
+            self._step("detector_warmup", lambda: self.detector.detect_batch(frames))
+
+    def _faces(self):
+        self._step("face_models_load", recognition.load_face_models)
+        if self.warm_up:
+            self._step("faces_warmup", lambda: recognition.warm_up(self.frame_shape))
+
+    def _gallery(self):
+        gallery = self._step("gallery_load", recognition.ensure_gallery)
+        if self.warm_up and len(gallery.vectors):
+            self._step("gallery_warmup", lambda: gallery.match(gallery.vectors[:1], recognition.list_thresh))
+
+    def _run(self, name, fn):
+        try:
+            fn()
+        except Exception as e:
+            with self.lock:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        steps = [("detector", self._detector), ("faces", self._faces), ("gallery", self._gallery)]
+        if not self.parallel:
+            for name, fn in steps:
+                self._run(name, fn)
+            self._done()
+            return self
+        threads = [threading.Thread(target=self._run, args=step, name=f"startup-{step[0]}", daemon=True)
+                   for step in steps]
+        for t in threads:
+            t.start()
+
+        def finish():
+            for t in threads:
+                t.join()
+            self._done()
+        threading.Thread(target=finish, name="startup", daemon=True).start()
+        return self
+
+    def _done(self):
+        with self.lock:
+            self.timings["total"] = round(time.perf_counter() - self.t0, 4)
+        self.ready.set()
+
+    def wait(self, timeout=None):
+        """True once everything loaded without errors."""
+        return self.ready.wait(timeout) and not self.errors
+
+    def ok(self):
+        return self.ready.is_set() and not self.errors
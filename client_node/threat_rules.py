@@ -0,0 +1,72 @@
+import threading
+import requests
+from vocab import PERSON_CLASSES, WEAPON_CLASSES, PERSON_THRESH, WEAPON_THRESH
+
+
+def flag_table(flag):
+    # one flag of the server's rules ({"classes", "min_conf", "class_conf"}) -> {class: threshold}
+    per_class = flag.get("class_conf") or {}
+    return {cls: float(per_class.get(cls, flag.get("min_conf", 0.0))) for cls in flag.get("classes", [])}
+
+
+class ThreatRules:
+    """
+    What counts as a person and as a weapon: the part of the server's rules the client
+    applies by itself (upload policy, local alarm). Starts from the server's defaults
+    (common/vocab.py); fetch() takes the rules the server runs (GET /rules), so an edit
+    of its rules.json reaches the client as well.
+    """
+    def __init__(self):
+        # one reference, swapped whole by update(), so readers never see half of a change
+        self.tables = ({c: PERSON_THRESH for c in PERSON_CLASSES}, {c: WEAPON_THRESH for c in WEAPON_CLASSES})
+        self.source = "defaults"
+
+    @property
+    def weapon_classes(self):
+        return self.tables[1]
+
+    def is_weapon(self, d):
+        thresh = self.tables[1].get(d["class_name"])
+        return thresh is not None and d["confidence"] >= thresh
+
+    def threat(self, dets):
+        """The server's threat rule on one frame: a weapon held while a person is in view."""
+        persons, weapons = self.tables
+        person = weapon = False
+        for d in dets:
+            name, conf = d["class_name"], d["confidence"]
+            if name in persons and conf >= persons[name]:
+                person = True
+            elif name in weapons and conf >= weapons[name]:
+                weapon = True
+        return person and weapon
+
+    def update(self, spec):
+        flags = spec["flags"]
+        self.tables = (flag_table(flags["person"]), flag_table(flags["weapon"]))
+
+    def fetch(self, server_url, timeout=(0.5, 2.0)):
+        try:
+            response = requests.get(f"{server_url}/rules", timeout=timeout)
+            response.raise_for_status()
+            self.update(response.json()["rules"])
+        except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Could not get the server's rules, keeping the current ones ({self.source}): {e}")
+            return False
+        self.source = server_url
+        return True
+
+    def follow(self, server_url, every_sec=60.0, stop_event=None):
+        """fetch() now and then every every_sec on a daemon thread, until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        def loop():
+            while True:
+                self.fetch(server_url)
+                if stop_event.wait(every_sec):
+                    return
+        t = threading.Thread(target=loop, name="threat-rules", daemon=True)
+        t.start()
+        return t
+
+
+RULES = ThreatRules()
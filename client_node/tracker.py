@@ -0,0 +1,106 @@
+import time
+import itertools
+
+
+def iou(a, b): #boxes as (x1, y1, x2, y2)
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.created = now
+        self.misses = 0
+        # cached identity, filled by the recognizer
+        self.type = "unknown"
+        self.name = None
+        self.distance = None
+        self.embedding = None
+        self.has_face = False
+        self.last_verified = None
+
+    def info(self):
+        return {"type": self.type, "name": self.name, "distance": self.distance, "track_id": self.track_id}
+
+
+class IoUTracker:
+    """
+    Greedy IoU association of person boxes between frames. Every track keeps the last
+    identity and embedding the recognizer gave it, needs_verify() says when that cache
+    has to be refreshed.
+    """
+    def __init__(self, iou_thresh=0.3, max_misses=15,
+                 friend_reverify_sec=5.0, unknown_reverify_sec=2.0, no_face_retry_sec=0.3,
+                 low_conf_dist=0.42, low_conf_reverify_sec=1.0):
+        self.iou_thresh = iou_thresh
+        self.max_misses = max_misses
+        self.friend_reverify_sec = friend_reverify_sec
+        self.unknown_reverify_sec = unknown_reverify_sec
+        self.no_face_retry_sec = no_face_retry_sec
+        self.low_conf_dist = low_conf_dist # friends matched above this distance are re-checked sooner
+        self.low_conf_reverify_sec = low_conf_reverify_sec
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.stats = {"person_frames": 0, "verified": 0}
+
+    def update(self, boxes, now=None):
+        """boxes: list of (x1, y1, x2, y2). Returns the track of every box, same order."""
+        now = time.time() if now is None else now
+        pairs = []
+        for ti, t in enumerate(self.tracks):
+            for bi, b in enumerate(boxes):
+                score = iou(t.box, b)
+                if score >= self.iou_thresh:
+                    pairs.append((score, ti, bi))
+        pairs.sort(reverse=True)
+        used_t, out = set(), [None] * len(boxes)
+        for score, ti, bi in pairs:
+            if ti in used_t or out[bi] is not None:
+                continue
+            used_t.add(ti)
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.misses = 0
+            out[bi] = track
+        for ti, t in enumerate(self.tracks):
+            if ti not in used_t:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        for bi, b in enumerate(boxes):
+            if out[bi] is None:
+                out[bi] = Track(next(self.ids), b, now)
+                self.tracks.append(out[bi])
+        self.stats["person_frames"] += len(boxes)
+        return out
+
+    def needs_verify(self, track, now=None):
+        now = time.time() if now is None else now
+        if track.last_verified is None:
+            return True
+        age = now - track.last_verified
+        if not track.has_face:
+            return age >= self.no_face_retry_sec
+        if track.type == "friend":
+            if track.distance is not None and track.distance > self.low_conf_dist:
+                return age >= self.low_conf_reverify_sec
+            return age >= self.friend_reverify_sec
+        return age >= self.unknown_reverify_sec
+
+    def set_identity(self, track, info, embedding, now=None):
+        track.last_verified = time.time() if now is None else now
+        self.stats["verified"] += 1
+        if embedding is None:
+            # no face this time (turned away), keep whatever identity the track already had
+            if not track.has_face:
+                track.type, track.name, track.distance = info["type"], info["name"], info.get("distance")
+            return
+        track.has_face = True
+        track.embedding = embedding
+        track.type, track.name, track.distance = info["type"], info["name"], info.get("distance")
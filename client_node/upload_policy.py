@@ -0,0 +1,103 @@
+import time
+import cv2
+from threat_rules import RULES # the server's weapon classes and thresholds
+
+# reason -> (longest side of the sent image, JPEG quality)
+IMAGE_TIERS = {
+    "threat": (640, 80),
+    "change": (480, 70),
+    "refresh": (320, 50),
+}
+
+
+def scene_of(item):
+    """What the server cares about in a frame: who is there (per track) and whether a weapon is."""
+    people = {p.get("track_id"): (p.get("type"), p.get("name")) for p in item["person_info"]}
+    weapon = any(RULES.is_weapon(d) for d in item["dets"])
+    return people, weapon
+
+
+class UploadPolicy:
+    """
+    Decides per frame whether to send it and with what. Returns (reason, with_image):
+      change     a new person, an identity resolved or changed, a weapon appeared or
+                 disappeared: sent right away, with an image (except when everyone left)
+      threat     a weapon is in view: an image every threat_interval
+      refresh    people in view: an image every image_interval so the event snapshot stays current
+      active     people in view, nothing new: detections only every active_interval
+                 (shorter than the server's event cooldown, so the event stays open)
+      heartbeat  nobody around: detections only every heartbeat_sec
+    (None, False) means skip the frame.
+    """
+    def __init__(self, heartbeat_sec=10.0, active_interval=1.0, image_interval=5.0, threat_interval=0.3):
+        self.heartbeat_sec = heartbeat_sec
+        self.active_interval = active_interval
+        self.image_interval = image_interval
+        self.threat_interval = threat_interval
+        self.people = {}
+        self.weapon = False
+        self.last_sent = float("-inf")
+        self.last_image = float("-inf")
+        self.counters = {"change": 0, "threat": 0, "refresh": 0, "active": 0, "heartbeat": 0, "skipped": 0}
+
+    def decide(self, item, now=None):
+        now = time.time() if now is None else now
+        people, weapon = scene_of(item)
+        new_track = any(t not in self.people for t in people)
+        # an unknown track becoming a friend (or a different friend) is news, the reverse is not
+        new_name = any(name and self.people.get(t, (None, None))[1] != name for t, (_, name) in people.items())
+        left = bool(self.people) and not people
+        changed = new_track or new_name or weapon != self.weapon or left
+        self.people, self.weapon = people, weapon
+
+        if changed:
+            reason, with_image = "change", not left
+        elif weapon and now - self.last_image >= self.threat_interval:
+            reason, with_image = "threat", True
+        elif people and now - self.last_image >= self.image_interval:
+            reason, with_image = "refresh", True
+        elif people and now - self.last_sent >= self.active_interval:
+            reason, with_image = "active", False
+        elif not people and now - self.last_sent >= self.heartbeat_sec:
+            reason, with_image = "heartbeat", False
+        else:
+            self.counters["skipped"] += 1
+            return None, False
+        self.counters[reason] += 1
+        self.last_sent = now
+        if with_image:
+            self.last_image = now
+        return reason, with_image
+
+    def image_tier(self, reason):
+        # a change while a weapon is in view gets the threat quality
+        return IMAGE_TIERS["threat" if self.weapon else reason]
+
+
+def roi_crop(frame, dets, max_side, pad=0.15, full_frame_fill=0.6):
+    """
+    Tight crop around the person and weapon boxes (their union, padded), scaled down so
+    its longest side is at most max_side. Falls back to the whole frame when the boxes
+    cover most of it. Returns (image, roi) with roi in frame pixels plus the scale used.
+    """
+    h, w = frame.shape[:2]
+    weapons = RULES.weapon_classes
+    boxes = [d["bbox"] for d in dets if d["class_name"] == "person" or d["class_name"] in weapons]
+    x1, y1, x2, y2 = 0, 0, w, h
+    if boxes:
+        bx1 = min(b["x_center"] - b["width"] / 2 for b in boxes)
+        by1 = min(b["y_center"] - b["height"] / 2 for b in boxes)
+        bx2 = max(b["x_center"] + b["width"] / 2 for b in boxes)
+        by2 = max(b["y_center"] + b["height"] / 2 for b in boxes)
+        px, py = pad * (bx2 - bx1), pad * (by2 - by1)
+        cx1, cy1 = max(0, int(bx1 - px)), max(0, int(by1 - py))
+        cx2, cy2 = min(w, int(bx2 + px)), min(h, int(by2 + py))
+        if cx2 > cx1 and cy2 > cy1 and (cx2 - cx1) * (cy2 - cy1) < full_frame_fill * w * h:
+            x1, y1, x2, y2 = cx1, cy1, cx2, cy2
+    crop = frame[y1:y2, x1:x2]
+    scale = min(1.0, max_side / max(x2 - x1, y2 - y1))
+    if scale < 1.0:
+        crop = cv2.resize(crop, (max(1, round((x2 - x1) * scale)), max(1, round((y2 - y1) * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return crop, {"x1": x1, "y1": y1, "x2": x2, "y2": y2, "scale": round(scale, 4),
+                  "frame_width": w, "frame_height": h}
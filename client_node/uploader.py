@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import struct
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import REGISTRY
+
+UPLOAD_SECONDS = REGISTRY.histogram("client_upload_seconds", "Successful POST to /frame_result, per camera.", ("camera",))
+UPLOAD_FAILURES = REGISTRY.counter("client_upload_failures_total", "Failed POST attempts, per camera.", ("camera",))
+
+
+class Uploader(threading.Thread):
+    """
+    Sends frames to the server off the capture thread.
+    Only the newest submitted frame is kept (older ones are coalesced away), failed
+    sends are retried with backoff and then spooled to disk until the server is back.
+    """
+    def __init__(self, server_url, on_response=None,
+                 spool_dir="spool", spool_max=200, retries=3,
+                 timeout=(0.5, 1.0), backoff=0.2, max_backoff=5.0, camera_id=None):
+        super().__init__(name="uploader", daemon=True)
+        self.url = f"{server_url}/frame_result"
+        self.on_response = on_response
+        self.spool_dir = spool_dir
+        self.spool_max = spool_max
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.upload_seconds = UPLOAD_SECONDS.labels(camera_id or "default")
+        self.upload_failures = UPLOAD_FAILURES.labels(camera_id or "default")
+
+        # one pooled keep-alive connection instead of a new TCP connection per frame
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.cond = threading.Condition()
+        self.pending = None
+        self.stop_event = threading.Event()
+        self.server_down_until = 0
+
+        self.lock = threading.Lock()
+        self.counters = {"sent": 0, "bytes": 0, "failed": 0, "coalesced": 0, "spooled": 0,
+                         "spool_dropped": 0, "drained": 0}
+        self.latency_ms = {"last": 0.0, "avg": 0.0, "max": 0.0}
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.spool_seq = self._last_spool_seq()
+
+    def submit(self, meta, jpeg_bytes):
+        with self.cond:
+            if self.pending is not None:
+                self._count("coalesced")
+                if jpeg_bytes is None and self.pending[1] is not None:
+                    return #a detections-only frame never pushes out a waiting image
+            self.pending = (meta, jpeg_bytes)
+            self.cond.notify()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify()
+        self.join(timeout=2.0)
+        self.session.close()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.cond:
+                if self.pending is None:
+                    self.cond.wait(timeout=1.0)
+                item = self.pending
+                self.pending = None
+            if item is None:
+                self._drain_spool()
+                continue
+            meta, jpeg_bytes = item
+            data = self._send_with_retry(meta, jpeg_bytes)
+            if data is None:
+                self._spool(meta, jpeg_bytes)
+                continue
+            if self.on_response:
+                self.on_response(data, meta)
+            self._drain_spool()
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counters)
+            out.update({f"latency_{k}_ms": round(v, 1) for k, v in self.latency_ms.items()})
+        out["spool_depth"] = len(self._spool_files())
+        return out
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def _post(self, meta, jpeg_bytes):
+        t0 = time.perf_counter()
+        files = {"image": ("frame.jpg", jpeg_bytes, "image/jpeg")} if jpeg_bytes else None
+        meta_json = json.dumps(meta)
+        response = self.session.post(self.url, data={"meta": meta_json}, files=files,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        ms = 1000.0 * (time.perf_counter() - t0)
+        self.upload_seconds.observe(ms / 1000.0)
+        with self.lock:
+            self.counters["sent"] += 1
+            self.counters["bytes"] += len(meta_json) + len(jpeg_bytes or b"")
+            self.latency_ms["last"] = ms
+            self.latency_ms["max"] = max(self.latency_ms["max"], ms)
+            self.latency_ms["avg"] = ms if self.counters["sent"] == 1 else 0.9 * self.latency_ms["avg"] + 0.1 * ms
+        return response.json()
+
+    def _send_with_retry(self, meta, jpeg_bytes):
+        if time.time() < self.server_down_until: #still backing off, don't wait on a dead server
+            return None
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                data = self._post(meta, jpeg_bytes)
+                self.server_down_until = 0
+                return data
+            except Exception as e:
+                self._count("failed")
+                self.upload_failures.inc()
+                print(f"Error sending (attempt {attempt + 1}/{self.retries}): {e}")
+                if self.stop_event.wait(delay):
+                    return None
+                delay = min(delay * 2, self.max_backoff)
+        self.server_down_until = time.time() + delay
+        return None
+
+    # ---- disk spool: same layout as the server's application/x-frame body ----
+    def _spool_files(self):
+        try:
+            return sorted(f for f in os.listdir(self.spool_dir) if f.endswith(".frame"))
+        except OSError:
+            return []
+
+    def _last_spool_seq(self):
+        files = self._spool_files()
+        return int(files[-1].split(".")[0]) if files else 0
+
+    def _spool(self, meta, jpeg_bytes):
+        self.spool_seq += 1
+        meta_bytes = json.dumps(meta).encode("utf-8")
+        path = os.path.join(self.spool_dir, f"{self.spool_seq:010d}.frame")
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(struct.pack(">I", len(meta_bytes)) + meta_bytes + (jpeg_bytes or b""))
+            os.replace(path + ".tmp", path)
+            self._count("spooled")
+        except OSError as e:
+            print(f"Spool write failed: {e}")
+            return
+        files = self._spool_files()
+        for old in files[:max(0, len(files) - self.spool_max)]: #bounded, oldest frames go first
+            os.remove(os.path.join(self.spool_dir, old))
+            self._count("spool_dropped")
+
+    def _drain_spool(self):
+        if time.time() < self.server_down_until:
+            return
+        for fn in self._spool_files():
+            if self.stop_event.is_set() or self.pending is not None: #live frames win over old ones
+                return
+            path = os.path.join(self.spool_dir, fn)
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+                (meta_len,) = struct.unpack(">I", body[:4])
+                meta = json.loads(body[4:4 + meta_len])
+                jpeg_bytes = body[4 + meta_len:] or None
+            except (OSError, ValueError, struct.error):
+                os.remove(path)
+                continue
+            meta["replayed"] = True
+            try:
+                self._post(meta, jpeg_bytes)
+            except Exception:
+                self._count("failed")
+                self.upload_failures.inc()
+                self.server_down_until = time.time() + self.backoff
+                return
+            os.remove(path)
+            self._count("drained")
@@ -0,0 +1 @@
+../common/vocab.py
\ No newline at end of file
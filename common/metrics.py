@@ -0,0 +1,367 @@
+import os
+import sys
+import time
+import bisect
+import threading
+import collections
+
+# used by both nodes: client_node/metrics.py and server_node/metrics.py are links to this file
+
+# seconds, from a cheap lookup to a slow network call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v):
+    return repr(float(v)) if not isinstance(v, bool) else str(int(v))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.children = {}
+        if not self.label_names:
+            self.children[()] = self._new_child()
+
+    def labels(self, *values):
+        """The series for these label values (created on first use, cache it in hot paths)."""
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def render(self, name, names, values):
+        return [f"{name}{_labels_text(names, values)} {_num(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self.children[()].inc(n)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # the last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, names, values):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines, acc = [], 0
+        for le, n in zip(list(self.buckets) + ["+Inf"], counts):
+            acc += n
+            lines.append(f"{name}_bucket{_labels_text(names, values, [('le', le)])} {acc}")
+        lines.append(f"{name}_sum{_labels_text(names, values)} {_num(total)}")
+        lines.append(f"{name}_count{_labels_text(names, values)} {acc}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.bucket_bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.bucket_bounds)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def time(self):
+        """with HIST.time(): ... records the block's wall time in seconds."""
+        return _Timer(self.children[()])
+
+
+class _Timer:
+    __slots__ = ("child", "t0")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Gauge(_Metric):
+    """
+    Read at scrape time from fn, so nothing is paid per frame. fn returns a number,
+    or {label value (or tuple of them): number} for a labelled gauge.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.fn = fn
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            return [f"# {self.name} failed: {type(e).__name__}"]
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            return lines + [f"{self.name} {_num(value)}"]
+        for key, v in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            if v is not None:
+                lines.append(f"{self.name}{_labels_text(self.label_names, key)} {_num(v)}")
+        return lines
+
+
+class CounterFunc(Gauge):
+    """A counter read at scrape time, for totals something else already keeps (CPU time)."""
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.metrics = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _add(self, metric):
+        with self.lock:
+            # registering the same name twice returns the first one (modules imported by benchmarks)
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()):
+        with self.lock:
+            self.metrics.pop(self.prefix + name, None) # the newest callback wins
+        return self._add(Gauge(self.prefix + name, help, fn, labels))
+
+    def counter_func(self, name, help, fn, labels=()):
+        with self.lock:
+            self.metrics.pop(self.prefix + name, None)
+        return self._add(CounterFunc(self.prefix + name, help, fn, labels))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+
+
+def process_gauges(registry, prefix):
+    """Resident memory, CPU time and thread count of this process."""
+    def rss_bytes():
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            import resource # no /proc (macOS): peak instead of current
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+    registry.gauge(f"{prefix}process_resident_memory_bytes", "Resident memory.", rss_bytes)
+    registry.counter_func(f"{prefix}process_cpu_seconds_total", "User + system CPU time.",
+                          lambda: sum(os.times()[:2]))
+    registry.gauge(f"{prefix}process_threads", "Live Python threads.", threading.active_count)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each interval (sys._current_frames) and counts
+    them as folded stacks ("thread;file:function;... count" per line), the input of
+    flamegraph.pl and speedscope. Costs nothing until started; while running, one
+    sample of a dozen threads takes well under a millisecond.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        with self.lock:
+            if self.running():
+                return False
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.started = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+            return True
+
+    def stop(self):
+        """Stops sampling and returns the folded stacks collected since start()."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        return self.folded()
+
+    def profile(self, seconds):
+        """Samples for seconds and returns the folded stacks, None if a capture is already running."""
+        if not self.start():
+            return None
+        self.stop_event.wait(seconds)
+        return self.stop()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def save(self, out_dir, tag, folded=None):
+        os.makedirs(out_dir, exist_ok=True)
+        base = os.path.join(out_dir, f"{tag}_{time.strftime('%Y%m%d_%H%M%S')}")
+        path, n = base + ".folded", 1
+        while os.path.exists(path): # two captures within a second
+            path, n = f"{base}_{n}.folded", n + 1
+        with open(path, "w") as f:
+            f.write(self.folded() if folded is None else folded)
+        return path
+
+
+PROFILER = SamplingProfiler()
+
+
+def profile_request(args, out_dir, tag, profiler=PROFILER, max_sec=120.0):
+    """
+    The /profile toggle of both nodes, args being the query parameters:
+      ?seconds=N       sample for N seconds and return the folded stacks
+      ?action=start    start sampling in the background
+      ?action=stop     stop and return what was collected
+    Every capture is also saved under out_dir. Returns (http status, text).
+    """
+    action = args.get("action")
+    if action == "start":
+        return (200, "started\n") if profiler.start() else (409, "already running\n")
+    if action == "stop":
+        if not profiler.running():
+            return 409, "not running\n"
+        folded = profiler.stop()
+    else:
+        try:
+            seconds = min(max(float(args.get("seconds", 10)), 0.1), max_sec)
+        except ValueError:
+            return 400, "seconds must be a number\n"
+        # start-or-fail in one step: two requests at once must not share (or reset) a capture
+        folded = profiler.profile(seconds)
+        if folded is None:
+            return 409, "already running\n"
+    path = profiler.save(out_dir, tag, folded)
+    return 200, f"# {profiler.samples} samples, saved to {path}\n" + folded
+
+
+def serve(port, registry=REGISTRY, host="127.0.0.1", profile_dir="profiles", tag="profile"):
+    """/metrics and /profile over a tiny HTTP server on a daemon thread (for nodes without Flask)."""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qsl
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/metrics":
+                status, body, ctype = 200, registry.render(), CONTENT_TYPE
+            elif url.path == "/profile":
+                status, body = profile_request(dict(parse_qsl(url.query)), profile_dir, tag)
+                ctype = "text/plain; charset=utf-8"
+            else:
+                status, body, ctype = 404, "not found\n", "text/plain; charset=utf-8"
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args): # a scrape every few seconds is not worth a log line
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
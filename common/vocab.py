@@ -0,0 +1,25 @@
+# The words both nodes use for what the detector sees.
+
+# detector (COCO) class names that go by another name in the rules, mapped once when a
+# detection is made so the upload policy, the local alarm and the server all see the same name
+CLASS_ALIASES = {
+    "baseball bat": "bat",
+}
+
+
+def canonical_class(name):
+    return CLASS_ALIASES.get(name, name)
+
+
+# the default rules (server_node/rules.json can change them while the server runs; the
+# client starts from these and then follows the server's GET /rules, see threat_rules.py)
+PERSON_CLASSES = ["person"]
+BOX_CLASSES = ["box", "backpack", "package"]
+WEAPON_CLASSES = [
+    "knife", "scissors", "axe", "gun", "pistol", "rifle",
+    "bat", "hammer", "crowbar", "wrench", "screwdriver"
+]
+
+PERSON_THRESH = 0.5
+BOX_THRESH = 0.5
+WEAPON_THRESH = 0.5
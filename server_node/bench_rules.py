@@ -0,0 +1,137 @@
+# Micro-benchmark of the detection rules: per-frame evaluation cost against the number of
+# detections and rules, compiled tables vs the old if-chain (for the default rules only)
+# python bench_rules.py --dets 5 100 500 --flags 3 12 --classes 20 400
+# Results are saved to bench_results/ as JSON like bench_server.py's.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+from datetime import datetime
+
+from config import PERSON_THRESH, BOX_THRESH, WEAPON_THRESH, WEAPON_CLASSES
+from rules import CompiledRules, default_rules
+
+DANGEROUS = {"mallory", "eve"}
+PERSONS = [{"name": "alice", "type": "friend"}, {"name": None, "type": "unknown"}]
+
+
+def legacy_evaluate(dets, persons, dangerous):
+    # the if-chains server.py used before the rule engine, kept here as the baseline
+    has_person = has_box = has_weapon = False
+    for d in dets:
+        cname = d.get("class_name")
+        conf = float(d.get("confidence", 0.0))
+        if cname == "person" and conf >= PERSON_THRESH:
+            has_person = True
+        if cname in ("box", "backpack", "package") and conf >= BOX_THRESH:
+            has_box = True
+        if cname in WEAPON_CLASSES and conf >= WEAPON_THRESH:
+            has_weapon = True
+    flags = {"has_person": has_person, "has_box": has_box, "has_weapon": has_weapon}
+    severity = "normal"
+    if has_weapon and has_person:
+        any_unknown = any(p.get("type") != "friend" for p in persons) if persons else True
+        any_blacklisted = any((p.get("name") or "").lower() in dangerous for p in persons if p.get("name"))
+        severity = "danger" if any_unknown or any_blacklisted else "attention"
+    event_type = None
+    if has_person:
+        event_type = "threat" if has_weapon else "delivery" if has_box else "visitor"
+    conf = sum(float(d.get("confidence", 0.0)) for d in dets
+               if d.get("class_name") == "person" or d.get("class_name") in WEAPON_CLASSES)
+    return flags, event_type, severity, conf
+
+
+def synthetic_rules(n_flags, n_classes, rng):
+    """n_flags flags over n_classes class names (plus the default ones), every flag pair an event type."""
+    spec = default_rules(PERSON_THRESH, BOX_THRESH, WEAPON_THRESH, WEAPON_CLASSES)
+    extra = [f"class_{i}" for i in range(n_classes)]
+    if n_flags <= len(spec["flags"]):
+        return spec, extra # the defaults, extra classes only show up as detections nobody matches
+    for i in range(n_flags - len(spec["flags"])):
+        classes = rng.sample(extra, max(1, n_classes // 4))
+        spec["flags"][f"extra_{i}"] = {
+            "classes": classes, "min_conf": 0.5,
+            "class_conf": {c: round(rng.uniform(0.3, 0.8), 2) for c in classes[:5]},
+        }
+    names = list(spec["flags"])
+    pairs = [[a, b] for i, a in enumerate(names) for b in names[i + 1:]]
+    spec["event_types"] = [{"when": p, "type": "_".join(p)} for p in pairs] + spec["event_types"]
+    spec["severity"] = ([{"when": p, "persons": "dangerous", "severity": "danger"} for p in pairs]
+                        + spec["severity"])
+    return spec, extra
+
+
+def synthetic_dets(n, class_names, rng):
+    return [{"class_name": rng.choice(class_names), "class_id": 0, "confidence": round(rng.random(), 3),
+             "bbox": {"x_center": 320, "y_center": 240, "width": 50, "height": 50}} for _ in range(n)]
+
+
+def time_per_frame(fn, frames, min_sec):
+    calls = 0
+    t0 = time.perf_counter()
+    while True:
+        for dets in frames:
+            fn(dets, PERSONS, DANGEROUS)
+        calls += len(frames)
+        dt = time.perf_counter() - t0
+        if dt >= min_sec:
+            return 1e6 * dt / calls
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dets", type=int, nargs="+", default=[5, 100, 500], help="detections per frame")
+    ap.add_argument("--flags", type=int, nargs="+", default=[3, 12], help="flags in the rules (3 = the defaults)")
+    ap.add_argument("--classes", type=int, nargs="+", default=[20, 400], help="extra class names in the rules")
+    ap.add_argument("--frames", type=int, default=200, help="distinct frames cycled through")
+    ap.add_argument("--min-sec", type=float, default=0.5, help="time spent per measurement")
+    ap.add_argument("--out", default="bench_results")
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    result = {"commit": git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "args": vars(args), "runs": []}
+    print(f"{'flags':>6} {'classes':>8} {'rules':>6} {'dets':>6} {'compile ms':>11} "
+          f"{'us/frame':>9} {'legacy us':>10}")
+    for n_flags in args.flags:
+        for n_classes in args.classes:
+            spec, extra = synthetic_rules(n_flags, n_classes, rng)
+            t0 = time.perf_counter()
+            compiled = CompiledRules(spec)
+            compile_ms = 1000 * (time.perf_counter() - t0)
+            n_rules = len(spec["event_types"]) + len(spec["severity"])
+            vocab = extra + ["person", "box", "package"] + WEAPON_CLASSES
+            for n_dets in args.dets:
+                frames = [synthetic_dets(n_dets, vocab, rng) for _ in range(args.frames)]
+                us = time_per_frame(compiled.evaluate, frames, args.min_sec)
+                legacy_us = None
+                if n_flags <= 3:
+                    # same answers as the old code on every frame, or the numbers mean nothing
+                    for dets in frames:
+                        assert compiled.evaluate(dets, PERSONS, DANGEROUS)[:3] == \
+                            legacy_evaluate(dets, PERSONS, DANGEROUS)[:3]
+                    legacy_us = time_per_frame(legacy_evaluate, frames, args.min_sec)
+                result["runs"].append({"flags": len(spec["flags"]), "classes": len(compiled.by_class),
+                                       "rules": n_rules, "dets": n_dets, "compile_ms": round(compile_ms, 3),
+                                       "us_per_frame": round(us, 3),
+                                       "legacy_us_per_frame": legacy_us and round(legacy_us, 3)})
+                legacy = f"{legacy_us:>10.2f}" if legacy_us else f"{'-':>10}"
+                print(f"{len(spec['flags']):>6} {len(compiled.by_class):>8} {n_rules:>6} {n_dets:>6} "
+                      f"{compile_ms:>11.2f} {us:>9.2f} {legacy}")
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"rules_{result['commit'] or 'nogit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nsaved {path}")
@@ -0,0 +1,372 @@
+# Replay / load benchmark for /frame_result, in-process through the Flask test client,
+# or with --http through the real threaded server on a local port
+# python bench_server.py --cameras 1 4 --fps 0 --seconds 5 --history 0 10000
+# python bench_server.py --http --cameras 1 2 4 8 --history 0
+# python bench_server.py --replay ../client_node/spool --cameras 2 --fps 5
+# python bench_server.py --compare bench_results/old.json
+# Every run is saved to bench_results/ as JSON (git commit included) so runs can be compared.
+import io
+import os
+import sys
+import json
+import glob
+import time
+import struct
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import functools
+import subprocess
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import config
+
+tmp_dir = tempfile.mkdtemp(prefix="bench_server_")
+config.EVENTS_DIR = os.path.join(tmp_dir, "events")
+config.THUMBS_DIR = os.path.join(config.EVENTS_DIR, "thumbs")
+config.EVENTS_DB = os.path.join(tmp_dir, "events.db")
+config.DANGER_LIST_FILE = os.path.join(tmp_dir, "danger_list.json")
+config.DANGER_GALLERY_FILE = os.path.join(tmp_dir, "danger_gallery.npz")
+config.RETENTION_SWEEP_SEC = 3600.0 # one sweep at startup, none while measuring
+
+import requests
+from werkzeug.serving import make_server
+import server
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PERSON = {"class_name": "person", "class_id": 0, "confidence": 0.9,
+          "bbox": {"x_center": 320, "y_center": 240, "width": 200, "height": 400}}
+BOX = {"class_name": "box", "class_id": 80, "confidence": 0.8,
+       "bbox": {"x_center": 300, "y_center": 420, "width": 120, "height": 90}}
+KNIFE = {"class_name": "knife", "class_id": 43, "confidence": 0.7,
+         "bbox": {"x_center": 360, "y_center": 300, "width": 40, "height": 80}}
+
+# functions whose time is broken out in the report: (label, object, attribute)
+TIMED = [
+    ("parse_frame_request", server, "parse_frame_request"),
+    ("handle_frame", server, "handle_frame"),
+    ("event_tracker.update", server.event_tracker, "update"),
+    ("event_store.save", server.event_store, "save"),
+    ("commit_status", server, "commit_status"),
+    ("evaluate_rules", server, "evaluate_rules"),
+    ("describe_event_like", server, "describe_event_like"),
+    ("media.write_snapshot", server.media, "write_snapshot"),
+    ("notifier.publish", server.notifier, "publish"),
+]
+
+
+class FunctionTimer:
+    """Wraps module functions / bound methods in place; works across request threads."""
+    def __init__(self, targets):
+        self.lock = threading.Lock()
+        self.times = {label: [] for label, _, _ in targets}
+        self.originals = []
+        for label, owner, attr in targets:
+            fn = getattr(owner, attr)
+            self.originals.append((owner, attr, fn, attr in vars(owner)))
+            setattr(owner, attr, self._wrap(label, fn))
+
+    def _wrap(self, label, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                with self.lock:
+                    self.times[label].append(dt)
+        return timed
+
+    def reset(self):
+        with self.lock:
+            for v in self.times.values():
+                v.clear()
+
+    def report(self):
+        with self.lock:
+            return {label: summarize(v) for label, v in self.times.items() if v}
+
+    def restore(self):
+        for owner, attr, fn, own in self.originals:
+            if own:
+                setattr(owner, attr, fn)
+            else:
+                delattr(owner, attr) # was a class method, drop the instance override
+
+
+def percentile(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * q))]
+
+
+def summarize(vals):
+    vals = sorted(vals)
+    return {"calls": len(vals), "total_ms": round(1000 * sum(vals), 2),
+            "mean_ms": round(1000 * sum(vals) / len(vals), 4),
+            "p50_ms": round(1000 * percentile(vals, 0.5), 4),
+            "p99_ms": round(1000 * percentile(vals, 0.99), 4)}
+
+
+def make_jpeg(width, height, quality):
+    # a real JPEG, the server decodes it for the thumbnail: a gradient with camera-like noise
+    y, x = np.mgrid[0:height, 0:width]
+    base = (x + y)[..., None] * np.array([0.2, 0.3, 0.4]) % 256
+    noise = np.random.default_rng(0).normal(0, 12, (height, width, 3))
+    frame = (base + noise).clip(0, 255).astype(np.uint8)
+    if Image is None: # no Pillow: the server makes no thumbnails either, only the size matters
+        return b"\xff\xd8" + frame.tobytes()[:width * height // 10] + b"\xff\xd9"
+    out = io.BytesIO()
+    Image.fromarray(frame).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def synthetic_frames(jpeg, fps, camera_id, t0):
+    """Endless stream for one camera: idle, visitors, a delivery and a short threat, in a loop."""
+    step = 1.0 / fps if fps > 0 else 0.2
+    i = 0
+    while True:
+        i += 1
+        phase = (i // 20) % 6
+        dets = [[], [PERSON], [PERSON], [PERSON, BOX], [], [PERSON, KNIFE]][phase]
+        persons = [{"type": "unknown", "name": None, "distance": None, "track_id": 1}] if dets else []
+        if dets and i % 3 == 0:
+            persons.append({"type": "friend", "name": "Robert", "distance": 0.31, "track_id": 2})
+        meta = {"camera_id": camera_id, "frame_id": i,
+                "timestamp": (t0 + timedelta(seconds=step * i)).isoformat(),
+                "detections": dets, "person_info": persons}
+        yield meta, jpeg if dets else None
+
+
+def recorded_frames(paths, camera_id, t0):
+    """Replays client spool files (.frame, application/x-frame layout) in a loop."""
+    frames = []
+    for p in paths:
+        with open(p, "rb") as f:
+            body = f.read()
+        (meta_len,) = struct.unpack(">I", body[:4])
+        frames.append((json.loads(body[4:4 + meta_len]), body[4 + meta_len:] or None))
+    if not frames:
+        raise SystemExit("no .frame files to replay")
+    first = datetime.fromisoformat(frames[0][0]["timestamp"])
+    span = (datetime.fromisoformat(frames[-1][0]["timestamp"]) - first).total_seconds() + 1.0
+    loop = 0
+    while True:
+        for meta, jpeg in frames:
+            # shift each loop forward in time so events keep opening and closing
+            ts = t0 + (datetime.fromisoformat(meta["timestamp"]) - first) + timedelta(seconds=span * loop)
+            yield dict(meta, camera_id=camera_id, timestamp=ts.isoformat()), jpeg
+        loop += 1
+
+
+def encode(meta, jpeg, transport):
+    # keyword arguments for the Flask test client's post()
+    if transport == "xframe":
+        head = json.dumps(meta).encode("utf-8")
+        return {"data": struct.pack(">I", len(head)) + head + (jpeg or b""),
+                "content_type": server.RAW_FRAME_MIMETYPE}
+    data = {"meta": json.dumps(meta)}
+    if jpeg:
+        data["image"] = (io.BytesIO(jpeg), "frame.jpg", "image/jpeg")
+    return {"data": data, "content_type": "multipart/form-data"}
+
+
+def encode_http(meta, jpeg, transport):
+    # the same request for requests' post()
+    if transport == "xframe":
+        head = json.dumps(meta).encode("utf-8")
+        return {"data": struct.pack(">I", len(head)) + head + (jpeg or b""),
+                "headers": {"Content-Type": server.RAW_FRAME_MIMETYPE}}
+    files = {"meta": (None, json.dumps(meta))} # a file-less part keeps frames without an image multipart
+    if jpeg:
+        files["image"] = ("frame.jpg", jpeg, "image/jpeg")
+    return {"files": files}
+
+
+def prefill_history(n):
+    """Puts n closed events into the store so the effect of history size can be measured."""
+    with server.shared_lock:
+        start = server.next_event_id
+        server.next_event_id += n
+    t0 = datetime(2024, 6, 1)
+    types = [("visitor", "normal"), ("delivery", "normal"), ("visitor", "attention"), ("threat", "danger")]
+    for i in range(n):
+        event_type, severity = types[i % len(types)]
+        ts = (t0 + timedelta(seconds=30 * i)).isoformat()
+        server.event_store.save({
+            "event_id": start + i, "camera_id": f"cam{i % 4}", "event_type": event_type, "start_time": ts,
+            "end_time": ts, "duration_sec": 2.0, "severity": severity,
+            "objects_summary": {"person_count": 1, "box": event_type == "delivery", "weapon": event_type == "threat"},
+            "person_info": [{"type": "unknown", "name": None, "track_id": 1}], "track_ids": [1],
+            "snapshot_path": None, "caption": "", "frame_count": 10, "status": "closed", "confirmed": True})
+
+
+def camera_worker(camera_id, frames, fps, transport, url, stop, out):
+    if url: # over a socket, one keep-alive connection per camera like a client node
+        session = requests.Session()
+        post = lambda meta, jpeg: session.post(url, **encode_http(meta, jpeg, transport))
+    else:
+        client = server.app.test_client()
+        post = lambda meta, jpeg: client.post("/frame_result", **encode(meta, jpeg, transport))
+    latencies = []
+    interval = 1.0 / fps if fps > 0 else 0.0
+    next_at = time.perf_counter()
+    for meta, jpeg in frames:
+        if stop.is_set():
+            break
+        if interval:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_at += interval
+        start = time.perf_counter()
+        r = post(meta, jpeg)
+        latencies.append(time.perf_counter() - start)
+        if r.status_code != 200:
+            raise RuntimeError(r.text)
+    out[camera_id] = latencies
+
+
+def rss_peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+
+
+def run(n_cameras, seconds, fps, transport, url, make_frames, timer, run_no):
+    timer.reset()
+    stop = threading.Event()
+    out = {}
+    # every run starts a day after the previous one so no event stays open across runs
+    t0 = datetime(2025, 1, 1) + timedelta(days=run_no)
+    rss_before = rss_peak_kb()
+    mem_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    threads = [threading.Thread(target=camera_worker,
+                                args=(f"cam{i}", make_frames(f"cam{i}", t0), fps, transport, url, stop, out))
+               for i in range(n_cameras)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    server.media.flush()
+    lat = sorted(x for v in out.values() for x in v)
+    r = {
+        "cameras": n_cameras,
+        "target_fps_per_camera": fps,
+        "frames": len(lat),
+        "fps": round(len(lat) / elapsed, 1),
+        "fps_per_camera": round(len(lat) / elapsed / n_cameras, 1),
+        "p50_ms": round(1000 * percentile(lat, 0.5), 3),
+        "p99_ms": round(1000 * percentile(lat, 0.99), 3),
+        "max_ms": round(1000 * lat[-1], 3),
+        "rss_peak_growth_kb": rss_peak_kb() - rss_before,
+        "functions": timer.report(),
+        "events_in_store": server.event_store.count(),
+        "media": {k: v for k, v in server.media.stats().items() if k in ("written", "dropped", "write_ms_avg")},
+    }
+    if tracemalloc.is_tracing():
+        mem_after, mem_peak = tracemalloc.get_traced_memory()
+        r["heap_growth_kb"] = round((mem_after - mem_before) / 1024, 1)
+        r["heap_peak_kb"] = round(mem_peak / 1024, 1)
+    return r
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new):
+    with open(old_path) as f:
+        old = json.load(f)
+    old_runs = {(r["history"], r["cameras"]): r for r in old["runs"]}
+    print(f"\nvs {old_path} ({old.get('commit')})")
+    for r in new["runs"]:
+        o = old_runs.get((r["history"], r["cameras"]))
+        if o is None:
+            continue
+        print(f"  history={r['history']:>6} cameras={r['cameras']:>2}  fps {o['fps']:>8.1f} -> {r['fps']:>8.1f}"
+              f"  p99 {o['p99_ms']:>8.2f} -> {r['p99_ms']:>8.2f} ms")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cameras", type=int, nargs="+", default=[1, 4])
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--fps", type=float, default=0.0, help="per camera, 0 = as fast as possible")
+    ap.add_argument("--history", type=int, nargs="+", default=[0, 10000],
+                    help="events already in the store before each run (cumulative)")
+    ap.add_argument("--transport", choices=["multipart", "xframe"], default="multipart")
+    ap.add_argument("--http", action="store_true",
+                    help="post over HTTP to the threaded server on a local port (sockets and werkzeug included)")
+    ap.add_argument("--replay", help="directory of client spool .frame files instead of synthetic frames")
+    ap.add_argument("--size", default="640x480")
+    ap.add_argument("--quality", type=int, default=50)
+    ap.add_argument("--out", default="bench_results")
+    ap.add_argument("--compare", help="earlier result JSON to compare against")
+    ap.add_argument("--trace-memory", action="store_true",
+                    help="Python heap growth via tracemalloc (slows every request down a lot)")
+    args = ap.parse_args()
+
+    if args.replay:
+        paths = sorted(glob.glob(os.path.join(args.replay, "*.frame")))
+        make_frames = functools.partial(recorded_frames, paths)
+        jpeg_bytes = None
+    else:
+        w, h = (int(x) for x in args.size.split("x"))
+        jpeg = make_jpeg(w, h, args.quality)
+        jpeg_bytes = len(jpeg)
+        make_frames = functools.partial(synthetic_frames, jpeg, args.fps)
+
+    url = None
+    if args.http:
+        logging.getLogger("werkzeug").setLevel(logging.ERROR) # no access log line per frame
+        srv = make_server("127.0.0.1", 0, server.app, threaded=True)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{srv.server_port}/frame_result"
+
+    timer = FunctionTimer(TIMED)
+    if args.trace_memory:
+        tracemalloc.start()
+    result = {"commit": git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "args": vars(args), "jpeg_bytes": jpeg_bytes, "runs": []}
+    print(f"{'history':>8} {'cameras':>8} {'frames/s':>10} {'per cam':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS +KB':>9}")
+    filled = 0
+    for history in sorted(args.history):
+        prefill_history(history - filled)
+        filled = history
+        for n in args.cameras:
+            r = run(n, args.seconds, args.fps, args.transport, url, make_frames, timer, len(result["runs"]))
+            r["history"] = history
+            result["runs"].append(r)
+            print(f"{history:>8} {n:>8} {r['fps']:>10.1f} {r['fps_per_camera']:>9.1f} "
+                  f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['rss_peak_growth_kb']:>9}")
+    timer.restore()
+    tracemalloc.stop()
+
+    print("\nper function (last run):")
+    for label, s in result["runs"][-1]["functions"].items():
+        print(f"  {label:<22} calls={s['calls']:>7} mean={s['mean_ms']:>8.3f} ms  p99={s['p99_ms']:>8.3f} ms")
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"server_{result['commit'] or 'nogit'}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nsaved {path}")
+    if args.compare:
+        compare(args.compare, result)
+    if args.http:
+        srv.shutdown()
+    server.media.stop()
@@ -0,0 +1,107 @@
+import time
+import threading
+
+
+def default_status(camera_id):
+    return {
+        "camera_id": camera_id,
+        "current_state": "idle",
+        "danger": False,
+        "needs_attention": False,
+        "last_event_id": None,
+        "last_event_type": None,
+        "last_event_caption": None,
+        "last_event_severity": "normal",
+        "latest_snapshot_url": None,
+        "live_caption": None,
+        "threat_flag": False,
+        "threat_image": None,
+        "threat_name": None,
+        "new_person": False,
+        "person_id": None,
+        "person_ids": [],
+        "new_person_ids": [],
+        "person_snapshot_url": None,
+        "threat_snapshot_url": None,
+    }
+
+
+class CameraState:
+    """
+    Everything that belongs to one camera. Hold `lock` while reading or changing
+    status/snapshots; `cond` (same lock) wakes long-polls when the version changes.
+    """
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.status = default_status(camera_id)
+        # raw JPEG of the last new-person / threat frame, only turned into base64 for ?full=1
+        self.snapshots = {"person": None, "threat": None}
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock)
+        self.version = 0
+        self.seen = None
+        self.published = None
+        self.frames = 0
+        self.images = 0 # frames that came with a JPEG, and their total size
+        self.image_bytes = 0
+        self.updated = 0.0
+        self.client = None # what the client last said about itself (POST /client_status)
+
+    def commit(self):
+        # call with lock held after changing status: bumps the version only if something differs
+        self.updated = time.time()
+        if self.status == self.seen:
+            return False
+        self.seen = dict(self.status)
+        self.version += 1
+        self.cond.notify_all()
+        return True
+
+    def etag(self):
+        return f"{self.camera_id}-{self.version}"
+
+    def summary(self):
+        with self.lock:
+            return {
+                "camera_id": self.camera_id,
+                "current_state": self.status["current_state"],
+                "threat_flag": self.status["threat_flag"],
+                "danger": self.status["danger"],
+                "live_caption": self.status["live_caption"],
+                "status_version": self.version,
+                "frames": self.frames,
+                "images": self.images,
+                "image_bytes": self.image_bytes,
+                "last_update": self.updated,
+                "client": self.client,
+            }
+
+
+class CameraRegistry:
+    def __init__(self, default_id="cam"):
+        self.lock = threading.Lock()
+        self.cameras = {}
+        self.default_id = default_id
+
+    def get(self, camera_id):
+        camera_id = str(camera_id or self.default_id)
+        with self.lock:
+            cam = self.cameras.get(camera_id)
+            if cam is None:
+                cam = self.cameras[camera_id] = CameraState(camera_id)
+            return cam
+
+    def find(self, camera_id):
+        with self.lock:
+            return self.cameras.get(str(camera_id))
+
+    def all(self):
+        with self.lock:
+            return list(self.cameras.values())
+
+    def latest(self):
+        # the most recently updated camera (what single-camera clients call "the" status)
+        cams = self.all()
+        if not cams:
+            return self.get(self.default_id)
+        return max(cams, key=lambda c: c.updated)
@@ -2,22 +2,63 @@ import os
 
 BASE_DIR = os.path.dirname(__file__)
 EVENTS_DIR = os.path.join(BASE_DIR, "events")
-TMP_DIR = "/tmp"
+THUMBS_DIR = os.path.join(EVENTS_DIR, "thumbs")
 
 
 DANGER_LIST_FILE = os.path.join(BASE_DIR, "danger_list.json")
 
-PERSON_THRESH = 0.5
+# face embeddings of the danger list, so a returning intruder is matched to their old entry
+DANGER_GALLERY_FILE = os.path.join(BASE_DIR, "danger_gallery.npz")
 
-BOX_THRESH = 0.5
+DANGER_MATCH_THRESH = 0.5 # face distance, same scale as the client's list_thresh
 
-WEAPON_THRESH = 0.5
+DANGER_MAX_EXEMPLARS = 8 # embeddings kept per identity
 
-WEAPON_CLASSES = [
-    "knife", "scissors", "axe", "gun", "pistol", "rifle",
-    "bat", "hammer", "crowbar", "wrench", "screwdriver"
-]
+EVENTS_DB = os.path.join(BASE_DIR, "events.db")
+
+# folded stacks captured through /profile
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
+
+EVENT_RING_SIZE = 500
+
+THREAT_HISTORY_MAX = 200
+
+THUMB_WIDTH = 320
+
+MEDIA_QUEUE_MAX = 256
+
+DANGER_LIST_DEBOUNCE_SEC = 1.0
+
+# days an event (and its snapshot) is kept; the longer of type and severity wins
+RETENTION_DAYS_BY_TYPE = {"visitor": 7, "delivery": 14, "threat": 90}
+
+RETENTION_DAYS_BY_SEVERITY = {"normal": 0, "attention": 30, "danger": 90}
+
+RETENTION_DAYS_DEFAULT = 30 # event types not listed above (e.g. new ones in rules.json)
+
+MAX_MEDIA_BYTES = 2 * 1024 ** 3
+
+REENCODE_AFTER_DAYS = 3 # None to keep snapshots at their original quality
+
+REENCODE_QUALITY = 40
+
+RETENTION_SWEEP_SEC = 60.0
+
+RETENTION_BATCH = 200
+
+# detection rules (flags, event types, severity), reloaded while the server runs;
+# the thresholds below are only used while the file is missing
+RULES_FILE = os.path.join(BASE_DIR, "rules.json")
+
+RULES_CHECK_SEC = 2.0
+
+# shared with the client (common/vocab.py)
+from vocab import PERSON_CLASSES, BOX_CLASSES, WEAPON_CLASSES, PERSON_THRESH, BOX_THRESH, WEAPON_THRESH
 
 THREAT_MIN_DURATION_SEC = 1.0
 
 THREAT_COOLDOWN_SEC = 3.0
+
+# frames a client replays from its spool only go into the history; their open event
+# is closed once no replayed frame came for this long
+REPLAY_IDLE_SEC = 10.0
@@ -0,0 +1,32 @@
+import json
+import os
+import pytest
+import config
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    # server.py opens its database and media folders at import, point them at a temp dir first
+    tmp = str(tmp_path_factory.mktemp("server"))
+    config.EVENTS_DIR = os.path.join(tmp, "events")
+    config.THUMBS_DIR = os.path.join(tmp, "events", "thumbs")
+    config.EVENTS_DB = os.path.join(tmp, "events.db")
+    config.DANGER_LIST_FILE = os.path.join(tmp, "danger_list.json")
+    config.DANGER_GALLERY_FILE = os.path.join(tmp, "danger_gallery.npz")
+    config.PROFILE_DIR = os.path.join(tmp, "profiles")
+    import server
+    return server
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+def post_frame(client, camera_id, timestamp, detections, **extra):
+    meta = dict(extra, camera_id=camera_id, timestamp=timestamp, detections=detections)
+    return client.post("/frame_result", data={"meta": json.dumps(meta)}, content_type="multipart/form-data")
+
+
+def det(class_name, confidence=0.9):
+    return {"class_name": class_name, "confidence": confidence}
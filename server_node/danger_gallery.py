@@ -0,0 +1,133 @@
+import io
+import json
+import time
+import numpy as np
+
+
+class DangerGallery:
+    """
+    Face embeddings of the people on the danger list, as one float32 matrix (row -> identity
+    in `labels`) so all faces of a frame are matched with a single distance computation.
+    Raw face_recognition vectors, so distances mean what they mean on the client.
+
+    A re-sighting adds its embeddings to the identity it matched (up to max_exemplars rows
+    each, near-duplicates of a row already there are skipped), so one intruder keeps one name.
+    Not thread-safe: the server calls it with shared_lock held.
+    """
+    def __init__(self, dim=128, thresh=0.5, max_exemplars=8, dedup_dist=0.2):
+        self.dim = dim
+        self.thresh = thresh
+        self.max_exemplars = max_exemplars
+        self.dedup_dist = dedup_dist
+        self.n = 0
+        # capacity doubles when full, rows past n are unused
+        self.rows = np.zeros((64, dim), dtype=np.float32)
+        self.sq_norms = np.zeros(64, dtype=np.float32)
+        self.labels = np.zeros(64, dtype=np.int32)
+        self.identities = [] # identity index -> {"name", "first_seen", "last_seen", "sightings", "last_event", "exemplars"}
+        self.by_name = {}
+
+    def __len__(self):
+        return len(self.identities)
+
+    def names(self):
+        return [ident["name"] for ident in self.identities]
+
+    def _prep(self, embeddings):
+        return np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+
+    def _dist(self, q, rows=slice(None)):
+        vecs, sq = self.rows[:self.n][rows], self.sq_norms[:self.n][rows]
+        # |q - g|^2 = |q|^2 + |g|^2 - 2 q.g, one matmul for the whole batch
+        d2 = np.einsum("ij,ij->i", q, q)[:, None] + sq[None, :] - 2.0 * (q @ vecs.T)
+        return np.sqrt(np.maximum(d2, 0.0))
+
+    def match(self, embeddings):
+        """Best identity per embedding: list of (name or None, distance or None)."""
+        q = self._prep(embeddings)
+        if self.n == 0 or len(q) == 0:
+            return [(None, None)] * len(q)
+        d = self._dist(q)
+        best = np.argmin(d, axis=1)
+        out = []
+        for qi, row in enumerate(best):
+            dist = float(d[qi, row])
+            name = self.identities[self.labels[row]]["name"] if dist < self.thresh else None
+            out.append((name, dist))
+        return out
+
+    def add(self, name, embeddings=(), event_id=None, now=None):
+        """
+        Creates the identity if needed and merges the embeddings into it. A new event_id
+        counts as a new sighting. Returns True if anything worth saving changed.
+        """
+        now = time.time() if now is None else now
+        idx = self.by_name.get(name)
+        changed = idx is None
+        if idx is None:
+            idx = self.by_name[name] = len(self.identities)
+            self.identities.append({"name": name, "first_seen": now, "last_seen": now, "sightings": 0,
+                                    "last_event": None, "exemplars": 0})
+        ident = self.identities[idx]
+        ident["last_seen"] = now
+        if event_id is not None and event_id != ident["last_event"]:
+            ident["last_event"] = event_id
+            ident["sightings"] += 1
+            changed = True
+        for e in self._prep(embeddings):
+            if ident["exemplars"] >= self.max_exemplars:
+                break
+            own = np.flatnonzero(self.labels[:self.n] == idx)
+            if len(own) and self._dist(e[None, :], own).min() < self.dedup_dist:
+                continue
+            self._append(e, idx)
+            ident["exemplars"] += 1
+            changed = True
+        return changed
+
+    def _append(self, vec, label):
+        if self.n == len(self.rows):
+            cap = 2 * len(self.rows)
+            self.rows = np.resize(self.rows, (cap, self.dim))
+            self.sq_norms = np.resize(self.sq_norms, cap)
+            self.labels = np.resize(self.labels, cap)
+        self.rows[self.n] = vec
+        self.sq_norms[self.n] = vec @ vec
+        self.labels[self.n] = label
+        self.n += 1
+
+    def remove(self, name):
+        idx = self.by_name.pop(name, None)
+        if idx is None:
+            return False
+        keep = np.flatnonzero(self.labels[:self.n] != idx)
+        labels = self.labels[keep]
+        labels[labels > idx] -= 1
+        self.n = len(keep)
+        self.rows[:self.n] = self.rows[keep]
+        self.sq_norms[:self.n] = self.sq_norms[keep]
+        self.labels[:self.n] = labels
+        del self.identities[idx]
+        self.by_name = {ident["name"]: i for i, ident in enumerate(self.identities)}
+        return True
+
+    def info(self):
+        return [{k: v for k, v in ident.items() if k != "last_event"} for ident in self.identities]
+
+    # ---- persistence ----
+    def to_bytes(self):
+        buf = io.BytesIO()
+        np.savez(buf, rows=self.rows[:self.n], labels=self.labels[:self.n],
+                 identities=np.array(json.dumps(self.identities)))
+        return buf.getvalue()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        data = np.load(path)
+        rows = data["rows"]
+        gallery = cls(dim=rows.shape[1], **kwargs)
+        gallery.identities = json.loads(str(data["identities"]))
+        gallery.by_name = {ident["name"]: i for i, ident in enumerate(gallery.identities)}
+        for vec, label in zip(rows, data["labels"]):
+            gallery._append(vec, label)
+        return gallery
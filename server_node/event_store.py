@@ -0,0 +1,242 @@
+import json
+import sqlite3
+import threading
+import collections
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id      INTEGER PRIMARY KEY,
+    camera_id     TEXT,
+    event_type    TEXT NOT NULL,
+    severity      TEXT NOT NULL,
+    start_ts      REAL NOT NULL,
+    end_ts        REAL NOT NULL,
+    status        TEXT,
+    snapshot_path TEXT,
+    data          TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_start ON events(start_ts);
+CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type, start_ts);
+CREATE INDEX IF NOT EXISTS idx_events_severity ON events(severity, start_ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS event_persons (
+    event_id INTEGER NOT NULL,
+    person   TEXT NOT NULL,
+    PRIMARY KEY (person, event_id)
+);
+"""
+
+
+def to_ts(iso):
+    try:
+        return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
+    except Exception:
+        return 0.0
+
+
+def person_names(ev):
+    return sorted({p["name"].lower() for p in ev.get("person_info") or [] if p.get("name")})
+
+
+class EventStore:
+    """
+    Events in SQLite (WAL mode, indexed on time, type, severity and person).
+    The ring_size newest events (by event_id, kept in id order) also stay in memory,
+    and the threat snapshot history is kept up to date on every write instead of
+    rescanning all events.
+    """
+    def __init__(self, path, ring_size=500, threat_history_max=200):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # events left open by a previous run will never get their closing frame
+        self.conn.execute("UPDATE events SET status = 'closed' WHERE status = 'open'")
+        self.conn.commit()
+        self.ring = collections.OrderedDict()
+        self.ring_size = ring_size
+        self.threat_history = collections.deque(maxlen=threat_history_max) # newest first
+        rows = self.conn.execute("SELECT data FROM events ORDER BY event_id DESC LIMIT ?", (ring_size,)).fetchall()
+        for (data,) in reversed(rows):
+            ev = json.loads(data)
+            ev["status"] = "closed"
+            self.ring[ev["event_id"]] = ev
+        rows = self.conn.execute(
+            "SELECT snapshot_path FROM events WHERE event_type = 'threat' AND snapshot_path IS NOT NULL "
+            "ORDER BY event_id DESC LIMIT ?", (threat_history_max,)).fetchall()
+        self.threat_history.extend(r[0] for r in rows)
+
+    def max_event_id(self):
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(event_id) FROM events").fetchone()
+        return row[0] or 0
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def save(self, ev):
+        """Insert or update one event (same dict can be saved again as it grows)."""
+        data = json.dumps(ev)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO events (event_id, camera_id, event_type, severity, start_ts, end_ts, "
+                "status, snapshot_path, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ev["event_id"], ev.get("camera_id"), ev["event_type"], ev["severity"],
+                 to_ts(ev["start_time"]), to_ts(ev["end_time"]), ev.get("status"),
+                 ev.get("snapshot_path"), data))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO event_persons (event_id, person) VALUES (?, ?)",
+                [(ev["event_id"], name) for name in person_names(ev)])
+            self.conn.commit()
+            eid = ev["event_id"]
+            out_of_order = eid not in self.ring and self.ring and eid < next(reversed(self.ring))
+            self.ring[eid] = ev
+            if out_of_order:
+                # first saved after a newer event (another camera's): the ring stays in event_id
+                # order, so recent() and its paging cursor match query()
+                self.ring = collections.OrderedDict(sorted(self.ring.items()))
+            while len(self.ring) > self.ring_size:
+                self.ring.popitem(last=False)
+            snap = ev.get("snapshot_path")
+            if ev["event_type"] == "threat" and snap and snap not in self.threat_history:
+                self.threat_history.appendleft(snap)
+
+    def recent(self, limit):
+        with self.lock:
+            if limit <= len(self.ring):
+                return list(self.ring.values())[-limit:] if limit > 0 else []
+        events, _ = self.query(limit=limit)
+        return events
+
+    def query(self, since=None, until=None, types=None, person=None, severity=None,
+              camera_id=None, before=None, limit=100):
+        """
+        Newest-first pages: returns (events oldest->newest, cursor for the next older page or None).
+        before is the cursor of the previous page (an event_id).
+        """
+        where, args = [], []
+        if since is not None:
+            where.append("e.start_ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("e.start_ts <= ?")
+            args.append(until)
+        if types:
+            where.append(f"e.event_type IN ({','.join('?' * len(types))})")
+            args.extend(types)
+        if severity:
+            where.append("e.severity = ?")
+            args.append(severity)
+        if camera_id:
+            where.append("e.camera_id = ?")
+            args.append(camera_id)
+        if before is not None:
+            where.append("e.event_id < ?")
+            args.append(before)
+        sql = "SELECT e.event_id, e.data FROM events e"
+        if person:
+            sql += " JOIN event_persons p ON p.event_id = e.event_id AND p.person = ?"
+            args.insert(0, person.lower())
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY e.event_id DESC LIMIT ?"
+        args.append(limit + 1)
+        with self.lock:
+            rows = self.conn.execute(sql, args).fetchall()
+            # live (still open) events are newer in memory than in the database
+            events = [self.ring.get(eid) or json.loads(data) for eid, data in rows[:limit]]
+        cursor = events[-1]["event_id"] if len(rows) > limit else None
+        events.reverse()
+        return events, cursor
+
+    # ---- retention support ----
+    def event_types(self):
+        with self.lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT event_type FROM events")]
+
+    def expired(self, event_type, severity, cutoff_ts, limit):
+        with self.lock:
+            return [r[0] for r in self.conn.execute(
+                "SELECT event_id FROM events WHERE event_type = ? AND severity = ? AND end_ts < ? "
+                "AND status = 'closed' ORDER BY end_ts LIMIT ?",
+                (event_type, severity, cutoff_ts, limit))]
+
+    def snapshots_by_priority(self, rank_sql, limit, before_ts=None, after_id=None):
+        """(event_id, snapshot_path, end_ts) of closed events with media, ordered by rank_sql then age."""
+        sql = ("SELECT event_id, snapshot_path, end_ts FROM events "
+               "WHERE snapshot_path IS NOT NULL AND status = 'closed'")
+        args = []
+        if before_ts is not None:
+            sql += " AND end_ts < ?"
+            args.append(before_ts)
+        if after_id is not None:
+            sql += " AND event_id > ?"
+            args.append(after_id)
+        sql += f" ORDER BY {rank_sql}, end_ts LIMIT ?" if rank_sql else " ORDER BY event_id LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def delete(self, event_ids):
+        """Removes events; returns their snapshot paths so the caller can drop the media."""
+        if not event_ids:
+            return []
+        marks = ",".join("?" * len(event_ids))
+        with self.lock:
+            snaps = [r[0] for r in self.conn.execute(
+                f"SELECT snapshot_path FROM events WHERE event_id IN ({marks}) AND snapshot_path IS NOT NULL",
+                event_ids)]
+            self.conn.execute(f"DELETE FROM events WHERE event_id IN ({marks})", event_ids)
+            self.conn.execute(f"DELETE FROM event_persons WHERE event_id IN ({marks})", event_ids)
+            self.conn.commit()
+            for eid in event_ids:
+                self.ring.pop(eid, None)
+            self._forget_snapshots(snaps)
+        return snaps
+
+    def clear_snapshots(self, event_ids):
+        """The media of these events is gone, the events stay."""
+        if not event_ids:
+            return
+        marks = ",".join("?" * len(event_ids))
+        with self.lock:
+            rows = self.conn.execute(f"SELECT event_id, data, snapshot_path FROM events WHERE event_id IN ({marks})",
+                                     event_ids).fetchall()
+            updates = []
+            for eid, data, snap in rows:
+                ev = json.loads(data)
+                ev["snapshot_path"] = ev["snapshot_roi"] = None
+                updates.append((json.dumps(ev), eid))
+                if eid in self.ring:
+                    self.ring[eid]["snapshot_path"] = self.ring[eid]["snapshot_roi"] = None
+            self.conn.executemany("UPDATE events SET snapshot_path = NULL, data = ? WHERE event_id = ?", updates)
+            self.conn.commit()
+            self._forget_snapshots([r[2] for r in rows if r[2]])
+
+    def _forget_snapshots(self, snaps):
+        # call with lock held
+        gone = set(snaps)
+        if gone & set(self.threat_history):
+            kept = [s for s in self.threat_history if s not in gone]
+            self.threat_history.clear()
+            self.threat_history.extend(kept)
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
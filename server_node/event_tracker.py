@@ -0,0 +1,123 @@
+import threading
+
+SEVERITY_RANK = {"normal": 0, "attention": 1, "danger": 2}
+
+
+def merge_persons(old, new):
+    # keep one entry per track (or name), newest info wins
+    merged = {}
+    for p in old + new:
+        key = p.get("track_id") or (p.get("name") or "").lower() or id(p)
+        merged[key] = p
+    return list(merged.values())
+
+
+class EventTracker:
+    """
+    One open event per camera. Frames of the same situation (same event type, gaps no
+    longer than cooldown_sec) extend the open event instead of creating a new one.
+    Threat events only count once they lasted min_duration_sec; shorter ones are
+    discarded when they close. A frame older than the open event's last frame (a
+    reordered or late upload) is counted in stats["late"] and changes nothing.
+    """
+    def __init__(self, next_id, min_duration_sec, cooldown_sec):
+        self.next_id = next_id
+        self.min_duration_sec = min_duration_sec
+        self.cooldown_sec = cooldown_sec
+        self.open = {} # camera_id -> {"event", "last_seen", "best_score"}
+        self.lock = threading.Lock()
+        self.stats = {"frames": 0, "opened": 0, "closed": 0, "discarded": 0, "late": 0}
+
+    def update(self, camera_id, ts, event_type, severity, objs, persons, caption, score):
+        """
+        Returns a dict:
+          event       the camera's current event (may be None)
+          started     a new event was opened by this frame
+          confirmed   the event just became confirmed (goes into the history now)
+          best        this frame is the best snapshot of the event so far (score None: frame has no image)
+          closed      events closed by this frame (a closed, unconfirmed event has "discarded": True)
+          late        the frame is older than the open event's last frame and was ignored
+        Frames of one camera must not be passed in concurrently (the server holds the camera's lock).
+        """
+        with self.lock:
+            self.stats["frames"] += 1
+        out = {"event": None, "started": False, "confirmed": False, "best": False, "closed": [], "late": False}
+        cur = self.open.get(camera_id)
+        if cur is not None and ts < cur["last_seen"]:
+            # never move the event backwards (end_time before start_time, negative durations)
+            with self.lock:
+                self.stats["late"] += 1
+            out["late"] = True
+            return out
+        if cur is not None:
+            gap = (ts - cur["last_seen"]).total_seconds()
+            if gap > self.cooldown_sec or (event_type is not None and event_type != cur["event"]["event_type"]):
+                out["closed"].append(self.close(camera_id))
+                cur = None
+
+        if event_type is None:
+            out["event"] = cur["event"] if cur else None
+            return out
+
+        if cur is None:
+            ev = {
+                "event_id": self.next_id(),
+                "camera_id": camera_id,
+                "event_type": event_type,
+                "start_time": ts.isoformat(),
+                "end_time": ts.isoformat(),
+                "duration_sec": 0.0,
+                "severity": severity,
+                "objects_summary": dict(objs),
+                "person_info": list(persons),
+                "track_ids": [],
+                "snapshot_path": None,
+                "snapshot_roi": None,
+                "caption": caption,
+                "frame_count": 0,
+                "status": "open",
+                "confirmed": False,
+            }
+            cur = {"event": ev, "start": ts, "last_seen": ts, "best_score": None}
+            with self.lock:
+                self.open[camera_id] = cur
+                self.stats["opened"] += 1
+            out["started"] = True
+
+        ev = cur["event"]
+        cur["last_seen"] = ts
+        ev["end_time"] = ts.isoformat()
+        ev["duration_sec"] = round((ts - cur["start"]).total_seconds(), 2)
+        ev["frame_count"] += 1
+        if not out["started"]:
+            ev["person_info"] = merge_persons(ev["person_info"], persons)
+            summary = ev["objects_summary"]
+            summary["person_count"] = max(summary["person_count"], objs["person_count"])
+            summary["box"] = summary["box"] or objs["box"]
+            summary["weapon"] = summary["weapon"] or objs["weapon"]
+            if SEVERITY_RANK.get(severity, 0) >= SEVERITY_RANK.get(ev["severity"], 0):
+                ev["severity"] = severity
+                ev["caption"] = caption
+        ev["track_ids"] = sorted({p["track_id"] for p in ev["person_info"] if p.get("track_id") is not None})
+
+        if score is not None and (cur["best_score"] is None or score > cur["best_score"]):
+            cur["best_score"] = score
+            out["best"] = True
+
+        if not ev["confirmed"] and (event_type != "threat" or ev["duration_sec"] >= self.min_duration_sec):
+            ev["confirmed"] = True
+            out["confirmed"] = True
+        out["event"] = ev
+        return out
+
+    def close(self, camera_id):
+        with self.lock:
+            cur = self.open.pop(camera_id)
+            self.stats["closed"] += 1
+            if not cur["event"]["confirmed"]:
+                self.stats["discarded"] += 1
+        ev = cur["event"]
+        ev["status"] = "closed"
+        if not ev["confirmed"]:
+            ev["discarded"] = True
+        return ev
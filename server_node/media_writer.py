@@ -0,0 +1,233 @@
+import io
+import os
+import json
+import time
+import threading
+import collections
+from metrics import REGISTRY
+
+try:
+    from PIL import Image
+except ImportError: # thumbnails are optional, the full image is served instead
+    Image = None
+
+
+WRITE_SECONDS = REGISTRY.histogram("server_media_write_seconds", "Snapshot + thumbnail write or delete.", ("op",))
+
+
+def atomic_write(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def make_thumbnail(jpeg_bytes, width, quality=70):
+    if Image is None:
+        return None
+    img = Image.open(io.BytesIO(jpeg_bytes))
+    if img.width > width:
+        img = img.resize((width, max(1, round(img.height * width / img.width))))
+    out = io.BytesIO()
+    img.convert("RGB").save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+class Replacement(bytes):
+    """A smaller copy of a snapshot that is already on disk (retention's re-encode):
+    written without a new thumbnail, and dropping it from a full queue loses nothing."""
+
+
+class MediaWriter(threading.Thread):
+    """
+    Writes event snapshots (plus a thumbnail) and the danger list on a background
+    thread so the request thread never waits on the disk.
+    Jobs are keyed by file name: a newer write or a delete for the same file replaces
+    the pending one. The danger list (and its face gallery) is written at most once
+    per debounce_sec. Past max_pending the oldest queued write is dropped (deletes are
+    kept, they hold no bytes); it is logged and on_drop(fn) is called so the event
+    does not keep pointing at a file that will never exist (a dropped replace() only
+    loses the saving).
+    """
+    def __init__(self, events_dir, thumbs_dir, danger_list_file,
+                 thumb_width=320, max_pending=256, debounce_sec=1.0, danger_gallery_file=None,
+                 on_drop=None):
+        super().__init__(name="media-writer", daemon=True)
+        self.events_dir = events_dir
+        self.thumbs_dir = thumbs_dir
+        self.danger_list_file = danger_list_file
+        self.danger_gallery_file = danger_gallery_file
+        self.thumb_width = thumb_width
+        self.max_pending = max_pending
+        self.debounce_sec = debounce_sec
+        self.on_drop = on_drop
+        os.makedirs(events_dir, exist_ok=True)
+        os.makedirs(thumbs_dir, exist_ok=True)
+
+        self.cond = threading.Condition()
+        self.pending = collections.OrderedDict() # file name -> bytes, or None to delete
+        self.danger_names = None
+        self.danger_gallery = None
+        self.danger_due = 0.0
+        self.busy = False
+        self.in_flight = None # file name the worker is writing, it is past dropping
+        self.stopped = False
+        self.counters = {"written": 0, "bytes": 0, "thumbnails": 0, "deleted": 0, "coalesced": 0,
+                         "dropped": 0, "errors": 0, "danger_list_writes": 0, "write_ms_total": 0.0,
+                         "write_ms_max": 0.0}
+
+    # ---- called from request threads, never block on disk ----
+    def write_snapshot(self, fn, data):
+        self._put(fn, data)
+
+    def delete(self, fn):
+        self._put(fn, None)
+
+    def replace(self, fn, data):
+        self._put(fn, Replacement(data))
+
+    def write_danger_list(self, names, gallery=None):
+        # gallery: the serialized DangerGallery, replaces the pending one like the names do
+        with self.cond:
+            if self.danger_names is None:
+                self.danger_due = time.time() + self.debounce_sec
+            self.danger_names = list(names)
+            if gallery is not None:
+                self.danger_gallery = gallery
+            self.cond.notify()
+
+    def pending_bytes(self, fn):
+        # lets the image route answer before the file is on disk
+        with self.cond:
+            return self.pending.get(fn)
+
+    def _put(self, fn, data):
+        dropped = []
+        with self.cond:
+            if fn in self.pending:
+                self.counters["coalesced"] += 1
+                del self.pending[fn]
+            self.pending[fn] = data
+            while len(self.pending) > self.max_pending:
+                victim = next((k for k, v in self.pending.items() if v is not None and k != self.in_flight), None)
+                if victim is None:
+                    break
+                dropped.append((victim, self.pending.pop(victim)))
+                self.counters["dropped"] += 1
+            self.cond.notify()
+        for victim, data in dropped:
+            if isinstance(data, Replacement):
+                continue # the original is still on disk
+            print(f"Media queue full ({self.max_pending}), dropped the write of {victim}")
+            if self.on_drop is not None:
+                self.on_drop(victim)
+
+    # ---- worker ----
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self._danger_due() and not self.stopped:
+                    timeout = max(0.0, self.danger_due - time.time()) if self.danger_names is not None else None
+                    self.cond.wait(timeout)
+                if self.stopped and not self.pending and self.danger_names is None:
+                    return
+                job = None
+                if self.pending:
+                    fn, data = next(iter(self.pending.items()))
+                    job = (fn, data)
+                    self.in_flight = fn
+                danger = None
+                if self._danger_due() or (self.stopped and self.danger_names is not None):
+                    danger = (self.danger_names, self.danger_gallery)
+                    self.danger_names = self.danger_gallery = None
+                self.busy = True
+            try:
+                if job is not None:
+                    self._do(*job)
+                if danger is not None:
+                    self._write_danger_list(*danger)
+            finally:
+                with self.cond:
+                    # the job leaves the pending map only once it is on disk (see pending_bytes)
+                    if job is not None and self.pending.get(job[0], 0) is job[1]:
+                        del self.pending[job[0]]
+                    self.in_flight = None
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def _danger_due(self):
+        return self.danger_names is not None and time.time() >= self.danger_due
+
+    def _do(self, fn, data):
+        path = os.path.join(self.events_dir, fn)
+        thumb = os.path.join(self.thumbs_dir, fn)
+        t0 = time.perf_counter()
+        try:
+            if data is None:
+                for p in (path, thumb):
+                    if os.path.exists(p):
+                        os.remove(p)
+                self.counters["deleted"] += 1
+                return
+            atomic_write(path, data)
+            self.counters["written"] += 1
+            self.counters["bytes"] += len(data)
+            if isinstance(data, Replacement): # the thumbnail of the original stays
+                return
+            small = make_thumbnail(data, self.thumb_width)
+            if small is not None:
+                atomic_write(thumb, small)
+                self.counters["thumbnails"] += 1
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"Media write failed for {fn}: {e}")
+        finally:
+            WRITE_SECONDS.labels("delete" if data is None else "write").observe(time.perf_counter() - t0)
+            ms = 1000.0 * (time.perf_counter() - t0)
+            self.counters["write_ms_total"] += ms
+            self.counters["write_ms_max"] = max(self.counters["write_ms_max"], ms)
+
+    def _write_danger_list(self, names, gallery=None):
+        try:
+            atomic_write(self.danger_list_file, json.dumps(sorted(names), indent=2).encode("utf-8"))
+            if gallery is not None and self.danger_gallery_file:
+                atomic_write(self.danger_gallery_file, gallery)
+            self.counters["danger_list_writes"] += 1
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"Danger list write failed: {e}")
+
+    def wait_for(self, fns, timeout=5.0):
+        """Waits until none of fns is queued or being written. True if they all got done."""
+        fns = set(fns)
+        deadline = time.time() + timeout
+        with self.cond:
+            while fns & self.pending.keys() and time.time() < deadline:
+                self.cond.wait(0.05)
+            return not fns & self.pending.keys()
+
+    def flush(self, timeout=5.0):
+        """Waits until everything queued is on disk (danger list included)."""
+        deadline = time.time() + timeout
+        with self.cond:
+            self.danger_due = 0.0
+            self.cond.notify_all()
+            while (self.pending or self.busy or self.danger_names is not None) and time.time() < deadline:
+                self.cond.wait(0.05)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.join(timeout=5.0)
+
+    def stats(self):
+        with self.cond:
+            out = dict(self.counters)
+            out["queue_depth"] = len(self.pending)
+            out["danger_list_pending"] = self.danger_names is not None
+        done = out["written"] + out["deleted"]
+        out["write_ms_avg"] = round(out.pop("write_ms_total") / done, 2) if done else 0.0
+        out["write_ms_max"] = round(out["write_ms_max"], 2)
+        out["thumbnails_enabled"] = Image is not None
+        return out
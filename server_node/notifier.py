@@ -0,0 +1,56 @@
+import json
+import queue
+import threading
+
+
+class Notifier:
+    """
+    Fan-out of change messages to Server-Sent Events subscribers.
+    Every subscriber has its own bounded queue; a subscriber that does not keep up
+    is dropped (its browser reconnects and reloads the full state).
+    """
+    def __init__(self, max_queue=256, heartbeat_sec=15.0):
+        self.max_queue = max_queue
+        self.heartbeat_sec = heartbeat_sec
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.seq = 0
+
+    def publish(self, kind, data):
+        with self.lock:
+            if not self.subscribers:
+                return
+            self.seq += 1
+            msg = f"id: {self.seq}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+            for q in list(self.subscribers):
+                try:
+                    q.put_nowait(msg)
+                except queue.Full:
+                    self.subscribers.discard(q)
+                    with q.mutex:
+                        q.queue.clear()
+                    q.put_nowait(None) # ends that stream
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def stream(self):
+        """Generator for a Flask streaming response. Blocks (no CPU) while nothing changes."""
+        q = queue.Queue(self.max_queue)
+        with self.lock:
+            self.subscribers.add(q)
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    msg = q.get(timeout=self.heartbeat_sec)
+                except queue.Empty:
+                    yield ": keepalive\n\n" # also lets us notice closed connections
+                    continue
+                if msg is None:
+                    return
+                yield msg
+        finally:
+            with self.lock:
+                self.subscribers.discard(q)
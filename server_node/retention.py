@@ -0,0 +1,193 @@
+import io
+import os
+import time
+import shutil
+import threading
+
+from media_writer import Image
+
+SEVERITIES = ("normal", "attention", "danger")
+
+# when the quota is hit, media of normal events goes first, danger last
+PRIORITY_SQL = "CASE severity WHEN 'danger' THEN 2 WHEN 'attention' THEN 1 ELSE 0 END"
+
+
+def dir_usage(path):
+    total, files = 0, 0
+    for root, _, names in os.walk(path):
+        for fn in names:
+            try:
+                total += os.path.getsize(os.path.join(root, fn))
+                files += 1
+            except OSError:
+                pass
+    return total, files
+
+
+class RetentionManager(threading.Thread):
+    """
+    Background sweeper for events and their snapshots. Every sweep does a bounded
+    amount of work (batch events per step) and runs again right away if it had to stop
+    early, so a large backlog is worked off incrementally without long pauses.
+      - age: an event is deleted (row and media) once it is older than the longer of
+        its type's (default_days for a type not in type_days) and its severity's retention
+      - quota: above max_bytes the media of the least important, oldest events is
+        deleted; the events stay, with snapshot_path cleared
+      - re-encode: snapshots older than reencode_after_days are re-saved at a lower
+        JPEG quality (needs Pillow)
+    Deletes and re-encodes go through the MediaWriter like every other media write;
+    disk usage is measured once the deletes queued so far are done.
+    """
+    def __init__(self, store, media, events_dir, type_days, severity_days, max_bytes,
+                 reencode_after_days=None, reencode_quality=40, interval_sec=60.0, batch=200,
+                 default_days=30):
+        super().__init__(name="retention", daemon=True)
+        self.store = store
+        self.media = media
+        self.events_dir = events_dir
+        self.type_days = type_days
+        self.severity_days = severity_days
+        self.default_days = default_days
+        self.max_bytes = max_bytes
+        self.reencode_after_days = reencode_after_days
+        self.reencode_quality = reencode_quality
+        self.interval_sec = interval_sec
+        self.batch = batch
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.queued = set() # file names handed to media.delete() since usage was last measured
+        self.usage_bytes, self.usage_files = dir_usage(events_dir)
+        self.counters = {"sweeps": 0, "events_deleted": 0, "media_deleted": 0, "bytes_freed": 0,
+                         "reencoded": 0, "reencode_bytes_saved": 0, "last_sweep": None,
+                         "last_sweep_sec": 0.0, "last_sweep_items": 0}
+
+    def retention_days(self, event_type, severity):
+        return max(self.type_days.get(event_type, self.default_days), self.severity_days.get(severity, 0))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            more = self.sweep()
+            # unfinished backlog: keep going after a short breather
+            self.stop_event.wait(1.0 if more else self.interval_sec)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(timeout=5.0)
+
+    def sweep(self, now=None):
+        """One bounded pass. Returns True when there is more work left."""
+        now = time.time() if now is None else now
+        t0 = time.perf_counter()
+        items, more = 0, False
+
+        budget = self.batch
+        # the types in the store, not only the configured ones: rules.json can add new ones
+        for event_type in sorted(set(self.type_days) | set(self.store.event_types())):
+            for severity in SEVERITIES:
+                if budget <= 0:
+                    more = True
+                    break
+                cutoff = now - 86400 * self.retention_days(event_type, severity)
+                ids = self.store.expired(event_type, severity, cutoff, budget)
+                if not ids:
+                    continue
+                snaps = self.store.delete(ids)
+                self._drop_media(snaps)
+                budget -= len(ids)
+                items += len(ids)
+                with self.lock:
+                    self.counters["events_deleted"] += len(ids)
+
+        # files still waiting in the media queue would be counted (and evicted) twice:
+        # measure once they are gone, or leave the quota to the next sweep
+        if not self.media.wait_for(self.queued):
+            more = True
+        else:
+            self.queued.clear()
+            self.usage_bytes, self.usage_files = dir_usage(self.events_dir)
+            if self.max_bytes and self.usage_bytes > self.max_bytes:
+                rows = self.store.snapshots_by_priority(PRIORITY_SQL, self.batch)
+                freed_ids = []
+                for eid, snap, _ in rows:
+                    if self.usage_bytes <= self.max_bytes:
+                        break
+                    self.usage_bytes -= self._drop_media([snap])
+                    freed_ids.append(eid)
+                self.store.clear_snapshots(freed_ids)
+                items += len(freed_ids)
+                # nothing left to free (e.g. only open events have media): wait for the next sweep
+                more = more or (self.usage_bytes > self.max_bytes and len(rows) == self.batch)
+
+        if self.reencode_after_days is not None and Image is not None:
+            done, left = self._reencode(now)
+            items += done
+            more = more or left
+
+        with self.lock:
+            self.counters["sweeps"] += 1
+            self.counters["last_sweep"] = now
+            self.counters["last_sweep_sec"] = round(time.perf_counter() - t0, 4)
+            self.counters["last_sweep_items"] = items
+        return more
+
+    def _drop_media(self, snaps):
+        freed = 0
+        for snap in snaps:
+            fn = os.path.basename(snap)
+            for path in (os.path.join(self.events_dir, fn), os.path.join(self.media.thumbs_dir, fn)):
+                try:
+                    freed += os.path.getsize(path)
+                except OSError:
+                    pass
+            self.media.delete(fn)
+            self.queued.add(fn)
+        with self.lock:
+            self.counters["media_deleted"] += len(snaps)
+            self.counters["bytes_freed"] += freed
+        return freed
+
+    def _reencode(self, now):
+        # walks closed events in id order; the position survives restarts in the store's meta table
+        cursor = int(self.store.get_meta("reencode_cursor", 0))
+        cutoff = now - 86400 * self.reencode_after_days
+        rows = self.store.snapshots_by_priority(None, self.batch, after_id=cursor)
+        done = 0
+        for eid, snap, end_ts in rows:
+            if end_ts >= cutoff:
+                return done, False # ids grow with time, the rest is newer still
+            path = os.path.join(self.events_dir, os.path.basename(snap))
+            try:
+                with open(path, "rb") as f:
+                    before = f.read()
+                img = Image.open(io.BytesIO(before))
+                out = io.BytesIO()
+                img.convert("RGB").save(out, "JPEG", quality=self.reencode_quality, optimize=True)
+                if len(out.getvalue()) < len(before):
+                    self.media.replace(os.path.basename(snap), out.getvalue())
+                    with self.lock:
+                        self.counters["reencoded"] += 1
+                        self.counters["reencode_bytes_saved"] += len(before) - len(out.getvalue())
+            except (OSError, ValueError):
+                pass
+            self.store.set_meta("reencode_cursor", eid)
+            done += 1
+        return done, len(rows) == self.batch
+
+    def stats(self):
+        with self.lock:
+            out = dict(self.counters)
+        out["usage_bytes"] = self.usage_bytes
+        out["usage_files"] = self.usage_files
+        out["quota_bytes"] = self.max_bytes
+        out["quota_used"] = round(self.usage_bytes / self.max_bytes, 4) if self.max_bytes else None
+        try:
+            disk = shutil.disk_usage(self.events_dir)
+            out["disk_free_bytes"] = disk.free
+            out["disk_total_bytes"] = disk.total
+        except OSError:
+            pass
+        out["sweep_rate_per_sec"] = (round(out["last_sweep_items"] / out["last_sweep_sec"], 1)
+                                     if out["last_sweep_sec"] else 0.0)
+        out["policy"] = {"type_days": self.type_days, "default_days": self.default_days,
+                         "severity_days": self.severity_days, "reencode_after_days": self.reencode_after_days}
+        return out
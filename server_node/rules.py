@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import threading
+
+MAX_FLAGS = 12 # the per-frame tables have 2 ** flags entries
+PERSON_CONDITIONS = ("unknown", "dangerous", "unknown_or_dangerous", "friends_only")
+REQUIRED_FLAGS = ("person", "weapon") # the server reads has_person / has_weapon on every frame
+
+
+def default_rules(person_thresh, box_thresh, weapon_thresh, weapon_classes,
+                  person_classes=("person",), box_classes=("box", "backpack", "package")):
+    """What the server always did, used while there is no rules file."""
+    return {
+        "flags": {
+            "person": {"classes": list(person_classes), "min_conf": person_thresh},
+            "box": {"classes": list(box_classes), "min_conf": box_thresh},
+            "weapon": {"classes": list(weapon_classes), "min_conf": weapon_thresh},
+        },
+        "event_types": [
+            {"when": ["person", "weapon"], "type": "threat"},
+            {"when": ["person", "box"], "type": "delivery"},
+            {"when": ["person"], "type": "visitor"},
+        ],
+        "severity": [
+            {"when": ["person", "weapon"], "persons": "unknown_or_dangerous", "severity": "danger"},
+            {"when": ["person", "weapon"], "severity": "attention"},
+        ],
+        "default_severity": "normal",
+        "snapshot_flags": ["person", "weapon"],
+    }
+
+
+def persons_match(cond, persons, dangerous):
+    # no person_info from the client counts as unknown
+    unknown = any(p.get("type") != "friend" for p in persons) if persons else True
+    if cond == "unknown":
+        return unknown
+    if cond == "friends_only":
+        return not unknown
+    bad = any((p.get("name") or "").lower() in dangerous for p in persons if p.get("name"))
+    if cond == "dangerous":
+        return bad
+    return unknown or bad # unknown_or_dangerous
+
+
+def expect(value, kind, what):
+    # rules.json is hand-edited: a wrong shape is reported like any other bad value
+    if not isinstance(value, kind):
+        raise ValueError(f"{what} must be a {'list' if kind is list else 'JSON object'}, "
+                         f"got {type(value).__name__}")
+    return value
+
+
+class CompiledRules:
+    """
+    A rules spec turned into lookup tables, so a frame costs one pass over its detections:
+      by_class     class name -> [(flag bit, min confidence)]
+      event_types  flag mask -> event type (or None)
+      severities   flag mask -> [(person condition or None, severity)], first match wins
+      flag_dicts   flag mask -> {"has_<flag>": bool} (shared, don't modify)
+    Raises ValueError on a spec that does not make sense or lacks a REQUIRED_FLAGS flag.
+    """
+    def __init__(self, spec):
+        expect(spec, dict, "rules")
+        flags = expect(spec.get("flags") or {}, dict, "flags")
+        if not flags or len(flags) > MAX_FLAGS:
+            raise ValueError(f"need 1 to {MAX_FLAGS} flags, got {len(flags)}")
+        missing = [name for name in REQUIRED_FLAGS if name not in flags]
+        if missing:
+            raise ValueError(f"missing required flags {missing}")
+        self.spec = spec
+        self.flag_names = list(flags)
+        bits = {name: 1 << i for i, name in enumerate(self.flag_names)}
+
+        def mask_of(names):
+            expect(names, list, "a flag list")
+            unknown = [n for n in names if n not in bits]
+            if unknown:
+                raise ValueError(f"unknown flags {unknown}")
+            mask = 0
+            for n in names:
+                mask |= bits[n]
+            return mask
+
+        self.by_class = {}
+        for name, f in flags.items():
+            expect(f, dict, f"flag {name!r}")
+            per_class = expect(f.get("class_conf", {}), dict, f"{name}.class_conf")
+            for cls in expect(f.get("classes", []), list, f"{name}.classes"):
+                thresh = float(per_class.get(cls, f.get("min_conf", 0.0)))
+                self.by_class.setdefault(cls, []).append((bits[name], thresh))
+        snapshot_mask = mask_of(spec.get("snapshot_flags", []))
+        self.snapshot_classes = {cls for cls, entries in self.by_class.items()
+                                 if any(bit & snapshot_mask for bit, _ in entries)}
+
+        type_rules = [(mask_of(r["when"]), r["type"])
+                      for r in expect(spec.get("event_types", []), list, "event_types")]
+        sev_rules = []
+        for r in expect(spec.get("severity", []), list, "severity"):
+            expect(r, dict, "a severity rule")
+            cond = r.get("persons")
+            if cond is not None and cond not in PERSON_CONDITIONS:
+                raise ValueError(f"unknown persons condition {cond!r}")
+            sev_rules.append((mask_of(r["when"]), cond, r["severity"]))
+        self.default_severity = spec.get("default_severity", "normal")
+
+        n = 1 << len(self.flag_names)
+        self.event_types = [None] * n
+        self.severities = [()] * n
+        self.flag_dicts = [None] * n
+        for mask in range(n):
+            self.event_types[mask] = next((t for need, t in type_rules if mask & need == need), None)
+            matching = []
+            for need, cond, sev in sev_rules:
+                if mask & need == need:
+                    matching.append((cond, sev))
+                    if cond is None:
+                        break # nothing after an unconditional match can win
+            self.severities[mask] = tuple(matching)
+            self.flag_dicts[mask] = {f"has_{name}": bool(mask & bits[name]) for name in self.flag_names}
+
+    def evaluate(self, dets, persons, dangerous):
+        """Returns (flags, event_type, severity, snapshot_conf) for one frame."""
+        mask = 0
+        snap_conf = 0.0
+        by_class, snap = self.by_class, self.snapshot_classes
+        for d in dets:
+            name = d.get("class_name")
+            entries = by_class.get(name)
+            if entries is None:
+                continue
+            conf = float(d.get("confidence", 0.0))
+            for bit, thresh in entries:
+                if conf >= thresh:
+                    mask |= bit
+            if name in snap:
+                snap_conf += conf
+        severity = self.default_severity
+        for cond, sev in self.severities[mask]:
+            if cond is None or persons_match(cond, persons, dangerous):
+                severity = sev
+                break
+        return self.flag_dicts[mask], self.event_types[mask], severity, snap_conf
+
+
+class RuleEngine:
+    """
+    The compiled rules of rules_file (the defaults while there is no file), recompiled
+    when the file changes. A reload compiles on the side and swaps one reference, so
+    frames in flight finish with the rules they started with and none wait for it.
+    A broken file keeps the previous rules and reports the error in info().
+    """
+    def __init__(self, path, defaults, check_sec=2.0):
+        self.path = path
+        self.defaults = defaults
+        self.check_sec = check_sec
+        self.lock = threading.Lock()
+        self.compiled = CompiledRules(defaults)
+        self.source = "defaults"
+        self.mtime = None
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.error = None
+        self.next_check = 0.0
+        self.current()
+
+    def current(self):
+        now = time.monotonic()
+        # only one request thread checks the file, the others go on with the current rules
+        if now >= self.next_check and self.lock.acquire(blocking=False):
+            try:
+                self.next_check = now + self.check_sec
+                self._maybe_reload()
+            finally:
+                self.lock.release()
+        return self.compiled
+
+    def _maybe_reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+        try:
+            if mtime is None:
+                compiled, source = CompiledRules(self.defaults), "defaults"
+            else:
+                with open(self.path) as f:
+                    compiled, source = CompiledRules(json.load(f)), self.path
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Rules not reloaded, keeping the previous ones: {self.error}")
+            return
+        self.compiled, self.source, self.error = compiled, source, None
+        self.loaded_at = time.time()
+        self.reloads += 1
+
+    def info(self):
+        compiled = self.compiled
+        return {
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "error": self.error,
+            "flags": compiled.flag_names,
+            "classes": len(compiled.by_class),
+            "rules": compiled.spec,
+        }
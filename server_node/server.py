@@ -1,27 +1,78 @@
-from flask import Flask, request, jsonify, send_from_directory
-import os, json, base64
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file, g
+import io
+import os, json, time, base64, shutil, struct, threading
 from datetime import datetime
 from dashboard import register_dashboard_routes
 from config import (
     EVENTS_DIR,
-    TMP_DIR,
     DANGER_LIST_FILE,
+    DANGER_GALLERY_FILE,
+    DANGER_MATCH_THRESH,
+    DANGER_MAX_EXEMPLARS,
     PERSON_THRESH,
     BOX_THRESH,
     WEAPON_THRESH,
     WEAPON_CLASSES,
-    
+    PERSON_CLASSES,
+    BOX_CLASSES,
+    THREAT_MIN_DURATION_SEC,
+    THREAT_COOLDOWN_SEC,
+    REPLAY_IDLE_SEC,
+    EVENTS_DB,
+    EVENT_RING_SIZE,
+    THREAT_HISTORY_MAX,
+    THUMBS_DIR,
+    THUMB_WIDTH,
+    MEDIA_QUEUE_MAX,
+    DANGER_LIST_DEBOUNCE_SEC,
+    RETENTION_DAYS_BY_TYPE,
+    RETENTION_DAYS_BY_SEVERITY,
+    RETENTION_DAYS_DEFAULT,
+    MAX_MEDIA_BYTES,
+    REENCODE_AFTER_DAYS,
+    REENCODE_QUALITY,
+    RETENTION_SWEEP_SEC,
+    RETENTION_BATCH,
+    RULES_FILE,
+    RULES_CHECK_SEC,
+    PROFILE_DIR,
 )
+from event_tracker import EventTracker, SEVERITY_RANK
+from event_store import EventStore
+from notifier import Notifier
+from camera_state import CameraRegistry
+from media_writer import MediaWriter
+from retention import RetentionManager
+from rules import RuleEngine, default_rules
+from danger_gallery import DangerGallery
+from metrics import REGISTRY, CONTENT_TYPE, process_gauges, profile_request
 
 app = Flask(__name__)
 
 os.makedirs(EVENTS_DIR, exist_ok=True)
-os.makedirs(TMP_DIR, exist_ok=True)
 
-event_history= []
-next_event_id = 1
-
-# names that have ever been seen (for "new_person" flag)
+# binary body: 4-byte big-endian metadata length, metadata JSON, then the raw JPEG
+RAW_FRAME_MIMETYPE = "application/x-frame"
+
+event_store = EventStore(EVENTS_DB, EVENT_RING_SIZE, THREAT_HISTORY_MAX)
+notifier = Notifier()
+cameras = CameraRegistry()
+media = MediaWriter(EVENTS_DIR, THUMBS_DIR, DANGER_LIST_FILE, THUMB_WIDTH,
+                    MEDIA_QUEUE_MAX, DANGER_LIST_DEBOUNCE_SEC, DANGER_GALLERY_FILE)
+media.start()
+retention = RetentionManager(event_store, media, EVENTS_DIR, RETENTION_DAYS_BY_TYPE, RETENTION_DAYS_BY_SEVERITY,
+                             MAX_MEDIA_BYTES, REENCODE_AFTER_DAYS, REENCODE_QUALITY,
+                             RETENTION_SWEEP_SEC, RETENTION_BATCH, default_days=RETENTION_DAYS_DEFAULT)
+retention.start()
+# detection rules from RULES_FILE, reloaded when it changes; the thresholds above while it's missing
+rules = RuleEngine(RULES_FILE, default_rules(PERSON_THRESH, BOX_THRESH, WEAPON_THRESH, WEAPON_CLASSES,
+                                             PERSON_CLASSES, BOX_CLASSES),
+                   RULES_CHECK_SEC)
+
+# shared by all cameras, guarded by shared_lock:
+# event ids, names that have ever been seen (for "new_person" flag) and the blacklist
+shared_lock = threading.Lock()
+next_event_id = event_store.max_event_id() + 1
 known_person_ids = set()
 
 # blacklist
@@ -32,25 +83,61 @@ if os.path.exists(DANGER_LIST_FILE):
     except Exception:
         dangerous_persons = set()
 
-last_status = {
-    "current_state": "idle",        
-    "danger": False,
-    "needs_attention": False,
-    "last_event_id": None,
-    "last_event_type": None,
-    "last_event_caption": None,
-    "last_event_severity": "normal",
-    "latest_snapshot_url": None,
-    "live_caption": None,
-    "threat_flag": False,         
-    "threat_image": None,          
-    "threat_name": None,           
-    "new_person": False,           
-    "person_id": None,              
-    "person_snapshot_b64": None,    
-    "threat_snapshot_b64": None,
-    "threat_history": [],
-}
+# face embeddings of (some of) the blacklist, matched against unknown faces in a threat
+danger_gallery = DangerGallery(thresh=DANGER_MATCH_THRESH, max_exemplars=DANGER_MAX_EXEMPLARS)
+if os.path.exists(DANGER_GALLERY_FILE):
+    try:
+        danger_gallery = DangerGallery.load(DANGER_GALLERY_FILE, thresh=DANGER_MATCH_THRESH,
+                                            max_exemplars=DANGER_MAX_EXEMPLARS)
+    except Exception as e:
+        print(f"Danger gallery not loaded: {e}")
+dangerous_persons.update(danger_gallery.names())
+
+
+# request latency per route (frame_result = ingest), frame processing and what came out of it
+REQUEST_SECONDS = REGISTRY.histogram("server_request_seconds", "Request handling time by route.", ("route",))
+HANDLE_FRAME_SECONDS = REGISTRY.histogram("server_handle_frame_seconds", "Frame processing under the camera lock.")
+FRAMES = REGISTRY.counter("server_frames_total", "Frames received.", ("camera",))
+IMAGE_BYTES = REGISTRY.counter("server_image_bytes_total", "JPEG bytes received.", ("camera",))
+EVENTS = REGISTRY.counter("server_events_total", "Events that entered the history.", ("type", "severity"))
+DANGER_MATCHES = REGISTRY.counter("server_danger_matches_total", "Threat faces matched to a known danger identity.")
+
+
+# what the live panel needs; pushed to /stream only when one of these changes
+LIVE_STATUS_FIELDS = (
+    "camera_id", "current_state", "danger", "needs_attention", "live_caption", "last_event_id",
+    "last_event_caption", "threat_flag", "threat_image", "threat_name",
+)
+
+
+def commit_status(cam):
+    # call with cam.lock held, after every change to cam.status
+    cam.commit()
+    live = {k: cam.status[k] for k in LIVE_STATUS_FIELDS}
+    if live != cam.published:
+        cam.published = live
+        notifier.publish("status", live)
+
+
+def full_status(cam):
+    # the pre-v2 response: embedded base64 snapshots and the whole threat history
+    out = dict(cam.status)
+    for kind in ("person", "threat"):
+        raw = cam.snapshots[kind] if out[f"{kind}_snapshot_url"] else None
+        out[f"{kind}_snapshot_b64"] = base64.b64encode(raw).decode("ascii") if raw else None
+    out["threat_history"] = list(event_store.threat_history)
+    return out
+
+
+def save_danger_list(gallery_changed=False):
+    # call with shared_lock held; written (atomically, debounced) by the media writer
+    media.write_danger_list(dangerous_persons, danger_gallery.to_bytes() if gallery_changed else None)
+
+
+def publish_danger_list():
+    with shared_lock:
+        names = sorted(list(dangerous_persons))
+    notifier.publish("danger_list", {"dangerous_persons": names})
 
 
 def parse_iso(ts):
@@ -68,49 +155,28 @@ def normalize_person_list(p):
         return [p]
     return []
 
-def compute_flags(dets):
-    has_person = False
-    has_box = False
-    has_weapon = False
-    for d in dets:
-        cname = d.get("class_name")
-        conf = float(d.get("confidence", 0.0))
-        if cname == "person" and conf >= PERSON_THRESH:
-            has_person = True
-        if cname in ("box", "backpack", "package") and conf >= BOX_THRESH:
-            has_box = True
-        if cname in WEAPON_CLASSES and conf >= WEAPON_THRESH:
-            has_weapon = True
-    return {
-        "has_person": has_person,
-        "has_box": has_box,
-        "has_weapon": has_weapon,
-    }
+def split_embeddings(persons):
+    # face embeddings of unknown people ride along in person_info; they go to the
+    # danger gallery, not into the events
+    out = []
+    for p in persons:
+        emb = p.pop("embedding", None)
+        if isinstance(emb, list) and len(emb) == danger_gallery.dim and p.get("type") != "friend":
+            out.append(emb)
+    return out
 
 
-def compute_severity(flags, persons):
-    has_weapon = flags["has_weapon"]
-    has_person = flags["has_person"]
-    if not has_weapon or not has_person:
-        return "normal"
-    any_unknown = any(p.get("type") != "friend" for p in persons) if persons else True
-    any_blacklisted = any(
-        (p.get("name") or "").lower() in dangerous_persons
-        for p in persons
-        if p.get("name")
-    )
-    if any_unknown or any_blacklisted:
-        return "danger"
-    else:
-        return "attention"
+def evaluate_rules(detections, persons):
+    # flags, event type, severity and snapshot confidence in one pass over the detections
+    return rules.current().evaluate(detections, persons, dangerous_persons)
 
 
 def objects_summary_from(flags, persons):
     person_count = len(persons) if persons else (1 if flags["has_person"] else 0)
     return {
         "person_count": person_count,
-        "box": flags["has_box"],
-        "weapon": flags["has_weapon"],
+        "box": flags.get("has_box", False),
+        "weapon": flags.get("has_weapon", False),
     }
 
 
@@ -150,98 +216,166 @@ def describe_event_like(persons, objs, severity):
             return "Multiple unknown people are standing at your door."
     return "No one is at your door."
 
-def decide_event_type(flags):
-    if not flags["has_person"]:
-        return None
-    if flags["has_weapon"]:
-        return "threat"
-    if flags["has_box"]:
-        return "delivery"
-    return "visitor"
-
 def next_id():
     global next_event_id
-    eid = next_event_id
-    next_event_id += 1
+    with shared_lock:
+        eid = next_event_id
+        next_event_id += 1
     return eid
 
 
+event_tracker = EventTracker(next_id, THREAT_MIN_DURATION_SEC, THREAT_COOLDOWN_SEC)
+# frames replayed from a client's spool are from the past: they get events of their own,
+# so they never touch the live event, status or alarm of their camera
+replay_tracker = EventTracker(next_id, THREAT_MIN_DURATION_SEC, THREAT_COOLDOWN_SEC)
+replay_seen = {} # camera_id -> time.time() of its last replayed frame
+
+
+def snapshot_dropped(fn):
+    # MediaWriter's queue overflowed and this snapshot never reaches the disk: the event
+    # loses its image instead of linking to a missing file, and the next frame with an
+    # image may become its snapshot again. Called from any camera's request thread, so
+    # the open events are changed without their camera's lock (single assignments).
+    try:
+        eid = int(fn[len("event_"):-len(".jpg")])
+    except ValueError:
+        return
+    event_store.clear_snapshots([eid])
+    for tracker in (event_tracker, replay_tracker):
+        for cur in list(tracker.open.values()):
+            if cur["event"]["event_id"] == eid:
+                cur["event"]["snapshot_path"] = cur["event"]["snapshot_roi"] = None
+                cur["best_score"] = None
+
+
+media.on_drop = snapshot_dropped
+
+
 def handle_frame(frame):
-    global event_history, last_status, known_person_ids, dangerous_persons
+    """
+    Processes one frame under its camera's lock, so frames of different cameras run
+    concurrently. Returns the CameraState.
+    """
+    cam = cameras.get(frame.get("camera_id"))
+    FRAMES.labels(cam.camera_id).inc()
+    if frame.get("image_bytes"):
+        IMAGE_BYTES.labels(cam.camera_id).inc(len(frame["image_bytes"]))
+    with cam.lock, HANDLE_FRAME_SECONDS.time():
+        cam.frames += 1
+        if frame.get("image_bytes"):
+            cam.images += 1
+            cam.image_bytes += len(frame["image_bytes"])
+        danger_changed = _handle_frame(cam, frame)
+    if danger_changed:
+        publish_danger_list()
+    return cam
+
+
+def record_event(res, event_type, image_bytes, frame, live):
+    """
+    Stores what the tracker reported for one frame: closed events, the snapshot and the
+    event row. Only live frames are pushed to /stream. Returns the frame's event or None.
+    """
+    for old in res["closed"]:
+        if not old.get("discarded"):
+            event_store.save(old)
+            if live:
+                notifier.publish("event", event_summary(old))
+        elif old.get("snapshot_path"):
+            # threat shorter than THREAT_MIN_DURATION_SEC, it never made it into the history
+            media.delete(os.path.basename(old["snapshot_path"]))
+    new_event = res["event"] if event_type is not None else None
+    if new_event is None:
+        return None
+    eid = new_event["event_id"]
+    if res["best"] and image_bytes:
+        # one file per event, overwritten only when a better frame arrives
+        media.write_snapshot(f"event_{eid}.jpg", image_bytes)
+        new_event["snapshot_path"] = f"/events/img/event_{eid}.jpg"
+        # the client may send a crop around the people / weapon instead of the whole frame
+        new_event["snapshot_roi"] = frame.get("roi")
+    # written when it enters the history, gets a better snapshot and when it closes;
+    # in between the store's in-memory ring holds the live dict
+    if res["confirmed"]:
+        EVENTS.labels(event_type, new_event["severity"]).inc()
+    if res["confirmed"] or (res["best"] and new_event["confirmed"]):
+        event_store.save(new_event)
+    return new_event
+
+
+def _handle_frame(cam, frame):
+    status = cam.status
+    danger_changed = False
     ts = parse_iso(frame["timestamp"])
     detections = frame.get("detections", [])
     persons = normalize_person_list(frame.get("person_info"))
-    flags = compute_flags(detections)
+    embeddings = split_embeddings(persons)
+    flags, event_type, severity, snapshot_conf = evaluate_rules(detections, persons)
     objs = objects_summary_from(flags, persons)
-    severity = compute_severity(flags, persons)
     live_caption = describe_event_like(persons, objs, severity)
-    event_type = decide_event_type(flags)
-    person_key = None
-    if persons:
-        p0 = persons[0]
-        if p0.get("name"):
-            person_key = p0["name"].lower()
+    # every named person in the frame, in the order the client sent them
+    person_keys = []
+    for p in persons:
+        if p.get("name") and p["name"].lower() not in person_keys:
+            person_keys.append(p["name"].lower())
+    person_key = person_keys[0] if person_keys else None
+    new_person_keys = []
     new_person = False
-    snapshot_rel_path = None
-    snapshot_b64 = None
-    new_event = None
-    if event_type is not None:
-        eid = next_id()
-
-        img_src = frame.get("image_path")
-        dest = None
-        if img_src:
-            ext = os.path.splitext(img_src)[1] or ".jpg"
-            dest = os.path.join(EVENTS_DIR, f"event_{eid}{ext}")
-            try:
-                with open(img_src, "rb") as fsrc, open(dest, "wb") as fdst:
-                    fdst.write(fsrc.read())
-                snapshot_rel_path = f"/events/img/event_{eid}{ext}"
-                with open(dest, "rb") as f:
-                    snapshot_b64 = base64.b64encode(f.read()).decode("ascii")
-            except Exception:
-                snapshot_rel_path = None
-                snapshot_b64 = None
-
-        new_event = {
-            "event_id": eid,
-            "event_type": event_type,
-            "start_time": ts.isoformat(),
-            "end_time": ts.isoformat(),
-            "duration_sec": 0.0,
-            "severity": severity,
-            "objects_summary": objs,
-            "person_info": persons,
-            "snapshot_path": snapshot_rel_path,
-            "caption": live_caption,
-        }
-        event_history.append(new_event)
-        last_status["last_event_id"] = eid
-        last_status["last_event_type"] = event_type
-        last_status["last_event_caption"] = live_caption
-        last_status["last_event_severity"] = severity
-        last_status["latest_snapshot_url"] = snapshot_rel_path
-
-        if person_key:
-            if person_key not in known_person_ids:
-                known_person_ids.add(person_key)
-                new_person = True
+    image_bytes = frame.get("image_bytes")
+    # which frame of an event is worth keeping: most severe, then most confident detections;
+    # detections-only frames (client heartbeats) extend the event but can't be its snapshot
+    score = None
+    if image_bytes:
+        score = (SEVERITY_RANK.get(severity, 0), flags.get("has_weapon", False), snapshot_conf)
+    if frame.get("replayed"):
+        replay_seen[cam.camera_id] = time.time()
+        res = replay_tracker.update(cam.camera_id, ts, event_type, severity,
+                                   objs, persons, live_caption, score)
+        record_event(res, event_type, image_bytes, frame, live=False)
+        return False
+    if cam.camera_id in replay_tracker.open and time.time() - replay_seen[cam.camera_id] > REPLAY_IDLE_SEC:
+        record_event({"event": None, "best": False, "confirmed": False,
+                      "closed": [replay_tracker.close(cam.camera_id)]}, None, None, frame, live=False)
+    res = event_tracker.update(cam.camera_id, ts, event_type, severity,
+                               objs, persons, live_caption, score)
+    if res["late"]:
+        # older than the live event (reordered upload): neither the event nor the status moves back
+        return False
+    new_event = record_event(res, event_type, image_bytes, frame, live=True)
+    if new_event is not None:
+        eid = new_event["event_id"]
+        if new_event["confirmed"]:
+            notifier.publish("event", event_summary(new_event))
+            status["last_event_id"] = eid
+            status["last_event_type"] = event_type
+            status["last_event_caption"] = new_event["caption"]
+            status["last_event_severity"] = new_event["severity"]
+            status["latest_snapshot_url"] = new_event["snapshot_path"]
+
+        with shared_lock:
+            for key in person_keys:
+                if key not in known_person_ids:
+                    known_person_ids.add(key)
+                    new_person_keys.append(key)
+        new_person = bool(new_person_keys)
+        if new_person:
+            person_key = new_person_keys[0]
     if flags["has_weapon"]:
-        last_status["current_state"] = "threat_active"
+        status["current_state"] = "threat_active"
     elif flags["has_person"]:
-        last_status["current_state"] = "event_active"
+        status["current_state"] = "event_active"
     else:
-        last_status["current_state"] = "idle"
+        status["current_state"] = "idle"
 
-    last_status["live_caption"] = live_caption
+    status["live_caption"] = live_caption
 
-    last_status["threat_flag"] = flags["has_weapon"]
+    status["threat_flag"] = flags["has_weapon"]
 
     if flags["has_weapon"]:
         if new_event is not None:
-            last_status["threat_image"] = new_event.get("snapshot_path")
+            status["threat_image"] = new_event.get("snapshot_path")
         else:
-            last_status["threat_image"] = None
+            status["threat_image"] = None
 
 
         name = None
@@ -249,76 +383,125 @@ def handle_frame(frame):
             if p.get("name"):
                 name = p["name"]
                 break
-        if name:
-            last_status["threat_name"] = name
-            dangerous_persons.add(name.lower())
-        else:
-            synthetic = f"danger_{last_status['last_event_id'] or int(ts.timestamp())}"
-            last_status["threat_name"] = synthetic
-            dangerous_persons.add(synthetic)
+        # nobody the client recognized: the identity this event already has, or an
+        # earlier intruder whose face matches (one batched match for all faces)
+        from_face = name is None
+        if name is None and new_event is not None:
+            name = new_event.get("danger_identity")
+        if name is None and embeddings:
+            with shared_lock:
+                name = next((n for n, _ in danger_gallery.match(embeddings) if n), None)
+            if name is not None:
+                DANGER_MATCHES.inc()
+                if new_event is not None: # kept for the rest of the event, frames without a face included
+                    new_event["danger_identity"] = name
+        threat_name = name or f"danger_{new_event['event_id'] if new_event else int(ts.timestamp())}"
+        status["threat_name"] = threat_name
+        # only threats that lasted THREAT_MIN_DURATION_SEC put someone on the danger list
+        if new_event is not None and new_event["confirmed"]:
+            key = threat_name.lower()
+            if from_face:
+                new_event["danger_identity"] = key
+            with shared_lock:
+                gallery_changed = from_face and bool(embeddings) and danger_gallery.add(
+                    key, embeddings, event_id=new_event["event_id"])
+                if key not in dangerous_persons or gallery_changed:
+                    dangerous_persons.add(key)
+                    save_danger_list(gallery_changed)
+                    danger_changed = True
 
         if severity == "danger":
-            last_status["danger"] = True
-        elif severity == "attention" and not last_status["danger"]:
-            last_status["needs_attention"] = True
-    else:
-        last_status["threat_image"] = None
-        last_status["threat_name"] = None
-
-    last_status["new_person"] = new_person
-    last_status["person_id"] = person_key
-    last_status["person_snapshot_b64"] = snapshot_b64 if new_person else None
-    if last_status["threat_flag"]:
-        last_status["threat_snapshot_b64"] = snapshot_b64
+            status["danger"] = True
+        elif severity == "attention" and not status["danger"]:
+            status["needs_attention"] = True
     else:
-        last_status["threat_snapshot_b64"] = None
-    threat_urls = [
-        ev["snapshot_path"]
-        for ev in event_history
-        if ev.get("event_type") == "threat" and ev.get("snapshot_path")
-    ]
-    last_status["threat_history"] = list(reversed(threat_urls))
-    try:
-        with open(DANGER_LIST_FILE, "w") as f:
-            json.dump(sorted(list(dangerous_persons)), f, indent=2)
-    except Exception:
-        pass
+        status["threat_image"] = None
+        status["threat_name"] = None
+
+    # snapshots go out by URL (the event's image), the bytes stay in memory for ?full=1
+    snapshot_url = new_event.get("snapshot_path") if new_event is not None else None
+    status["new_person"] = new_person
+    status["person_id"] = person_key
+    status["person_ids"] = person_keys
+    status["new_person_ids"] = new_person_keys
+    status["person_snapshot_url"] = snapshot_url if new_person else None
+    status["threat_snapshot_url"] = snapshot_url if status["threat_flag"] else None
+    if image_bytes and new_person:
+        cam.snapshots["person"] = image_bytes
+    if image_bytes and status["threat_flag"]:
+        cam.snapshots["threat"] = image_bytes
+    commit_status(cam)
+    return danger_changed
+
+def parse_frame_request():
+    """
+    Returns (metadata dict, jpeg bytes or None). Accepts, in order:
+      - multipart/form-data with a "meta" JSON field and an "image" file (a plain
+        form post when there is no image: that is how requests sends it)
+      - application/x-frame: length-prefixed metadata JSON followed by the JPEG
+      - the old JSON body with a base64 "image_jpeg_base64" or "image" field
+    Metadata that is not a JSON object comes back as (None, None).
+    """
+    if request.mimetype in ("multipart/form-data", "application/x-www-form-urlencoded"):
+        try:
+            data = json.loads(request.form.get("meta") or "{}")
+        except ValueError:
+            return None, None
+        if not isinstance(data, dict):
+            return None, None
+        f = request.files.get("image")
+        return data, (f.read() if f else None)
+
+    if request.mimetype == RAW_FRAME_MIMETYPE:
+        body = request.get_data(cache=False)
+        if len(body) < 4:
+            return None, None
+        (meta_len,) = struct.unpack(">I", body[:4])
+        try:
+            data = json.loads(body[4:4 + meta_len])
+        except ValueError:
+            return None, None
+        if not isinstance(data, dict):
+            return None, None
+        return data, (body[4 + meta_len:] or None)
+
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return None, None
+    # Accept both "image_jpeg_base64" and "image" (your friend's field)
+    img_b64 = data.get("image_jpeg_base64") or data.get("image")
+    raw = None
+    if img_b64:
+        try:
+            raw = base64.b64decode(img_b64)
+        except Exception:
+            raw = None
+    return data, raw
+
 
 # This part is made from GPT 
 @app.route("/frame_result", methods=["POST"])
 def frame_result():
     """
     Entry point for your YOLO client.
-    Expects JSON:
+    Metadata:
       {
         "camera_id": "...",
         "frame_id": ...,
         "timestamp": "...",
         "detections": [...],
         "person_info": {...} or [...],
-        "image_jpeg_base64": "..."     # optional (OR "image")
+        "image_jpeg_base64": "..."     # optional (OR "image"), JSON body only
+        "replayed": true               # optional, sent from the client's spool: history only
       }
-    Returns `last_status` which includes threat_flag, threat_name,
-    threat_snapshot_b64, new_person, person_snapshot_b64, threat_history, etc.
+    The JPEG can also be sent as binary, see parse_frame_request.
+    Returns a small ack (contract "v": 2) with the flags the client acts on and the
+    status version; the full status is at /latest_status. ?full=1 returns the old
+    full status body of the camera with base64 snapshots and the threat history.
     """
-    data = request.get_json(silent=True)
+    data, image_bytes = parse_frame_request()
     if not data:
-        return jsonify({"error": "invalid JSON"}), 400
-
-    # Accept both "image_jpeg_base64" and "image" (your friend's field)
-    img_b64 = data.get("image_jpeg_base64") or data.get("image")
-
-    # Save raw image (optional)
-    image_path = None
-    if img_b64:
-        try:
-            raw = base64.b64decode(img_b64)
-            fname = f"latest_{data.get('camera_id', 'cam')}.jpg"
-            image_path = os.path.join(TMP_DIR, fname)
-            with open(image_path, "wb") as f:
-                f.write(raw)
-        except Exception:
-            image_path = None
+        return jsonify({"error": "invalid frame: metadata must be a JSON object"}), 400
 
     frame = {
         "camera_id": data.get("camera_id", "cam"),
@@ -326,53 +509,272 @@ def frame_result():
         "timestamp": data.get("timestamp") or datetime.utcnow().isoformat() + "Z",
         "detections": data.get("detections", []),
         "person_info": data.get("person_info"),
-        "image_path": image_path,
+        "roi": data.get("roi"),
+        "replayed": bool(data.get("replayed")),
+        "image_bytes": image_bytes,
     }
 
-    handle_frame(frame)
-    return jsonify(last_status)
+    cam = handle_frame(frame)
+    with cam.lock:
+        if request.args.get("full"):
+            return jsonify(full_status(cam))
+        status = cam.status
+        resp = jsonify({
+            "v": 2,
+            "ok": True,
+            "camera_id": cam.camera_id,
+            "status_version": cam.version,
+            "threat_flag": status["threat_flag"],
+            "danger": status["danger"],
+            "needs_attention": status["needs_attention"],
+            "new_person": status["new_person"],
+            "event_id": status["last_event_id"],
+        })
+        resp.set_etag(cam.etag())
+    return resp
+
+
+def status_response(cam):
+    full = bool(request.args.get("full"))
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), 30.0)
+    except ValueError:
+        wait = 0.0
+    suffix = "-full" if full else ""
+    with cam.lock:
+        seen = cam.version
+        if wait and request.if_none_match.contains(f"{cam.etag()}{suffix}"):
+            cam.cond.wait_for(lambda: cam.version != seen, timeout=wait)
+        body = full_status(cam) if full else dict(cam.status)
+        etag = f"{cam.etag()}{suffix}"
+    resp = jsonify(body)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
 
 @app.route("/latest_status")
 def latest_status_route():
-    return jsonify(last_status)
+    """
+    Status of ?camera_id= (default: the camera that sent the latest frame).
+    Conditional: send If-None-Match with the last ETag to get 304 when nothing changed.
+    ?wait=N (seconds, max 30) together with If-None-Match long-polls until it changes.
+    ?full=1 returns the old body (base64 snapshots, threat history).
+    """
+    camera_id = request.args.get("camera_id")
+    cam = cameras.find(camera_id) if camera_id else cameras.latest()
+    if cam is None:
+        return jsonify({"error": "unknown camera"}), 404
+    return status_response(cam)
+
+
+@app.route("/status/<camera_id>")
+def camera_status_route(camera_id):
+    cam = cameras.find(camera_id)
+    if cam is None:
+        return jsonify({"error": "unknown camera"}), 404
+    return status_response(cam)
+
+
+@app.route("/cameras")
+def cameras_route():
+    return jsonify([cam.summary() for cam in cameras.all()])
+
+
+@app.route("/client_status", methods=["POST"])
+def client_status_route():
+    """
+    A client saying it is "starting" (models loading), "ready" (loaded and warmed up,
+    with the time every startup step took) or "stopped". Shown per camera in /cameras.
+    """
+    data = request.get_json(silent=True)
+    state = data.get("state") if isinstance(data, dict) else None
+    if state not in ("starting", "ready", "stopped"):
+        return jsonify({"error": "state must be starting, ready or stopped"}), 400
+    try:
+        sent_at = float(data.get("sent_at") or time.time())
+    except (TypeError, ValueError):
+        return jsonify({"error": "sent_at must be a number"}), 400
+    camera_ids = data.get("camera_ids") or [None]
+    if not isinstance(camera_ids, list) or not all(c is None or isinstance(c, str) for c in camera_ids):
+        return jsonify({"error": "camera_ids must be a list of strings"}), 400
+    client = {"state": state, "startup": data.get("startup"), "sent_at": sent_at, "received_at": time.time()}
+    for camera_id in camera_ids:
+        cam = cameras.get(camera_id)
+        with cam.lock:
+            # announcements travel on separate connections, an older one must not win
+            if cam.client is None or sent_at >= cam.client["sent_at"]:
+                cam.client = client
+    return jsonify({"status": "ok"})
+
+
+@app.route("/threat_history")
+def threat_history_route():
+    # newest first, ?offset=&limit=
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(int(request.args.get("limit", 20)), 200)
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+    history = list(event_store.threat_history)
+    return jsonify({"total": len(history), "offset": offset, "items": history[offset:offset + limit]})
+
+
+def event_summary(ev):
+    return {
+        "event_id": ev["event_id"],
+        "camera_id": ev.get("camera_id"),
+        "event_type": ev["event_type"],
+        "start_time": ev["start_time"],
+        "end_time": ev["end_time"],
+        "duration_sec": ev["duration_sec"],
+        "frame_count": ev.get("frame_count", 1),
+        "status": ev.get("status", "closed"),
+        "severity": ev["severity"],
+        "caption": ev.get("caption"),
+        "persons": sorted({p["name"] for p in ev.get("person_info") or [] if p.get("name")}),
+        "track_ids": ev.get("track_ids", []),
+        "snapshot_url": ev.get("snapshot_path"),
+        "thumbnail_url": thumb_url(ev.get("snapshot_path")),
+    }
+
+
+def thumb_url(snapshot_path):
+    if not snapshot_path:
+        return None
+    return snapshot_path.replace("/events/img/", "/events/thumb/", 1)
 
 
 @app.route("/events")
 def events_route():
-    N = int(request.args.get("limit", 100))
-    subset = event_history[-N:]
-    out = []
-    for ev in subset:
-        out.append(
-            {
-                "event_id": ev["event_id"],
-                "event_type": ev["event_type"],
-                "start_time": ev["start_time"],
-                "end_time": ev["end_time"],
-                "duration_sec": ev["duration_sec"],
-                "severity": ev["severity"],
-                "caption": ev.get("caption"),
-                "snapshot_url": ev.get("snapshot_path"),
-            }
-        )
-    return jsonify(out)
+    """
+    Query args (all optional): limit, since, until (ISO time), type (comma list),
+    person, severity, camera_id, before (cursor from the X-Next-Cursor header).
+    Returns the page oldest -> newest; X-Next-Cursor points at the next older page.
+    """
+    try:
+        N = min(int(request.args.get("limit", 100)), 1000)
+        before = request.args.get("before")
+        before = int(before) if before else None
+    except ValueError:
+        return jsonify({"error": "limit and before must be integers"}), 400
+    since = request.args.get("since")
+    until = request.args.get("until")
+    types = [t for t in (request.args.get("type") or "").split(",") if t]
+    person = request.args.get("person")
+    severity = request.args.get("severity")
+    camera_id = request.args.get("camera_id")
+    if not any((since, until, types, person, severity, camera_id, before)):
+        subset, cursor = event_store.recent(N), None # hot path, served from memory
+        if len(subset) == N and subset:
+            cursor = subset[0]["event_id"]
+    else:
+        subset, cursor = event_store.query(
+            since=parse_iso(since).timestamp() if since else None,
+            until=parse_iso(until).timestamp() if until else None,
+            types=types, person=person, severity=severity, camera_id=camera_id,
+            before=before, limit=N)
+    resp = jsonify([event_summary(ev) for ev in subset])
+    if cursor is not None:
+        resp.headers["X-Next-Cursor"] = str(cursor)
+    return resp
 
 
 @app.route("/events/img/<path:fn>")
 def event_img(fn):
-    return send_from_directory(EVENTS_DIR, fn)
+    # an event's file is rewritten when a better frame arrives: revalidate with ETag / Last-Modified
+    pending = media.pending_bytes(fn)
+    if pending is not None: # not on disk yet
+        resp = send_file(io.BytesIO(pending), mimetype="image/jpeg", max_age=0)
+    else:
+        resp = send_from_directory(EVENTS_DIR, fn, max_age=0)
+    resp.cache_control.no_cache = True
+    return resp
+
+
+@app.route("/events/thumb/<path:fn>")
+def event_thumb(fn):
+    # small version for history views, the full image when there is no thumbnail (yet)
+    if os.path.exists(os.path.join(THUMBS_DIR, fn)):
+        resp = send_from_directory(THUMBS_DIR, fn, max_age=0)
+        resp.cache_control.no_cache = True
+        return resp
+    return event_img(fn)
+
+
+@app.route("/media_stats")
+def media_stats_route():
+    return jsonify(media.stats())
+
+@app.route("/storage")
+def storage_route():
+    # disk usage against the quota and what the retention sweeper has done so far
+    return jsonify(retention.stats())
+
+
+@app.route("/rules")
+def rules_route():
+    # the rules in use, where they came from and the last reload error (if any)
+    rules.current()
+    return jsonify(rules.info())
+
+
+@app.before_request
+def start_timer():
+    g.t0 = time.perf_counter()
+
+
+@app.after_request
+def record_time(response):
+    # streamed responses (/stream) are timed until their first byte
+    if "t0" in g:
+        REQUEST_SECONDS.labels(request.endpoint or "unknown").observe(time.perf_counter() - g.t0)
+    return response
+
+
+@app.route("/metrics")
+def metrics_route():
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+@app.route("/profile")
+def profile_route():
+    # ?seconds=N samples every thread for N seconds, ?action=start / ?action=stop for longer captures;
+    # the folded stacks go to flamegraph.pl or speedscope
+    status, body = profile_request(request.args, PROFILE_DIR, "server")
+    return Response(body, status=status, mimetype="text/plain")
+
+
+@app.route("/stream")
+def stream_route():
+    """
+    Server-Sent Events: "status" (live panel fields, only when they change),
+    "event" (an event was added or grew) and "danger_list" messages.
+    """
+    resp = Response(notifier.stream(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
 
 
 @app.route("/ack_alert", methods=["POST"])
 def ack():
-    # Clear current warning/attention but keep history
-    last_status["danger"] = False
-    last_status["needs_attention"] = False
-    last_status["threat_flag"] = False
-    last_status["threat_image"] = None
-    last_status["threat_name"] = None
-    last_status["threat_snapshot_b64"] = None
+    # Clear current warning/attention but keep history (one camera with ?camera_id=, else all)
+    data = request.get_json(silent=True) or {}
+    camera_id = data.get("camera_id") or request.args.get("camera_id")
+    targets = [cameras.find(camera_id)] if camera_id else cameras.all()
+    for cam in targets:
+        if cam is None:
+            continue
+        with cam.lock:
+            status = cam.status
+            status["danger"] = False
+            status["needs_attention"] = False
+            status["threat_flag"] = False
+            status["threat_image"] = None
+            status["threat_name"] = None
+            status["threat_snapshot_url"] = None
+            commit_status(cam)
     return jsonify({"status": "ok"})
 
 
@@ -380,26 +782,65 @@ def ack():
 def danger_list_route():
     global dangerous_persons
     if request.method == "GET":
-        return jsonify({"dangerous_persons": sorted(list(dangerous_persons))})
+        with shared_lock:
+            return jsonify({"dangerous_persons": sorted(list(dangerous_persons)),
+                            "identities": danger_gallery.info()})
 
     data = request.get_json(silent=True) or {}
     name = (data.get("name") or "").strip().lower()
     if not name:
         return jsonify({"error": "name required"}), 400
 
-    if data.get("action") == "remove":
-        dangerous_persons.discard(name)
-    else:
-        dangerous_persons.add(name)
-
+    # optional face embeddings (128 floats each) to match this person by face
+    embeddings = data.get("embeddings") or ([data["embedding"]] if data.get("embedding") else [])
     try:
-        with open(DANGER_LIST_FILE, "w") as f:
-            json.dump(sorted(list(dangerous_persons)), f, indent=2)
-    except Exception:
-        pass
-
-    return jsonify({"status": "ok", "dangerous_persons": sorted(list(dangerous_persons))})
-
+        embeddings = [[float(x) for x in e] for e in embeddings]
+    except (TypeError, ValueError):
+        return jsonify({"error": "embeddings must be lists of numbers"}), 400
+    if any(len(e) != danger_gallery.dim for e in embeddings):
+        return jsonify({"error": f"embeddings need {danger_gallery.dim} values"}), 400
+
+    with shared_lock:
+        if data.get("action") == "remove":
+            dangerous_persons.discard(name)
+            gallery_changed = danger_gallery.remove(name)
+        else:
+            dangerous_persons.add(name)
+            gallery_changed = bool(embeddings) and danger_gallery.add(name, embeddings)
+        save_danger_list(gallery_changed)
+        names = sorted(list(dangerous_persons))
+        identities = danger_gallery.info()
+    publish_danger_list()
+
+    return jsonify({"status": "ok", "dangerous_persons": names, "identities": identities})
+
+def register_gauges():
+    # read at scrape time, nothing is paid per frame
+    REGISTRY.gauge("server_cameras", "Cameras seen since start.", lambda: len(cameras.all()))
+    REGISTRY.gauge("server_event_history_size", "Events in the in-memory ring.", lambda: len(event_store.ring))
+    REGISTRY.gauge("server_threat_history_size", "Entries in the threat history.",
+                   lambda: len(event_store.threat_history))
+    REGISTRY.gauge("server_open_events", "Events still open (at most one per camera).",
+                   lambda: len(event_tracker.open))
+    REGISTRY.gauge("server_event_tracker_counts", "Event tracker counters (frames, opened, closed, discarded).",
+                   lambda: dict(event_tracker.stats), ("kind",))
+    REGISTRY.gauge("server_media_queue_depth", "Snapshot writes waiting for the disk.", lambda: len(media.pending))
+    REGISTRY.gauge("server_media_bytes", "Snapshot + thumbnail bytes on disk (as of the last retention sweep).",
+                   lambda: retention.usage_bytes)
+    REGISTRY.gauge("server_media_quota_bytes", "MAX_MEDIA_BYTES.", lambda: retention.max_bytes)
+    REGISTRY.gauge("server_disk_free_bytes", "Free space on the events disk.",
+                   lambda: shutil.disk_usage(EVENTS_DIR).free)
+    REGISTRY.gauge("server_stream_subscribers", "Open /stream connections.", notifier.subscriber_count)
+    REGISTRY.gauge("server_danger_list_size", "Names on the danger list.", lambda: len(dangerous_persons))
+    REGISTRY.gauge("server_danger_gallery_rows", "Face embeddings in the danger gallery.", lambda: danger_gallery.n)
+    REGISTRY.gauge("server_client_ready", "1 while the camera's client reports ready.",
+                   lambda: {cam.camera_id: int((cam.client or {}).get("state") == "ready") for cam in cameras.all()},
+                   ("camera",))
+    REGISTRY.gauge("server_rules_reloads", "Successful rule reloads since start.", lambda: rules.reloads)
+    process_gauges(REGISTRY, "server_")
+
+
+register_gauges()
 register_dashboard_routes(app)
 
 if __name__ == "__main__":
@@ -1,13 +1,19 @@
-// dashboard.js This is made from GPT 
+// dashboard.js This is made from GPT
 
 let eventTypeChart = null;
+const MAX_EVENTS = 100;
+const eventsById = new Map();
 
+// ========== 1. LIVE STATUS ==========
 async function fetchStatus() {
     const res = await fetch("/latest_status");
-    const data = await res.json();
+    renderStatus(await res.json());
+}
 
+function renderStatus(data) {
     const stateDiv = document.getElementById("currentState");
-    stateDiv.innerHTML = `<span class="label">State:</span> <span class="value">${data.current_state}</span>`;
+    const camera = data.camera_id ? ` (${data.camera_id})` : "";
+    stateDiv.innerHTML = `<span class="label">State:</span> <span class="value">${data.current_state}${camera}</span>`;
 
     // caption: prefer live_caption, fallback to last event
     const caption = data.live_caption || data.last_event_caption || "N/A";
@@ -21,12 +27,15 @@ async function fetchStatus() {
     let src = null;
     if (data.threat_image) {
         src = data.threat_image;
-    } else if (data.threat_snapshot_b64) {
-        src = "data:image/jpeg;base64," + data.threat_snapshot_b64;
+    } else if (data.threat_snapshot_url) {
+        src = data.threat_snapshot_url;
     }
 
     if (data.threat_flag && src) {
-        img.src = src;
+        // thumbnail in the panel, full image on click
+        const thumb = src.replace("/events/img/", "/events/thumb/");
+        if (img.getAttribute("src") !== thumb) img.src = thumb;
+        img.onclick = () => window.open(src, "_blank");
         img.style.display = "block";
         threatMeta.textContent = `Threat: ${data.threat_name || "unknown"}`;
     } else {
@@ -48,75 +57,96 @@ async function fetchStatus() {
 
 // ========== 2. EVENTS / TIMELINE ==========
 async function fetchEvents() {
-    const res = await fetch("/events?limit=100");
+    const res = await fetch(`/events?limit=${MAX_EVENTS}`);
     const events = await res.json();
 
-    updateTimeline(events);
-    updateEventTable(events);
-    updateEventTypeChart(events);
+    eventsById.clear();
+    document.querySelector("#eventTable tbody").innerHTML = "";
+    document.getElementById("timelineContainer").innerHTML = "";
+    for (let ev of events) {
+        upsertEvent(ev, false);
+    }
+    updateEventTypeChart();
 }
 
-function updateEventTable(events) {
-    const tbody = document.querySelector("#eventTable tbody");
-    tbody.innerHTML = "";
-
-    // newest first
-    events.sort((a, b) => b.event_id - a.event_id);
+// one new or updated event: only its table row / timeline bar is touched
+function upsertEvent(ev, refreshChart = true) {
+    eventsById.set(ev.event_id, ev);
+    updateEventRow(ev);
+    updateTimelineBar(ev);
+
+    // keep the newest MAX_EVENTS
+    const ids = [...eventsById.keys()].sort((a, b) => a - b);
+    for (let id of ids.slice(0, Math.max(0, ids.length - MAX_EVENTS))) {
+        eventsById.delete(id);
+        document.getElementById(`event-row-${id}`)?.remove();
+        document.getElementById(`event-bar-${id}`)?.remove();
+    }
+    if (refreshChart) updateEventTypeChart();
+}
 
-    for (let ev of events) {
-        const tr = document.createElement("tr");
-        tr.innerHTML = `
-            <td>${ev.event_id}</td>
-            <td>${ev.event_type}</td>
-            <td>${ev.start_time}</td>
-            <td>${ev.end_time}</td>
-            <td>${(ev.duration_sec || 0).toFixed(1)}</td>
-            <td>${ev.caption || ""}</td>
-        `;
-        tbody.appendChild(tr);
+function updateEventRow(ev) {
+    const tbody = document.querySelector("#eventTable tbody");
+    let tr = document.getElementById(`event-row-${ev.event_id}`);
+    if (!tr) {
+        tr = document.createElement("tr");
+        tr.id = `event-row-${ev.event_id}`;
+        // newest first
+        const next = [...tbody.children].find(row => Number(row.id.slice(10)) < ev.event_id);
+        tbody.insertBefore(tr, next || null);
     }
+    tr.innerHTML = `
+        <td>${ev.event_id}</td>
+        <td>${ev.event_type}</td>
+        <td>${ev.start_time}</td>
+        <td>${ev.end_time}</td>
+        <td>${(ev.duration_sec || 0).toFixed(1)}</td>
+        <td>${ev.caption || ""}</td>
+    `;
 }
 
-function updateTimeline(events) {
+function updateTimelineBar(ev) {
     const container = document.getElementById("timelineContainer");
-    container.innerHTML = "";
-
-    // left→right in time
-    events.sort((a, b) => a.event_id - b.event_id);
-
-    for (let ev of events) {
-        const bar = document.createElement("div");
-        bar.className = `timeline-bar ${ev.event_type}`;
+    let bar = document.getElementById(`event-bar-${ev.event_id}`);
+    if (!bar) {
+        bar = document.createElement("div");
+        bar.id = `event-bar-${ev.event_id}`;
+        // left→right in time
+        const next = [...container.children].find(b => Number(b.id.slice(10)) > ev.event_id);
+        container.insertBefore(bar, next || null);
+    }
+    bar.className = `timeline-bar ${ev.event_type}`;
 
-        const dur = ev.duration_sec || 1;
-        bar.style.width = Math.min(dur * 25, 300) + "px";
+    const dur = ev.duration_sec || 1;
+    bar.style.width = Math.min(dur * 25, 300) + "px";
 
-        bar.title = `${ev.event_type} (${dur.toFixed(1)}s)`;
-        container.appendChild(bar);
-    }
+    bar.title = `${ev.event_type} (${dur.toFixed(1)}s)`;
 }
 
 // ========== 3. ANALYTICS CHART ==========
-function updateEventTypeChart(events) {
+function updateEventTypeChart() {
     const counts = { visitor: 0, delivery: 0, threat: 0 };
-    for (let ev of events) {
+    for (let ev of eventsById.values()) {
         if (counts[ev.event_type] !== undefined) {
             counts[ev.event_type] += 1;
         }
     }
+    const data = [counts.visitor, counts.delivery, counts.threat];
 
-    const ctx = document.getElementById("eventTypeChart").getContext("2d");
     if (eventTypeChart) {
-        eventTypeChart.destroy();
+        eventTypeChart.data.datasets[0].data = data;
+        eventTypeChart.update("none");
+        return;
     }
 
+    const ctx = document.getElementById("eventTypeChart").getContext("2d");
     eventTypeChart = new Chart(ctx, {
         type: "bar",
         data: {
             labels: ["Visitor", "Delivery", "Threat"],
             datasets: [{
                 label: "Event count",
-                data: [counts.visitor, counts.delivery, counts.threat]
+                data: data
             }]
         },
         options: {
@@ -134,7 +164,10 @@ function updateEventTypeChart(events) {
 // ========== 4. DANGER LIST ==========
 async function fetchDangerList() {
     const res = await fetch("/danger_list");
-    const data = await res.json();
+    renderDangerList(await res.json());
+}
+
+function renderDangerList(data) {
     const list = data.dangerous_persons || [];
 
     document.getElementById("dangerList").textContent =
@@ -145,14 +178,14 @@ async function removeDanger() {
     const name = document.getElementById("dangerName").value;
     if (!name) return;
 
-    await fetch("/danger_list", {
+    const res = await fetch("/danger_list", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ action: "remove", name })
     });
 
     document.getElementById("dangerName").value = "";
-    fetchDangerList();
+    renderDangerList(await res.json());
 }
 
 // acknowledge button
@@ -160,14 +193,25 @@ async function ackAlert() {
     await fetch("/ack_alert", { method: "POST" });
 }
 
-// ========== AUTO REFRESH ==========
-setInterval(() => {
+// ========== LIVE UPDATES ==========
+function loadAll() {
     fetchStatus();
     fetchEvents();
     fetchDangerList();
-}, 1500);
+}
+
+// the server pushes only what changed; full state is reloaded on every (re)connect
+function connectStream() {
+    if (!window.EventSource) {
+        setInterval(loadAll, 1500); // old browsers: poll like before
+        loadAll();
+        return;
+    }
+    const stream = new EventSource("/stream");
+    stream.addEventListener("open", loadAll);
+    stream.addEventListener("status", e => renderStatus(JSON.parse(e.data)));
+    stream.addEventListener("event", e => upsertEvent(JSON.parse(e.data)));
+    stream.addEventListener("danger_list", e => renderDangerList(JSON.parse(e.data)));
+}
 
-// initial load
-fetchStatus();
-fetchEvents();
-fetchDangerList();
+connectStream();
@@ -0,0 +1,30 @@
+from event_store import EventStore
+
+
+def event(eid, camera_id, sec):
+    return {"event_id": eid, "camera_id": camera_id, "event_type": "visitor", "severity": "normal",
+            "start_time": f"2026-01-01T10:00:{sec:02d}", "end_time": f"2026-01-01T10:00:{sec:02d}",
+            "status": "open", "person_info": []}
+
+
+def test_recent_and_paging_follow_event_id_with_two_cameras(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"), ring_size=4)
+    open_events = {}
+    # two cameras whose events are saved again and again as they grow, interleaved
+    for eid in range(1, 11):
+        camera_id = "front" if eid % 2 else "back"
+        open_events[camera_id] = event(eid, camera_id, eid)
+        for cam, ev in sorted(open_events.items(), key=lambda kv: kv[1]["event_id"], reverse=True):
+            store.save(ev)
+    assert list(store.ring) == [7, 8, 9, 10]
+    assert [ev["event_id"] for ev in store.recent(3)] == [8, 9, 10]
+
+    # the ?before= cursor of /events: every event exactly once, newest page first
+    seen = []
+    page = store.recent(3)
+    cursor = page[0]["event_id"]
+    seen.extend(ev["event_id"] for ev in page)
+    while cursor is not None:
+        page, cursor = store.query(before=cursor, limit=3)
+        seen.extend(ev["event_id"] for ev in page)
+    assert sorted(seen) == list(range(1, 11)) and len(seen) == 10
@@ -0,0 +1,27 @@
+import datetime
+import itertools
+from event_tracker import EventTracker
+
+OBJS = {"person_count": 1, "box": False, "weapon": False}
+
+
+def at(hms):
+    return datetime.datetime.fromisoformat(f"2026-01-01T{hms}")
+
+
+def test_out_of_order_frame_does_not_move_event_backwards():
+    tracker = EventTracker(itertools.count(1).__next__, min_duration_sec=1.0, cooldown_sec=3.0)
+    for hms in ("10:00:00", "10:00:02"):
+        res = tracker.update("front", at(hms), "visitor", "normal", OBJS, [], "", None)
+    ev = res["event"]
+
+    res = tracker.update("front", at("09:00:00"), "visitor", "normal", OBJS, [], "", None)
+    assert res["late"] and res["event"] is None and not res["closed"]
+    assert ev["start_time"] == at("10:00:00").isoformat()
+    assert ev["end_time"] == at("10:00:02").isoformat()
+    assert ev["duration_sec"] == 2.0 and ev["frame_count"] == 2
+    assert tracker.stats["late"] == 1
+
+    # the event goes on with the next in-order frame
+    res = tracker.update("front", at("10:00:03"), "visitor", "normal", OBJS, [], "", None)
+    assert res["event"] is ev and ev["duration_sec"] == 3.0
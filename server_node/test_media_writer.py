@@ -0,0 +1,14 @@
+from media_writer import MediaWriter
+
+
+def test_full_queue_drops_oldest_write_and_reports_it(tmp_path):
+    dropped = []
+    # not started: nothing leaves the queue
+    media = MediaWriter(str(tmp_path / "events"), str(tmp_path / "thumbs"), str(tmp_path / "danger.json"),
+                        max_pending=2, on_drop=dropped.append)
+    media.delete("event_0.jpg")
+    media.write_snapshot("event_1.jpg", b"one")
+    media.write_snapshot("event_2.jpg", b"two")
+    assert dropped == ["event_1.jpg"]
+    assert list(media.pending) == ["event_0.jpg", "event_2.jpg"] # the delete is kept
+    assert media.stats()["dropped"] == 1
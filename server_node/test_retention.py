@@ -0,0 +1,79 @@
+import io
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pytest
+from event_store import EventStore
+from media_writer import MediaWriter, Image
+from retention import RetentionManager
+
+DAY = 86400
+
+
+def save_event(store, events_dir, eid, event_type, age_days, data, now):
+    ts = datetime.fromtimestamp(now - age_days * DAY).isoformat()
+    store.save({"event_id": eid, "camera_id": "front", "event_type": event_type, "severity": "normal",
+                "start_time": ts, "end_time": ts, "status": "closed", "person_info": [],
+                "snapshot_path": f"/events/img/event_{eid}.jpg"})
+    with open(os.path.join(events_dir, f"event_{eid}.jpg"), "wb") as f:
+        f.write(data)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    events_dir, thumbs_dir = str(tmp_path / "events"), str(tmp_path / "thumbs")
+    media = MediaWriter(events_dir, thumbs_dir, str(tmp_path / "danger.json"))
+    media.start()
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store, media, events_dir
+    media.stop()
+    store.close()
+
+
+def test_quota_counts_usage_after_the_age_deletes(setup):
+    store, media, events_dir = setup
+    now = time.time()
+    for eid in (1, 2): # past the 7 days of a visitor
+        save_event(store, events_dir, eid, "visitor", 10, b"x" * 1000, now)
+    for eid in (3, 4, 5):
+        save_event(store, events_dir, eid, "visitor", 1, b"x" * 1000, now)
+    do = media._do
+    media._do = lambda fn, data: (time.sleep(0.05), do(fn, data)) # a slow disk
+    retention = RetentionManager(store, media, events_dir, {"visitor": 7}, {}, max_bytes=2500)
+    retention.sweep(now)
+    media.flush()
+    # 3000 bytes left after the age step: one snapshot over the quota, not three
+    assert sorted(os.listdir(events_dir)) == ["event_4.jpg", "event_5.jpg"]
+    assert retention.stats()["media_deleted"] == 3
+
+
+def test_types_missing_from_the_policy_get_the_default_age(setup):
+    store, media, events_dir = setup
+    now = time.time()
+    save_event(store, events_dir, 1, "loitering", 40, b"x" * 100, now) # a type added in rules.json
+    save_event(store, events_dir, 2, "loitering", 10, b"x" * 100, now)
+    retention = RetentionManager(store, media, events_dir, {"visitor": 7}, {}, max_bytes=0, default_days=30)
+    retention.sweep(now)
+    media.flush()
+    assert store.count() == 1 and os.listdir(events_dir) == ["event_2.jpg"]
+
+
+@pytest.mark.skipif(Image is None, reason="re-encoding needs Pillow")
+def test_reencode_goes_through_the_media_writer(setup):
+    store, media, events_dir = setup
+    now = time.time()
+    frame = np.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(frame).save(out, "JPEG", quality=95)
+    save_event(store, events_dir, 1, "threat", 5, out.getvalue(), now)
+    writes = []
+    replace = media.replace
+    media.replace = lambda fn, data: (writes.append(fn), replace(fn, data))
+    retention = RetentionManager(store, media, events_dir, {"threat": 90}, {}, max_bytes=0,
+                                 reencode_after_days=3)
+    retention.sweep(now)
+    media.flush()
+    assert writes == ["event_1.jpg"]
+    assert os.path.getsize(os.path.join(events_dir, "event_1.jpg")) < len(out.getvalue())
+    assert retention.stats()["reencoded"] == 1
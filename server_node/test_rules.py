@@ -0,0 +1,58 @@
+import json
+import os
+import pytest
+import config
+from rules import CompiledRules, RuleEngine, default_rules
+
+
+def defaults():
+    return default_rules(config.PERSON_THRESH, config.BOX_THRESH, config.WEAPON_THRESH, config.WEAPON_CLASSES)
+
+
+def write_rules(path, spec, mtime):
+    with open(path, "w") as f:
+        json.dump(spec, f)
+    os.utime(path, (mtime, mtime)) # a distinct mtime per write, the engine reloads on change
+
+
+def test_missing_required_flag_is_rejected():
+    spec = defaults()
+    spec["flags"]["armed"] = spec["flags"].pop("weapon")
+    with pytest.raises(ValueError, match="weapon"):
+        CompiledRules(spec)
+
+
+def test_bad_rules_file_keeps_previous_rules(tmp_path):
+    path = str(tmp_path / "rules.json")
+    write_rules(path, defaults(), 1000)
+    engine = RuleEngine(path, defaults(), check_sec=0)
+    assert engine.source == path and engine.error is None
+
+    bad = defaults()
+    del bad["flags"]["person"]
+    bad["event_types"] = [r for r in bad["event_types"] if "person" not in r["when"]]
+    bad["severity"] = []
+    bad["snapshot_flags"] = ["weapon"]
+    write_rules(path, bad, 2000)
+    rules = engine.current()
+    assert "person" in engine.info()["error"]
+    assert engine.reloads == 1
+
+    flags, event_type, _, _ = rules.evaluate([{"class_name": "person", "confidence": 0.9},
+                                              {"class_name": "knife", "confidence": 0.9}], [], set())
+    assert flags["has_person"] and flags["has_weapon"] and event_type == "threat"
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda spec: [],
+    lambda spec: spec["flags"]["weapon"].update(class_conf=[0.5]) or spec,
+], ids=["top-level list", "class_conf list"])
+def test_wrong_shape_is_reported_not_raised(tmp_path, mangle):
+    path = str(tmp_path / "rules.json")
+    write_rules(path, defaults(), 1000)
+    engine = RuleEngine(path, defaults(), check_sec=0)
+    good = engine.current()
+
+    write_rules(path, mangle(defaults()), 2000)
+    assert engine.current() is good
+    assert "must be a" in engine.info()["error"]
@@ -0,0 +1,92 @@
+import json
+from conftest import post_frame, det
+
+
+def test_replayed_frames_only_go_to_history(server, client, monkeypatch):
+    published = []
+    monkeypatch.setattr(server.notifier, "publish", lambda kind, data: published.append(data.get("event_id")))
+    for sec in range(3):
+        post_frame(client, "replay", f"2026-01-01T12:00:0{sec}", [det("person"), det("knife")])
+    live = server.event_tracker.open["replay"]["event"]
+    assert live["event_type"] == "threat"
+    published.clear()
+
+    # an hour old visitor from the client's spool, while the threat is going on
+    for sec in range(2):
+        r = post_frame(client, "replay", f"2026-01-01T11:00:0{sec}", [det("person")], replayed=True)
+        assert r.status_code == 200 and r.json["threat_flag"]
+    assert not published
+    assert server.event_tracker.open["replay"]["event"] is live
+    assert live["end_time"] == "2026-01-01T12:00:02" and live["duration_sec"] == 2.0
+    cam = server.cameras.get("replay")
+    assert cam.status["threat_flag"] and cam.status["last_event_id"] == live["event_id"]
+
+    replayed = server.replay_tracker.open["replay"]["event"]
+    assert replayed["event_type"] == "visitor" and replayed["start_time"] == "2026-01-01T11:00:00"
+    stored, _ = server.event_store.query(camera_id="replay")
+    assert replayed["event_id"] in [ev["event_id"] for ev in stored]
+
+    # the replayed event is closed by the next live frame once no replayed frame came for a while
+    monkeypatch.setitem(server.replay_seen, "replay", 0.0)
+    post_frame(client, "replay", "2026-01-01T12:00:03", [det("person"), det("knife")])
+    assert "replay" not in server.replay_tracker.open
+    assert replayed["status"] == "closed" and replayed["event_id"] not in published
+
+
+def test_frame_metadata_must_be_an_object(client):
+    r = client.post("/frame_result", data={"meta": "5"}, content_type="multipart/form-data")
+    assert r.status_code == 400 and "JSON object" in r.json["error"]
+    r = client.post("/frame_result", json=[1, 2])
+    assert r.status_code == 400
+    body = b"[1]"
+    r = client.post("/frame_result", data=len(body).to_bytes(4, "big") + body, content_type="application/x-frame")
+    assert r.status_code == 400
+
+
+def test_frame_without_image_as_plain_form(client):
+    # the uploader's requests.post(data={"meta": ...}, files=None) is not multipart
+    meta = {"camera_id": "form", "timestamp": "2026-01-01T12:00:00", "detections": []}
+    r = client.post("/frame_result", data={"meta": json.dumps(meta)},
+                    content_type="application/x-www-form-urlencoded")
+    assert r.status_code == 200
+
+
+def test_client_status(client):
+    assert client.post("/client_status", json=[1]).status_code == 400
+    assert client.post("/client_status", json={"state": "bogus"}).status_code == 400
+    assert client.post("/client_status", json={"state": "ready", "sent_at": "abc"}).status_code == 400
+    n = len(client.get("/cameras").json)
+    assert client.post("/client_status", json={"state": "ready", "camera_ids": "porch"}).status_code == 400
+    assert len(client.get("/cameras").json) == n # no camera per character
+    body = {"state": "ready", "camera_ids": ["porch"], "sent_at": 10.0, "startup": {"total": 1.5}}
+    assert client.post("/client_status", json=body).status_code == 200
+    # an older announcement arriving late does not win
+    client.post("/client_status", json={"state": "starting", "camera_ids": ["porch"], "sent_at": 5.0})
+    porch = next(c for c in client.get("/cameras").json if c["camera_id"] == "porch")
+    assert porch["client"]["state"] == "ready" and porch["client"]["startup"] == {"total": 1.5}
+
+
+def test_dropped_snapshot_is_cleared_from_its_event(server, client):
+    post_frame(client, "drop", "2026-01-01T12:00:00", [det("person")])
+    cur = server.event_tracker.open["drop"]
+    cur["event"]["snapshot_path"], cur["best_score"] = "/events/img/x.jpg", (0, False, 0.9)
+    server.event_store.save(cur["event"])
+
+    server.snapshot_dropped(f"event_{cur['event']['event_id']}.jpg")
+    assert cur["event"]["snapshot_path"] is None and cur["best_score"] is None
+    stored, _ = server.event_store.query(camera_id="drop")
+    assert stored[-1]["snapshot_path"] is None
+
+
+def test_danger_match_is_kept_until_the_event_is_confirmed(server, client):
+    face = [0.1] * server.danger_gallery.dim
+    server.danger_gallery.add("danger_known", [face])
+    server.dangerous_persons.add("danger_known")
+    before = set(server.dangerous_persons)
+    # matched on the first frame, confirmed by a frame without a usable face
+    post_frame(client, "intruder", "2026-01-01T13:00:00", [det("person"), det("knife")],
+               person_info=[{"type": "unknown", "embedding": face}])
+    post_frame(client, "intruder", "2026-01-01T13:00:02", [det("person"), det("knife")])
+    assert server.event_tracker.open["intruder"]["event"]["confirmed"]
+    assert server.cameras.get("intruder").status["threat_name"] == "danger_known"
+    assert server.dangerous_persons == before # no second identity for the same intruder